@@ -285,6 +285,14 @@ FILE_UPLOAD_HANDLERS = (
 # file system instead of into memory.
 FILE_UPLOAD_MAX_MEMORY_SIZE = 2621440 # i.e. 2.5 MB
 
+# Size, in bytes, of the blocks in which uploaded data is read from the
+# request before being handed to the upload handlers in smaller chunks.
+FILE_UPLOAD_READ_SIZE = 262144 # i.e. 256 KB
+
+# Maximum number of GET/POST parameters that will be read before a
+# SuspiciousOperation (TooManyFieldsSent) is raised. None to disable the check.
+DATA_UPLOAD_MAX_NUMBER_FIELDS = 1000
+
 # Directory in which upload streamed files will be temporarily saved. A value of
 # `None` will make Django use the operating system's default temporary directory
 # (i.e. "/tmp" on *nix systems).
@@ -416,6 +424,40 @@ MIDDLEWARE_CLASSES = (
 #     'django.middleware.gzip.GZipMiddleware',
 )
 
+# The header FileResponse uses to let the web server send files, e.g.
+# 'X-Sendfile' (Apache's mod_xsendfile, lighttpd) or 'X-Accel-Redirect'
+# (nginx). None to send the files from Django.
+SENDFILE_HEADER = None
+
+# If set, only the files below this directory are sent by the web server.
+SENDFILE_ROOT = ''
+
+# The URL the web server serves SENDFILE_ROOT at, for headers taking an URL
+# rather than a path, such as X-Accel-Redirect. Must end with a slash.
+SENDFILE_URL = None
+
+# The compression level (1-9) of GZipMiddleware: higher levels make smaller
+# responses, at the cost of more CPU time.
+GZIP_COMPRESSION_LEVEL = 6
+
+# Whether to log how long each call of each middleware method takes to the
+# 'django.request.middleware' logger, at the DEBUG level.
+MIDDLEWARE_TIMING = False
+
+# Classes that get the timings of requests (time spent in middleware, views,
+# templates, the database, the cache...). No timings are taken if empty.
+REQUEST_TIMING_COLLECTORS = ()
+
+# The fraction of the requests that are timed.
+REQUEST_TIMING_SAMPLE_RATE = 1.0
+
+# Whether database connections keep statistics on the queries of each request
+# in connection.query_stats, how many of the slowest queries they keep, and
+# how many of the most recent ones are checked for duplicates.
+QUERY_STATS = False
+QUERY_STATS_SLOWEST = 10
+QUERY_STATS_HISTORY = 100
+
 ############
 # SESSIONS #
 ############
@@ -443,6 +485,13 @@ CACHES = {
 CACHE_MIDDLEWARE_KEY_PREFIX = ''
 CACHE_MIDDLEWARE_SECONDS = 600
 CACHE_MIDDLEWARE_ALIAS = 'default'
+# Number of seconds an expired page may still be served by the cache
+# middleware while a single request regenerates it. 0 disables stale serving.
+CACHE_MIDDLEWARE_GRACE_SECONDS = 0
+
+# Number of seconds an expired {% cache %} fragment may still be served while
+# a single request regenerates it. 0 disables stale serving.
+CACHE_FRAGMENT_GRACE_SECONDS = 0
 
 ####################
 # COMMENTS         #
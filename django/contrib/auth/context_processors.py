@@ -1,5 +1,6 @@
 from django.utils.functional import lazy, memoize, SimpleLazyObject
 from django.contrib import messages
+from django.template.context import LazyValue
 
 # PermWrapper and PermLookupDict proxy the permissions system into objects that
 # the template system can understand.
@@ -55,6 +56,6 @@ def auth(request):
 
     return {
         'user': SimpleLazyObject(get_user),
-        'messages': messages.get_messages(request),
-        'perms':  lazy(lambda: PermWrapper(get_user()), PermWrapper)(),
+        'messages': LazyValue(lambda: messages.get_messages(request)),
+        'perms': LazyValue(lambda: PermWrapper(get_user())),
     }
@@ -15,7 +15,7 @@ cache class.
 See docs/topics/cache.txt for information on the public API.
 """
 from django.conf import settings
-from django.core import signals
+from django.core import signals, timing
 from django.core.cache.backends.base import (
     InvalidCacheBackendError, CacheKeyWarning, BaseCache)
 from django.core.exceptions import ImproperlyConfigured
@@ -177,7 +177,10 @@ def get_cache(backend, **kwargs):
     except (AttributeError, ImportError), e:
         raise InvalidCacheBackendError(
             "Could not find backend '%s': %s" % (backend, e))
-    return backend_cls(location, params)
+    cache = backend_cls(location, params)
+    if settings.REQUEST_TIMING_COLLECTORS:
+        timing.time_cache(cache)
+    return cache
 
 cache = get_cache(DEFAULT_CACHE_ALIAS)
 
@@ -1,6 +1,12 @@
 "Base Cache class."
 
+import random
 import warnings
+import zlib
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
 
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured, DjangoRuntimeWarning
@@ -41,6 +47,28 @@ def get_key_func(key_func):
             return getattr(key_func_module, key_func_name)
     return default_key_func
 
+class CompressedValue(object):
+    """
+    A cached value compressed by BaseCache.encode_value(). Backends store it
+    like any other value; its class tells it apart from uncompressed values.
+    """
+    def __init__(self, data):
+        self.data = data
+
+class TaggedValue(object):
+    """
+    A cached value stored with tags by BaseCache.encode_value(), along with
+    the version each tag had then. The value is stale once one of these tags
+    has been invalidated, i.e. has a different version.
+    """
+    def __init__(self, value, tag_versions):
+        self.value = value
+        self.tag_versions = tag_versions
+
+# Tag versions should outlive the values they tag; if one of them is evicted
+# anyway, the values tagged with it are merely treated as stale.
+TAG_TIMEOUT = 60 * 60 * 24 * 30
+
 class BaseCache(object):
     def __init__(self, params):
         timeout = params.get('timeout', params.get('TIMEOUT', 300))
@@ -63,10 +91,35 @@ class BaseCache(object):
         except (ValueError, TypeError):
             self._cull_frequency = 3
 
+        cull_probability = params.get('cull_probability', options.get('CULL_PROBABILITY', 0.1))
+        try:
+            self._cull_probability = float(cull_probability)
+        except (ValueError, TypeError):
+            self._cull_probability = 0.1
+
+        compress_min_length = params.get('compress_min_length', options.get('COMPRESS_MIN_LENGTH', None))
+        try:
+            self._compress_min_length = int(compress_min_length)
+        except (ValueError, TypeError):
+            self._compress_min_length = None
+        compress_level = params.get('compress_level', options.get('COMPRESS_LEVEL', 6))
+        try:
+            self._compress_level = int(compress_level)
+        except (ValueError, TypeError):
+            self._compress_level = 6
+
         self.key_prefix = smart_str(params.get('KEY_PREFIX', ''))
         self.version = params.get('VERSION', 1)
         self.key_func = get_key_func(params.get('KEY_FUNCTION', None))
 
+    def _cull_due(self):
+        """
+        Returns True if a backend that culls should check its size during the
+        current write. Counting the entries can be expensive, so it's only
+        done for a random CULL_PROBABILITY fraction of the writes.
+        """
+        return random.random() < self._cull_probability
+
     def make_key(self, key, version=None):
         """Constructs the key used by all other methods. By default it
         uses the key_func to generate a key (which, by default,
@@ -81,11 +134,123 @@ class BaseCache(object):
         new_key = self.key_func(key, self.key_prefix, version)
         return new_key
 
-    def add(self, key, value, timeout=None, version=None):
+    def _tag_key(self, tag):
+        return 'cache.tag.%s' % tag
+
+    def _get_tag_versions(self, tags, create=False):
+        """
+        Returns a dict mapping each tag to its current version, fetched with
+        a single get_many(). Missing versions are left out, or created if
+        create is True.
+        """
+        tag_keys = dict([(self._tag_key(tag), tag) for tag in tags])
+        versions = self.get_many(tag_keys.keys())
+        if create:
+            for tag_key in tag_keys:
+                if tag_key not in versions:
+                    version = random.getrandbits(63)
+                    if not self.add(tag_key, version, TAG_TIMEOUT):
+                        # Another process has just created it.
+                        version = self.get(tag_key)
+                    versions[tag_key] = version
+        return dict([(tag_keys[tag_key], version) for tag_key, version in versions.items()])
+
+    def invalidate_tags(self, *tags):
+        """
+        Makes every value stored with one of the given tags stale. This
+        writes a new version for each tag, whatever the number of values.
+        """
+        self.set_many(dict([(self._tag_key(tag), random.getrandbits(63)) for tag in tags]), TAG_TIMEOUT)
+
+    def encode_value(self, value, tags=None):
+        """
+        Returns what the backend should store for value: the value itself, or
+        a TaggedValue if tags are given, compressed into a CompressedValue if
+        the COMPRESS_MIN_LENGTH option is set and the pickled value is at
+        least that long.
+        """
+        return self._encode(value, tags and self._get_tag_versions(tags, create=True))
+
+    def encode_many(self, values, tags=None):
+        """
+        Like encode_value(), for a dict of values. The versions of the tags
+        are fetched once for all the values.
+        """
+        tag_versions = tags and self._get_tag_versions(tags, create=True)
+        return dict([(key, self._encode(value, tag_versions)) for key, value in values.items()])
+
+    def _encode(self, value, tag_versions):
+        if tag_versions:
+            value = TaggedValue(value, tag_versions)
+        if self._compress_min_length is None:
+            return value
+        if isinstance(value, basestring) and len(value) < self._compress_min_length:
+            # Short strings don't get longer by much when pickled.
+            return value
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(data) < self._compress_min_length:
+            return value
+        return CompressedValue(zlib.compress(data, self._compress_level))
+
+    def decode_value(self, value, default=None):
+        """
+        Returns the value stored as value by encode_value(), or default if
+        its tags have been invalidated since. Compressed and uncompressed
+        values are both understood, whatever the options.
+        """
+        return self.decode_many({None: value}).get(None, default)
+
+    def decode_many(self, values):
+        """
+        Like decode_value(), for a dict of values stored by encode_value().
+        Stale values are left out of the returned dict. The versions of the
+        tags of all the values are fetched at once.
+        """
+        decoded = {}
+        tagged = {}
+        for key, value in values.items():
+            if isinstance(value, CompressedValue):
+                value = pickle.loads(zlib.decompress(value.data))
+            if isinstance(value, TaggedValue):
+                tagged[key] = value
+            else:
+                decoded[key] = value
+        if tagged:
+            tags = {}
+            for value in tagged.values():
+                tags.update(value.tag_versions)
+            versions = self._get_tag_versions(tags.keys())
+            for key, value in tagged.items():
+                for tag, version in value.tag_versions.items():
+                    if versions.get(tag) != version:
+                        break
+                else:
+                    decoded[key] = value.value
+        return decoded
+
+    def _incr_encoded(self, stored, delta, key):
+        """
+        Adds delta to the value stored as stored by encode_value(). Returns
+        the new value and what to store for it, with the same tags. Raises
+        ValueError, like for a missing key, if the tags have been invalidated.
+        """
+        if isinstance(stored, CompressedValue):
+            stored = pickle.loads(zlib.decompress(stored.data))
+        decoded = self.decode_many({key: stored})
+        if key not in decoded:
+            raise ValueError("Key '%s' not found" % key)
+        new_value = decoded[key] + delta
+        tag_versions = None
+        if isinstance(stored, TaggedValue):
+            tag_versions = stored.tag_versions
+        return new_value, self._encode(new_value, tag_versions)
+
+    def add(self, key, value, timeout=None, version=None, tags=None):
         """
         Set a value in the cache if the key does not already exist. If
         timeout is given, that timeout will be used for the key; otherwise
-        the default cache timeout will be used.
+        the default cache timeout will be used. If tags are given,
+        invalidating any of them makes the value stale.
 
         Returns True if the value was stored, False otherwise.
         """
@@ -98,10 +263,11 @@ class BaseCache(object):
         """
         raise NotImplementedError
 
-    def set(self, key, value, timeout=None, version=None):
+    def set(self, key, value, timeout=None, version=None, tags=None):
         """
         Set a value in the cache. If timeout is given, that timeout will be
         used for the key; otherwise the default cache timeout will be used.
+        If tags are given, invalidating any of them makes the value stale.
         """
         raise NotImplementedError
 
@@ -160,7 +326,7 @@ class BaseCache(object):
         # if a subclass overrides it.
         return self.has_key(key)
 
-    def set_many(self, data, timeout=None, version=None):
+    def set_many(self, data, timeout=None, version=None, tags=None):
         """
         Set a bunch of values in the cache at once from a dict of key/value
         pairs.  For certain backends (memcached), this is much more efficient
@@ -170,7 +336,7 @@ class BaseCache(object):
         the default cache timeout will be used.
         """
         for key, value in data.items():
-            self.set(key, value, timeout=timeout, version=version)
+            self.set(key, value, timeout=timeout, version=version, tags=tags)
 
     def delete_many(self, keys, version=None):
         """
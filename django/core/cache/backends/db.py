@@ -25,6 +25,10 @@ class Options(object):
         self.managed = True
         self.proxy = False
 
+# The number of keys looked up, written or deleted with a single query by the
+# *_many() methods, to stay within the databases' limits on query parameters.
+CHUNK_SIZE = 100
+
 class BaseDatabaseCache(BaseCache):
     def __init__(self, table, params):
         BaseCache.__init__(self, params)
@@ -54,17 +58,120 @@ class DatabaseCache(BaseDatabaseCache):
             transaction.commit_unless_managed(using=db)
             return default
         value = connections[db].ops.process_clob(row[1])
-        return pickle.loads(base64.decodestring(value))
+        return self.decode_value(pickle.loads(base64.decodestring(value)), default)
+
+    def get_many(self, keys, version=None):
+        made = {}
+        for k in keys:
+            key = self.make_key(k, version=version)
+            self.validate_key(key)
+            made[key] = k
+        if not made:
+            return {}
+        db = router.db_for_read(self.cache_model_class)
+        table = connections[db].ops.quote_name(self._table)
+        cursor = connections[db].cursor()
+
+        d = {}
+        expired = []
+        now = datetime.now()
+        made_keys = made.keys()
+        for i in xrange(0, len(made_keys), CHUNK_SIZE):
+            chunk = made_keys[i:i + CHUNK_SIZE]
+            cursor.execute("SELECT cache_key, value, expires FROM %s WHERE cache_key IN (%s)" % (
+                           table, ', '.join(['%s'] * len(chunk))), chunk)
+            for key, value, expires in cursor.fetchall():
+                if expires < now:
+                    expired.append(key)
+                else:
+                    value = connections[db].ops.process_clob(value)
+                    d[made[key]] = pickle.loads(base64.decodestring(value))
+        if expired:
+            self._delete_keys(expired)
+        return self.decode_many(d)
+
+    def set(self, key, value, timeout=None, version=None, tags=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._base_set('set', key, self.encode_value(value, tags), timeout)
+
+    def set_many(self, data, timeout=None, version=None, tags=None):
+        made = {}
+        for k, value in data.items():
+            key = self.make_key(k, version=version)
+            self.validate_key(key)
+            made[key] = value
+        if not made:
+            return
+        if timeout is None:
+            timeout = self.default_timeout
+        db = router.db_for_write(self.cache_model_class)
+        table = connections[db].ops.quote_name(self._table)
+        cursor = connections[db].cursor()
+
+        now = datetime.now().replace(microsecond=0)
+        exp = datetime.fromtimestamp(time.time() + timeout).replace(microsecond=0)
+        exp = connections[db].ops.value_to_db_datetime(exp)
+        self._maybe_cull(db, cursor, now)
+        made = self.encode_many(made, tags)
+        made_keys = made.keys()
+        try:
+            for i in xrange(0, len(made_keys), CHUNK_SIZE):
+                chunk = made_keys[i:i + CHUNK_SIZE]
+                cursor.execute("SELECT cache_key FROM %s WHERE cache_key IN (%s)" % (
+                               table, ', '.join(['%s'] * len(chunk))), chunk)
+                existing = set([row[0] for row in cursor.fetchall()])
+                updates, inserts = [], []
+                for key in chunk:
+                    encoded = base64.encodestring(pickle.dumps(made[key], 2)).strip()
+                    if key in existing:
+                        updates.append([encoded, exp, key])
+                    else:
+                        inserts.append([key, encoded, exp])
+                if updates:
+                    cursor.executemany("UPDATE %s SET value = %%s, expires = %%s WHERE cache_key = %%s" % table, updates)
+                if inserts:
+                    cursor.executemany("INSERT INTO %s (cache_key, value, expires) VALUES (%%s, %%s, %%s)" % table, inserts)
+        except DatabaseError:
+            # Another process may have inserted some of the keys in the
+            # meantime; fall back to setting them one by one.
+            transaction.rollback_unless_managed(using=db)
+            for key, value in made.items():
+                self._base_set('set', key, value, timeout)
+        else:
+            transaction.commit_unless_managed(using=db)
 
-    def set(self, key, value, timeout=None, version=None):
+    def add(self, key, value, timeout=None, version=None, tags=None):
         key = self.make_key(key, version=version)
         self.validate_key(key)
-        self._base_set('set', key, value, timeout)
+        return self._base_set('add', key, self.encode_value(value, tags), timeout)
 
-    def add(self, key, value, timeout=None, version=None):
+    def incr(self, key, delta=1, version=None):
         key = self.make_key(key, version=version)
         self.validate_key(key)
-        return self._base_set('add', key, value, timeout)
+        db = router.db_for_write(self.cache_model_class)
+        table = connections[db].ops.quote_name(self._table)
+        cursor = connections[db].cursor()
+
+        try:
+            # This no-op update locks the row until the transaction ends, so
+            # concurrent increments of the key are serialized.
+            cursor.execute("UPDATE %s SET expires = expires WHERE cache_key = %%s" % table, [key])
+            row = None
+            if cursor.rowcount:
+                cursor.execute("SELECT value, expires FROM %s WHERE cache_key = %%s" % table, [key])
+                row = cursor.fetchone()
+            if row is None or row[1] < datetime.now():
+                raise ValueError("Key '%s' not found" % key)
+            value = connections[db].ops.process_clob(row[0])
+            new_value, stored = self._incr_encoded(pickle.loads(base64.decodestring(value)), delta, key)
+            encoded = base64.encodestring(pickle.dumps(stored, 2)).strip()
+            cursor.execute("UPDATE %s SET value = %%s WHERE cache_key = %%s" % table, [encoded, key])
+        except (DatabaseError, ValueError):
+            transaction.rollback_unless_managed(using=db)
+            raise
+        transaction.commit_unless_managed(using=db)
+        return new_value
 
     def _base_set(self, mode, key, value, timeout=None):
         if timeout is None:
@@ -73,12 +180,9 @@ class DatabaseCache(BaseDatabaseCache):
         table = connections[db].ops.quote_name(self._table)
         cursor = connections[db].cursor()
 
-        cursor.execute("SELECT COUNT(*) FROM %s" % table)
-        num = cursor.fetchone()[0]
         now = datetime.now().replace(microsecond=0)
         exp = datetime.fromtimestamp(time.time() + timeout).replace(microsecond=0)
-        if num > self._max_entries:
-            self._cull(db, cursor, now)
+        self._maybe_cull(db, cursor, now)
         encoded = base64.encodestring(pickle.dumps(value, 2)).strip()
         cursor.execute("SELECT cache_key, expires FROM %s WHERE cache_key = %%s" % table, [key])
         try:
@@ -109,6 +213,26 @@ class DatabaseCache(BaseDatabaseCache):
         cursor.execute("DELETE FROM %s WHERE cache_key = %%s" % table, [key])
         transaction.commit_unless_managed(using=db)
 
+    def delete_many(self, keys, version=None):
+        made = []
+        for k in keys:
+            key = self.make_key(k, version=version)
+            self.validate_key(key)
+            made.append(key)
+        if made:
+            self._delete_keys(made)
+
+    def _delete_keys(self, keys):
+        db = router.db_for_write(self.cache_model_class)
+        table = connections[db].ops.quote_name(self._table)
+        cursor = connections[db].cursor()
+
+        for i in xrange(0, len(keys), CHUNK_SIZE):
+            chunk = keys[i:i + CHUNK_SIZE]
+            cursor.execute("DELETE FROM %s WHERE cache_key IN (%s)" % (
+                           table, ', '.join(['%s'] * len(chunk))), chunk)
+        transaction.commit_unless_managed(using=db)
+
     def has_key(self, key, version=None):
         key = self.make_key(key, version=version)
         self.validate_key(key)
@@ -122,6 +246,19 @@ class DatabaseCache(BaseDatabaseCache):
                        [key, connections[db].ops.value_to_db_datetime(now)])
         return cursor.fetchone() is not None
 
+    def _maybe_cull(self, db, cursor, now):
+        """
+        Culls the table if it holds more than MAX_ENTRIES entries. The table
+        is only counted during a CULL_PROBABILITY fraction of the writes.
+        """
+        if not self._cull_due():
+            return
+        table = connections[db].ops.quote_name(self._table)
+        cursor.execute("SELECT COUNT(*) FROM %s" % table)
+        num = cursor.fetchone()[0]
+        if num > self._max_entries:
+            self._cull(db, cursor, now)
+
     def _cull(self, db, cursor, now):
         if self._cull_frequency == 0:
             self.clear()
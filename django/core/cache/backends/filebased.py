@@ -1,6 +1,7 @@
 "File-based cache backend"
 
 import os
+import random
 import time
 import shutil
 try:
@@ -11,6 +12,24 @@ except ImportError:
 from django.core.cache.backends.base import BaseCache
 from django.utils.hashcompat import md5_constructor
 
+# Suffix of the temporary files values are written to before being renamed
+# into place. They aren't cache entries.
+TEMP_SUFFIX = '.tmp'
+
+# Temporary files older than this many seconds were left by writers that
+# crashed, and are removed when the cache is culled.
+TEMP_MAX_AGE = 600
+
+# How often, in seconds, each process counts the files of a cache directory
+# again, to see the entries other processes wrote in the meantime.
+RECOUNT_INTERVAL = 60
+
+# The number of entries in each cache directory, as seen by this process, and
+# when the files were last counted. Keyed by directory, so that every
+# FileBasedCache for a directory shares its count. Between counts, it's only
+# updated for this process's own writes.
+_entry_counts = {}
+
 class FileBasedCache(BaseCache):
     def __init__(self, dir, params):
         BaseCache.__init__(self, params)
@@ -18,11 +37,11 @@ class FileBasedCache(BaseCache):
         if not os.path.exists(self._dir):
             self._createdir()
 
-    def add(self, key, value, timeout=None, version=None):
+    def add(self, key, value, timeout=None, version=None, tags=None):
         if self.has_key(key, version=version):
             return False
 
-        self.set(key, value, timeout, version=version)
+        self.set(key, value, timeout, version=version, tags=tags)
         return True
 
     def get(self, key, default=None, version=None):
@@ -38,38 +57,82 @@ class FileBasedCache(BaseCache):
                 if exp < now:
                     self._delete(fname)
                 else:
-                    return pickle.load(f)
+                    return self.decode_value(pickle.load(f), default)
             finally:
                 f.close()
         except (IOError, OSError, EOFError, pickle.PickleError):
             pass
         return default
 
-    def set(self, key, value, timeout=None, version=None):
+    def set(self, key, value, timeout=None, version=None, tags=None):
         key = self.make_key(key, version=version)
         self.validate_key(key)
 
-        fname = self._key_to_file(key)
-        dirname = os.path.dirname(fname)
+        if timeout is None:
+            timeout = self.default_timeout
 
+        self._cull()
+        self._write(key, self.encode_value(value, tags), timeout)
+
+    def set_many(self, data, timeout=None, version=None, tags=None):
         if timeout is None:
             timeout = self.default_timeout
 
+        made = {}
+        for key, value in data.items():
+            key = self.make_key(key, version=version)
+            self.validate_key(key)
+            made[key] = value
+        # Check the size of the cache once, rather than once per key.
         self._cull()
+        for key, value in self.encode_many(made, tags).items():
+            self._write(key, value, timeout)
 
+    def _write(self, key, value, timeout):
+        """
+        Writes the value to a temporary file, then renames it over the entry's
+        file, so readers never see a partially written entry.
+        """
+        fname = self._key_to_file(key)
+        dirname = os.path.dirname(fname)
         try:
             if not os.path.exists(dirname):
                 os.makedirs(dirname)
 
-            f = open(fname, 'wb')
+            tmp = '%s.%s%s' % (fname, md5_constructor('%s.%s.%s' % (
+                os.getpid(), time.time(), random.random())).hexdigest()[:8], TEMP_SUFFIX)
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0666)
             try:
-                now = time.time()
-                pickle.dump(now + timeout, f, pickle.HIGHEST_PROTOCOL)
-                pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
-            finally:
-                f.close()
+                f = os.fdopen(fd, 'wb')
+                try:
+                    now = time.time()
+                    pickle.dump(now + timeout, f, pickle.HIGHEST_PROTOCOL)
+                    pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+                finally:
+                    f.close()
+                is_new = not os.path.exists(fname)
+                self._rename(tmp, fname)
+            except:
+                try:
+                    os.remove(tmp)
+                except (IOError, OSError):
+                    pass
+                raise
         except (IOError, OSError):
             pass
+        else:
+            if is_new:
+                self._add_entries(1)
+
+    def _rename(self, tmp, fname):
+        try:
+            os.rename(tmp, fname)
+        except OSError:
+            # Windows doesn't let a rename replace an existing file.
+            if os.name != 'nt' or not os.path.exists(fname):
+                raise
+            os.remove(fname)
+            os.rename(tmp, fname)
 
     def delete(self, key, version=None):
         key = self.make_key(key, version=version)
@@ -81,6 +144,7 @@ class FileBasedCache(BaseCache):
 
     def _delete(self, fname):
         os.remove(fname)
+        self._add_entries(-1)
         try:
             # Remove the 2 subdirs if they're empty
             dirname = os.path.dirname(fname)
@@ -109,24 +173,45 @@ class FileBasedCache(BaseCache):
             return False
 
     def _cull(self):
-        if int(self._num_entries) < self._max_entries:
-            return
+        """
+        Removes the least recently used entries once the cache is full.
 
-        try:
-            filelist = sorted(os.listdir(self._dir))
-        except (IOError, OSError):
+        The entries are only listed when the cache is actually culled, and
+        1/CULL_FREQUENCY of them are removed at once, so the cost of listing
+        them is spread over the writes that filled the cache again. Stale
+        temporary files are removed at the same time.
+        """
+        if self._num_entries < self._max_entries:
             return
 
         if self._cull_frequency == 0:
-            doomed = filelist
-        else:
-            doomed = [os.path.join(self._dir, k) for (i, k) in enumerate(filelist) if i % self._cull_frequency == 0]
+            self.clear()
+            return
 
-        for topdir in doomed:
+        entries = []
+        paths, temp_paths = self._list_files()
+        for path in paths:
             try:
-                for root, _, files in os.walk(topdir):
-                    for f in files:
-                        self._delete(os.path.join(root, f))
+                st = os.stat(path)
+            except (IOError, OSError):
+                continue
+            # Filesystems mounted with noatime don't update the access time;
+            # a file is at least as recently used as it was written.
+            entries.append((max(st.st_atime, st.st_mtime), path))
+        self._set_num_entries(len(entries))
+        stale = time.time() - TEMP_MAX_AGE
+        for path in temp_paths:
+            try:
+                if os.stat(path).st_mtime < stale:
+                    os.remove(path)
+            except (IOError, OSError):
+                pass
+        if len(entries) < self._max_entries:
+            return
+        entries.sort()
+        for atime, path in entries[:max(len(entries) // self._cull_frequency, 1)]:
+            try:
+                self._delete(path)
             except (IOError, OSError):
                 pass
 
@@ -149,11 +234,42 @@ class FileBasedCache(BaseCache):
         path = os.path.join(path[:2], path[2:4], path[4:])
         return os.path.join(self._dir, path)
 
+    def _list_files(self):
+        """
+        Returns the paths of all the entries' files, and those of the
+        temporary files.
+        """
+        paths, temp_paths = [], []
+        for root, _, files in os.walk(self._dir):
+            for f in files:
+                if f.endswith(TEMP_SUFFIX):
+                    temp_paths.append(os.path.join(root, f))
+                else:
+                    paths.append(os.path.join(root, f))
+        return paths, temp_paths
+
+    def _list_entries(self):
+        "Returns the paths of all the entries' files."
+        return self._list_files()[0]
+
+    def _add_entries(self, count):
+        if self._dir in _entry_counts:
+            num_entries, counted = _entry_counts[self._dir]
+            _entry_counts[self._dir] = (max(num_entries + count, 0), counted)
+
+    def _set_num_entries(self, num_entries):
+        _entry_counts[self._dir] = (num_entries, time.time())
+
     def _get_num_entries(self):
-        count = 0
-        for _,_,files in os.walk(self._dir):
-            count += len(files)
-        return count
+        """
+        Returns the number of entries in the cache. The files are counted at
+        most every RECOUNT_INTERVAL seconds; in between, this process keeps
+        track of the entries it adds and removes.
+        """
+        if (self._dir not in _entry_counts
+                or _entry_counts[self._dir][1] + RECOUNT_INTERVAL < time.time()):
+            self._set_num_entries(len(self._list_entries()))
+        return _entry_counts[self._dir][0]
     _num_entries = property(_get_num_entries)
 
     def clear(self):
@@ -161,6 +277,7 @@ class FileBasedCache(BaseCache):
             shutil.rmtree(self._dir)
         except (IOError, OSError):
             pass
+        self._set_num_entries(0)
 
 # For backwards compatibility
 class CacheClass(FileBasedCache):
@@ -5,141 +5,270 @@ try:
     import cPickle as pickle
 except ImportError:
     import pickle
+try:
+    import threading
+except ImportError:
+    import dummy_threading as threading
 
 from django.core.cache.backends.base import BaseCache
-from django.utils.synch import RWLock
+
+class LRUStore(object):
+    """
+    An in-memory store whose entries expire, and which evicts the least
+    recently used entries when it's full.
+
+    Entries live in a dict and in a circular doubly linked list ordered from
+    least to most recently used, so lookups, stores and evictions are all
+    O(1). Each link is a list: [previous link, next link, key, value, expiry].
+
+    A single lock protects the store, but it's only held for these few
+    pointer updates; callers do any (un)pickling outside of it, and update
+    values atomically with compare_and_set().
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+        self._clear()
+
+    def __len__(self):
+        return len(self.map)
+
+    def _clear(self):
+        self.map = {}
+        self.root = root = []
+        root[:] = [root, root, None, None, None]
+
+    def _unlink(self, link):
+        link_prev, link_next = link[0], link[1]
+        link_prev[1] = link_next
+        link_next[0] = link_prev
+
+    def _append(self, link):
+        "Makes link the most recently used entry."
+        root = self.root
+        last = root[0]
+        link[0], link[1] = last, root
+        last[1] = root[0] = link
+
+    def _lookup(self, key):
+        "Returns the link for key, dropping it if it has expired."
+        link = self.map.get(key)
+        if link is not None and link[4] <= time.time():
+            self._unlink(link)
+            del self.map[key]
+            link = None
+        return link
+
+    def _cull(self, max_entries, cull_frequency):
+        """
+        Makes room for a new entry: evicts the least recently used entry, or
+        1/cull_frequency of them if cull_frequency is given. A cull_frequency
+        of 0 empties the store.
+        """
+        if cull_frequency == 0:
+            self.evictions += len(self.map)
+            self._clear()
+            return
+        if cull_frequency is None:
+            count = 1
+        else:
+            count = max(max_entries // cull_frequency, 1)
+        root = self.root
+        for i in xrange(count):
+            oldest = root[1]
+            if oldest is root:
+                break
+            self._unlink(oldest)
+            del self.map[oldest[2]]
+            self.evictions += 1
+
+    def _set(self, key, value, expiry, max_entries, cull_frequency):
+        link = self.map.pop(key, None)
+        if link is not None:
+            self._unlink(link)
+        elif len(self.map) >= max_entries:
+            self._cull(max_entries, cull_frequency)
+        link = [None, None, key, value, expiry]
+        self._append(link)
+        self.map[key] = link
+
+    def get(self, key, default=None):
+        """
+        Returns the value stored for key, or default if it is missing or
+        expired. The entry becomes the most recently used one.
+        """
+        self.lock.acquire()
+        try:
+            link = self._lookup(key)
+            if link is None:
+                self.misses += 1
+                return default
+            self._unlink(link)
+            self._append(link)
+            self.hits += 1
+            return link[3]
+        finally:
+            self.lock.release()
+
+    def has_key(self, key):
+        self.lock.acquire()
+        try:
+            return self._lookup(key) is not None
+        finally:
+            self.lock.release()
+
+    def set(self, key, value, expiry, max_entries, cull_frequency=None):
+        """
+        Stores value for key until the expiry timestamp, evicting entries
+        first if the store already holds max_entries of them.
+        """
+        self.lock.acquire()
+        try:
+            self._set(key, value, expiry, max_entries, cull_frequency)
+        finally:
+            self.lock.release()
+
+    def add(self, key, value, expiry, max_entries, cull_frequency=None):
+        """
+        Like set(), but only if key is missing or expired. Returns True if
+        the value was stored, False otherwise.
+        """
+        self.lock.acquire()
+        try:
+            if self._lookup(key) is not None:
+                return False
+            self._set(key, value, expiry, max_entries, cull_frequency)
+            return True
+        finally:
+            self.lock.release()
+
+    def compare_and_set(self, key, expected, value):
+        """
+        Replaces the value stored for key by value, keeping its expiry, if
+        it's still the expected object (as returned by get()). Returns True
+        if it was replaced, False otherwise; raises KeyError if key is
+        missing or expired.
+        """
+        self.lock.acquire()
+        try:
+            link = self._lookup(key)
+            if link is None:
+                raise KeyError(key)
+            if link[3] is not expected:
+                return False
+            link[3] = value
+            return True
+        finally:
+            self.lock.release()
+
+    def delete(self, key):
+        self.lock.acquire()
+        try:
+            link = self.map.pop(key, None)
+            if link is not None:
+                self._unlink(link)
+        finally:
+            self.lock.release()
+
+    def clear(self):
+        self.lock.acquire()
+        try:
+            self._clear()
+        finally:
+            self.lock.release()
 
 # Global in-memory store of cache data. Keyed by name, to provide
 # multiple named local memory caches.
 _caches = {}
-_expire_info = {}
-_locks = {}
 
 class LocMemCache(BaseCache):
     def __init__(self, name, params):
         BaseCache.__init__(self, params)
-        global _caches, _expire_info, _locks
-        self._cache = _caches.setdefault(name, {})
-        self._expire_info = _expire_info.setdefault(name, {})
-        self._lock = _locks.setdefault(name, RWLock())
+        global _caches
+        self._cache = _caches.setdefault(name, LRUStore())
+        options = params.get('OPTIONS', {})
+        # Values are pickled by default, so that callers modifying what they
+        # got from the cache don't modify the cached value. Caches that only
+        # hold immutable values can skip that.
+        self._pickle = params.get('pickle', options.get('PICKLE', True))
+        if isinstance(self._pickle, basestring):
+            self._pickle = self._pickle.lower() not in ('0', 'false', 'no')
 
-    def add(self, key, value, timeout=None, version=None):
+    def _get_expiry(self, timeout):
+        if timeout is None:
+            timeout = self.default_timeout
+        return time.time() + timeout
+
+    def add(self, key, value, timeout=None, version=None, tags=None):
         key = self.make_key(key, version=version)
         self.validate_key(key)
-        self._lock.writer_enters()
-        try:
-            exp = self._expire_info.get(key)
-            if exp is None or exp <= time.time():
-                try:
-                    self._set(key, pickle.dumps(value), timeout)
-                    return True
-                except pickle.PickleError:
-                    pass
-            return False
-        finally:
-            self._lock.writer_leaves()
+        value = self.encode_value(value, tags)
+        if self._pickle:
+            try:
+                value = pickle.dumps(value)
+            except pickle.PickleError:
+                return False
+        return self._cache.add(key, value, self._get_expiry(timeout),
+                               self._max_entries, self._cull_frequency)
 
     def get(self, key, default=None, version=None):
         key = self.make_key(key, version=version)
         self.validate_key(key)
-        self._lock.reader_enters()
-        try:
-            exp = self._expire_info.get(key)
-            if exp is None:
-                return default
-            elif exp > time.time():
-                try:
-                    return pickle.loads(self._cache[key])
-                except pickle.PickleError:
-                    return default
-        finally:
-            self._lock.reader_leaves()
-        self._lock.writer_enters()
-        try:
-            try:
-                del self._cache[key]
-                del self._expire_info[key]
-            except KeyError:
-                pass
+        value = self._cache.get(key)
+        if value is None:
             return default
-        finally:
-            self._lock.writer_leaves()
-
-    def _set(self, key, value, timeout=None):
-        if len(self._cache) >= self._max_entries:
-            self._cull()
-        if timeout is None:
-            timeout = self.default_timeout
-        self._cache[key] = value
-        self._expire_info[key] = time.time() + timeout
+        if self._pickle:
+            try:
+                value = pickle.loads(value)
+            except pickle.PickleError:
+                return default
+        return self.decode_value(value, default)
 
-    def set(self, key, value, timeout=None, version=None):
+    def set(self, key, value, timeout=None, version=None, tags=None):
         key = self.make_key(key, version=version)
         self.validate_key(key)
-        self._lock.writer_enters()
-        # Python 2.4 doesn't allow combined try-except-finally blocks.
-        try:
+        value = self.encode_value(value, tags)
+        if self._pickle:
             try:
-                self._set(key, pickle.dumps(value), timeout)
+                value = pickle.dumps(value)
             except pickle.PickleError:
-                pass
-        finally:
-            self._lock.writer_leaves()
+                return
+        self._cache.set(key, value, self._get_expiry(timeout),
+                        self._max_entries, self._cull_frequency)
 
     def has_key(self, key, version=None):
         key = self.make_key(key, version=version)
         self.validate_key(key)
-        self._lock.reader_enters()
-        try:
-            exp = self._expire_info.get(key)
-            if exp is None:
-                return False
-            elif exp > time.time():
-                return True
-        finally:
-            self._lock.reader_leaves()
+        return self._cache.has_key(key)
 
-        self._lock.writer_enters()
-        try:
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        # The value is decoded (which may look up the versions of its tags in
+        # this cache) without holding the store's lock, then swapped in if
+        # nobody changed it in the meantime.
+        while True:
+            stored = self._cache.get(key)
+            if stored is None:
+                raise ValueError("Key '%s' not found" % key)
+            if self._pickle:
+                new_value, new_stored = self._incr_encoded(pickle.loads(stored), delta, key)
+                new_stored = pickle.dumps(new_stored)
+            else:
+                new_value, new_stored = self._incr_encoded(stored, delta, key)
             try:
-                del self._cache[key]
-                del self._expire_info[key]
+                if self._cache.compare_and_set(key, stored, new_stored):
+                    return new_value
             except KeyError:
-                pass
-            return False
-        finally:
-            self._lock.writer_leaves()
-
-    def _cull(self):
-        if self._cull_frequency == 0:
-            self.clear()
-        else:
-            doomed = [k for (i, k) in enumerate(self._cache) if i % self._cull_frequency == 0]
-            for k in doomed:
-                self._delete(k)
-
-    def _delete(self, key):
-        try:
-            del self._cache[key]
-        except KeyError:
-            pass
-        try:
-            del self._expire_info[key]
-        except KeyError:
-            pass
+                raise ValueError("Key '%s' not found" % key)
 
     def delete(self, key, version=None):
         key = self.make_key(key, version=version)
         self.validate_key(key)
-        self._lock.writer_enters()
-        try:
-            self._delete(key)
-        finally:
-            self._lock.writer_leaves()
+        self._cache.delete(key)
 
     def clear(self):
         self._cache.clear()
-        self._expire_info.clear()
 
 # For backwards compatibility
 class CacheClass(LocMemCache):
@@ -1,13 +1,220 @@
 "Memcached cache backend"
 
+import bisect
+import random
+import socket
+import struct
 import time
 from threading import local
 
 from django.core.cache.backends.base import BaseCache, InvalidCacheBackendError
 from django.utils import importlib
+from django.utils.hashcompat import md5_constructor
+
+class HashRing(object):
+    """
+    A ketama-style consistent hash ring.
+
+    Each node is placed at many pseudo-random points of a circle of 32-bit
+    hashes, and a key belongs to the first node found clockwise from the
+    key's own hash. Adding or removing a node only moves the keys of the
+    arcs it gains or loses, instead of remapping almost every key as modulo
+    hashing does.
+    """
+    # The number of md5 digests computed per node; each one gives 4 points.
+    DIGESTS_PER_NODE = 40
+
+    def __init__(self, nodes):
+        self.nodes = list(nodes)
+        ring = []
+        for node in self.nodes:
+            for i in xrange(self.DIGESTS_PER_NODE):
+                digest = md5_constructor('%s-%d' % (node, i)).digest()
+                for point in struct.unpack('<4I', digest):
+                    ring.append((point, node))
+        ring.sort()
+        self._points = [point for point, node in ring]
+        self._ring = [node for point, node in ring]
+
+    def get_nodes(self, key, count=1):
+        """
+        Returns the (at most count) distinct nodes that key belongs to, in
+        ring order.
+        """
+        if not self._ring:
+            return []
+        count = min(count, len(self.nodes))
+        point = struct.unpack('<I', md5_constructor(key).digest()[:4])[0]
+        pos = bisect.bisect(self._points, point)
+        nodes = []
+        for i in xrange(len(self._ring)):
+            node = self._ring[(pos + i) % len(self._ring)]
+            if node not in nodes:
+                nodes.append(node)
+                if len(nodes) == count:
+                    break
+        return nodes
+
+class ConsistentHashingClient(object):
+    """
+    A client for several memcached servers that spreads the keys over them
+    with a HashRing. It has the parts of the memcached client API that
+    BaseMemcachedCache uses, and talks to each server through a client of
+    the underlying library.
+
+    Each key is stored on ``replicas`` servers, and read from one of them
+    picked at random, which spreads the load of frequently read keys. A
+    server that fails is taken out of the ring for ``dead_retry`` seconds;
+    its keys go to the next servers of the ring in the meantime.
+    """
+    def __init__(self, servers, make_client, replicas=1, dead_retry=30,
+                 server_errors=(socket.error,), value_not_found_exception=None):
+        self._clients = dict([(server, make_client(server)) for server in servers])
+        self._servers = list(servers)
+        self._replicas = max(int(replicas), 1)
+        self._dead_retry = dead_retry
+        self._server_errors = server_errors
+        self._not_found = value_not_found_exception
+        # Maps each dead server to the time it should be retried at.
+        self._dead = {}
+        self._ring = HashRing(self._servers)
+
+    def _check_dead(self):
+        "Puts back in the ring the dead servers that are due for a retry."
+        if not self._dead:
+            return
+        now = time.time()
+        retried = [server for server, retry in self._dead.items() if retry <= now]
+        if retried:
+            for server in retried:
+                del self._dead[server]
+            self._build_ring()
+
+    def _build_ring(self):
+        self._ring = HashRing([s for s in self._servers if s not in self._dead])
+
+    def _mark_dead(self, server):
+        self._dead[server] = time.time() + self._dead_retry
+        self._build_ring()
+
+    def _is_dead(self, client):
+        """
+        Returns True if the library reports that the client's server is
+        down. python-memcached doesn't raise errors, but flags the server.
+        """
+        for host in getattr(client, 'servers', ()):
+            if getattr(host, 'deaduntil', 0) <= time.time():
+                return False
+        return bool(getattr(client, 'servers', ()))
+
+    def _call(self, server, method, *args):
+        """
+        Calls method on the client for server. Returns (ok, result); ok is
+        False if the server failed, in which case it's taken out of the ring.
+        """
+        client = self._clients[server]
+        try:
+            result = getattr(client, method)(*args)
+        except self._server_errors, e:
+            if self._not_found is not None and isinstance(e, self._not_found):
+                raise
+            self._mark_dead(server)
+            return False, None
+        if self._is_dead(client):
+            self._mark_dead(server)
+            return False, None
+        return True, result
+
+    def _servers_for(self, key):
+        self._check_dead()
+        return self._ring.get_nodes(key, self._replicas)
+
+    def _group(self, keys):
+        "Maps each server to the keys it holds, for every replica."
+        groups = {}
+        for key in keys:
+            for server in self._servers_for(key):
+                groups.setdefault(server, []).append(key)
+        return groups
+
+    def get(self, key):
+        servers = self._servers_for(key)
+        random.shuffle(servers)
+        for server in servers:
+            ok, result = self._call(server, 'get', key)
+            if ok:
+                return result
+        return None
+
+    def get_multi(self, keys):
+        self._check_dead()
+        groups = {}
+        for key in keys:
+            servers = self._ring.get_nodes(key, self._replicas)
+            if servers:
+                groups.setdefault(random.choice(servers), []).append(key)
+        values = {}
+        for server, server_keys in groups.items():
+            ok, result = self._call(server, 'get_multi', server_keys)
+            if ok:
+                values.update(result)
+            else:
+                # Fall back on the other replicas, one key at a time.
+                for key in server_keys:
+                    value = self.get(key)
+                    if value is not None:
+                        values[key] = value
+        return values
+
+    def _write(self, method, key, *args):
+        "Calls method on every replica of key; returns the first result."
+        results = [result for ok, result in
+                   [self._call(server, method, key, *args) for server in self._servers_for(key)] if ok]
+        if results:
+            return results[0]
+        return None
+
+    def set(self, key, value, timeout=0):
+        return self._write('set', key, value, timeout)
+
+    def add(self, key, value, timeout=0):
+        return self._write('add', key, value, timeout)
+
+    def delete(self, key):
+        return self._write('delete', key)
+
+    def incr(self, key, delta=1):
+        return self._write('incr', key, delta)
+
+    def decr(self, key, delta=1):
+        return self._write('decr', key, delta)
+
+    def set_multi(self, mapping, timeout=0):
+        failed = []
+        for server, keys in self._group(mapping.keys()).items():
+            ok, result = self._call(server, 'set_multi', dict([(k, mapping[k]) for k in keys]), timeout)
+            if not ok:
+                failed.extend(keys)
+            elif result:
+                failed.extend(result)
+        return failed
+
+    def delete_multi(self, keys):
+        for server, server_keys in self._group(keys).items():
+            self._call(server, 'delete_multi', server_keys)
+
+    def flush_all(self):
+        self._check_dead()
+        for server in self._ring.nodes:
+            self._call(server, 'flush_all')
+
+    def disconnect_all(self):
+        for client in self._clients.values():
+            client.disconnect_all()
 
 class BaseMemcachedCache(BaseCache):
-    def __init__(self, server, params, library, value_not_found_exception):
+    def __init__(self, server, params, library, value_not_found_exception,
+                 server_error_exception=socket.error):
         super(BaseMemcachedCache, self).__init__(params)
         if isinstance(server, basestring):
             self._servers = server.split(';')
@@ -19,9 +226,38 @@ class BaseMemcachedCache(BaseCache):
         # pylibmc.NotFound for pylibmc, and cmemcache will return None without
         # raising an exception.
         self.LibraryValueNotFoundException = value_not_found_exception
+        # The exception type the library raises when a server fails, which
+        # takes the server out of the ring if consistent hashing is used.
+        self.LibraryServerError = server_error_exception
 
         self._lib = library
-        self._options = params.get('OPTIONS', None)
+        options = params.get('OPTIONS', None)
+        if options:
+            # The consistent hashing options are handled here and compression
+            # by BaseCache; any other ones are for the library.
+            options = dict(options)
+            options.pop('COMPRESS_MIN_LENGTH', None)
+            options.pop('COMPRESS_LEVEL', None)
+            self._consistent_hashing = options.pop('CONSISTENT_HASHING', False)
+            self._replicas = options.pop('REPLICAS', 1)
+            self._dead_retry = options.pop('DEAD_RETRY', 30)
+        else:
+            self._consistent_hashing = False
+        self._options = options or None
+
+    def _make_client(self, servers):
+        "Returns a client of the library for the given list of servers."
+        return self._lib.Client(servers)
+
+    def _create_client(self):
+        if self._consistent_hashing and len(self._servers) > 1:
+            return ConsistentHashingClient(self._servers,
+                lambda server: self._make_client([server]),
+                replicas=self._replicas,
+                dead_retry=self._dead_retry,
+                server_errors=self.LibraryServerError,
+                value_not_found_exception=self.LibraryValueNotFoundException)
+        return self._make_client(self._servers)
 
     @property
     def _cache(self):
@@ -29,7 +265,7 @@ class BaseMemcachedCache(BaseCache):
         Implements transparent thread-safe access to a memcached client.
         """
         if getattr(self, '_client', None) is None:
-            self._client = self._lib.Client(self._servers)
+            self._client = self._create_client()
 
         return self._client
 
@@ -49,20 +285,20 @@ class BaseMemcachedCache(BaseCache):
             timeout += int(time.time())
         return timeout
 
-    def add(self, key, value, timeout=0, version=None):
+    def add(self, key, value, timeout=0, version=None, tags=None):
         key = self.make_key(key, version=version)
-        return self._cache.add(key, value, self._get_memcache_timeout(timeout))
+        return self._cache.add(key, self.encode_value(value, tags), self._get_memcache_timeout(timeout))
 
     def get(self, key, default=None, version=None):
         key = self.make_key(key, version=version)
         val = self._cache.get(key)
         if val is None:
             return default
-        return val
+        return self.decode_value(val, default)
 
-    def set(self, key, value, timeout=0, version=None):
+    def set(self, key, value, timeout=0, version=None, tags=None):
         key = self.make_key(key, version=version)
-        self._cache.set(key, value, self._get_memcache_timeout(timeout))
+        self._cache.set(key, self.encode_value(value, tags), self._get_memcache_timeout(timeout))
 
     def delete(self, key, version=None):
         key = self.make_key(key, version=version)
@@ -74,7 +310,7 @@ class BaseMemcachedCache(BaseCache):
         if ret:
             _ = {}
             m = dict(zip(new_keys, keys))
-            for k, v in ret.items():
+            for k, v in self.decode_many(ret).items():
                 _[m[k]] = v
             ret = _
         return ret
@@ -112,12 +348,12 @@ class BaseMemcachedCache(BaseCache):
             raise ValueError("Key '%s' not found" % key)
         return val
 
-    def set_many(self, data, timeout=0, version=None):
+    def set_many(self, data, timeout=0, version=None, tags=None):
         safe_data = {}
         for key, value in data.items():
             key = self.make_key(key, version=version)
             safe_data[key] = value
-        self._cache.set_multi(safe_data, self._get_memcache_timeout(timeout))
+        self._cache.set_multi(self.encode_many(safe_data, tags), self._get_memcache_timeout(timeout))
 
     def delete_many(self, keys, version=None):
         l = lambda x: self.make_key(x, version=version)
@@ -161,9 +397,15 @@ class PyLibMCCache(BaseMemcachedCache):
     def __init__(self, server, params):
         import pylibmc
         self._local = local()
+        # Only the errors of a server that can't be reached take it out of
+        # the ring; pylibmc.Error also covers the errors of single commands.
+        # Older versions of pylibmc don't have all of these.
+        server_errors = tuple([getattr(pylibmc, name) for name in ('ConnectionError', 'ServerDown', 'ServerDead')
+                               if hasattr(pylibmc, name)])
         super(PyLibMCCache, self).__init__(server, params,
                                            library=pylibmc,
-                                           value_not_found_exception=pylibmc.NotFound)
+                                           value_not_found_exception=pylibmc.NotFound,
+                                           server_error_exception=server_errors)
 
     @property
     def _cache(self):
@@ -174,10 +416,13 @@ class PyLibMCCache(BaseMemcachedCache):
         if client:
             return client
 
-        client = self._lib.Client(self._servers)
-        if self._options:
-            client.behaviors = self._options
-
+        client = self._create_client()
         self._local.client = client
 
         return client
+
+    def _make_client(self, servers):
+        client = self._lib.Client(servers)
+        if self._options:
+            client.behaviors = self._options
+        return client
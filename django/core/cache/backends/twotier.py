@@ -0,0 +1,235 @@
+"Two-tier cache backend: a small in-process LRU in front of another cache."
+
+import time
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+try:
+    import threading
+except ImportError:
+    import dummy_threading as threading
+
+from django.core import signals
+from django.core.cache import get_cache
+from django.core.cache.backends.base import BaseCache
+from django.core.cache.backends.locmem import LRUStore
+
+class LocalStore(LRUStore):
+    """
+    The local tier of a TwoTierCache. Besides the entries, it remembers the
+    generation of the remote cache they belong to, and whether that has been
+    checked during the current request of each thread.
+    """
+    def __init__(self):
+        LRUStore.__init__(self)
+        self.generation = None
+        self.checked = threading.local()
+
+# Global in-process stores, keyed by the location of the remote cache, so
+# every TwoTierCache instance for a location shares its local tier.
+_stores = {}
+
+class TwoTierCache(BaseCache):
+    """
+    Keeps recently used values in an in-process LRU for a few seconds
+    (LOCAL_TIMEOUT) in front of the cache named by LOCATION, which is an
+    alias from the CACHES setting or a backend URI.
+
+    Other processes may change the remote cache while this one holds a local
+    copy, so local entries can be up to LOCAL_TIMEOUT seconds out of date.
+    If GENERATION_KEY is set, every write through this backend increments a
+    generation counter in the remote cache, and the local tier is dropped
+    whenever that counter changed since the last time it was checked. It is
+    checked at most once per request (close() starts a new request).
+
+    Keys are made the way the remote cache makes them, so values set through
+    this backend and through the remote cache itself are the same.
+    """
+    def __init__(self, location, params):
+        BaseCache.__init__(self, params)
+        options = params.get('OPTIONS', {})
+        local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        try:
+            self.local_timeout = int(local_timeout)
+        except (ValueError, TypeError):
+            self.local_timeout = 5
+        self.generation_key = options.get('GENERATION_KEY')
+        if '://' in location:
+            # A cache of our own: it makes its keys the way we were told to.
+            key_params = dict([(name, params[name])
+                               for name in ('KEY_PREFIX', 'VERSION', 'KEY_FUNCTION')
+                               if name in params])
+            self.remote = get_cache(location, **key_params)
+        else:
+            self.remote = get_cache(location)
+        self.key_prefix = self.remote.key_prefix
+        self.version = self.remote.version
+        self.key_func = self.remote.key_func
+        self._local = _stores.setdefault(location, LocalStore())
+        # Every instance, not only the default cache, needs to learn when a
+        # request ends to check the generation again.
+        signals.request_finished.connect(self.close)
+
+    def _local_timeout(self, timeout):
+        if timeout:
+            return min(timeout, self.local_timeout)
+        return self.local_timeout
+
+    def _check_generation(self):
+        """
+        Drops the local tier if another process wrote to the remote cache
+        since the generation was last checked.
+        """
+        local = self._local
+        if self.generation_key is None or getattr(local.checked, 'value', False):
+            return
+        generation = self.remote.get(self.generation_key)
+        if generation != local.generation:
+            local.lock.acquire()
+            try:
+                local._clear()
+                local.generation = generation
+            finally:
+                local.lock.release()
+        local.checked.value = True
+
+    def _bump_generation(self):
+        "Tells the other processes that the remote cache has changed."
+        if self.generation_key is None:
+            return
+        local = self._local
+        try:
+            generation = self.remote.incr(self.generation_key)
+        except ValueError:
+            # Start from the current time rather than from 0, so a counter
+            # evicted from the remote cache doesn't come back to a value
+            # another process has already seen.
+            generation = int(time.time())
+            if not self.remote.add(self.generation_key, generation):
+                generation = None
+        local.lock.acquire()
+        try:
+            if generation is None or generation != (local.generation or 0) + 1:
+                # Somebody else wrote in the meantime, or the counter was
+                # reset: nothing held locally can be trusted.
+                local._clear()
+            local.generation = generation
+        finally:
+            local.lock.release()
+
+    def _store_locally(self, key, value, timeout=None):
+        self._local.set(key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                        time.time() + self._local_timeout(timeout), self._max_entries)
+
+    def add(self, key, value, timeout=None, version=None, tags=None):
+        if self.remote.add(key, value, timeout, version=version, tags=tags):
+            self._bump_generation()
+            self._store_locally(self.make_key(key, version=version), value, timeout)
+            return True
+        return False
+
+    def get(self, key, default=None, version=None):
+        local_key = self.make_key(key, version=version)
+        self._check_generation()
+        value = self._local.get(local_key)
+        if value is not None:
+            return pickle.loads(value)
+        value = self.remote.get(key, version=version)
+        if value is None:
+            return default
+        self._store_locally(local_key, value)
+        return value
+
+    def set(self, key, value, timeout=None, version=None, tags=None):
+        self.remote.set(key, value, timeout, version=version, tags=tags)
+        self._bump_generation()
+        self._store_locally(self.make_key(key, version=version), value, timeout)
+
+    def delete(self, key, version=None):
+        self.remote.delete(key, version=version)
+        self._bump_generation()
+        self._local.delete(self.make_key(key, version=version))
+
+    def has_key(self, key, version=None):
+        self._check_generation()
+        if self._local.get(self.make_key(key, version=version)) is not None:
+            return True
+        return self.remote.has_key(key, version=version)
+
+    def get_many(self, keys, version=None):
+        self._check_generation()
+        d = {}
+        missing = {}
+        for k in keys:
+            local_key = self.make_key(k, version=version)
+            value = self._local.get(local_key)
+            if value is None:
+                missing[k] = local_key
+            else:
+                d[k] = pickle.loads(value)
+        if missing:
+            for k, value in self.remote.get_many(missing.keys(), version=version).items():
+                self._store_locally(missing[k], value)
+                d[k] = value
+        return d
+
+    def set_many(self, data, timeout=None, version=None, tags=None):
+        self.remote.set_many(data, timeout, version=version, tags=tags)
+        self._bump_generation()
+        for k, value in data.items():
+            self._store_locally(self.make_key(k, version=version), value, timeout)
+
+    def delete_many(self, keys, version=None):
+        self.remote.delete_many(keys, version=version)
+        self._bump_generation()
+        for k in keys:
+            self._local.delete(self.make_key(k, version=version))
+
+    def incr(self, key, delta=1, version=None):
+        value = self.remote.incr(key, delta, version=version)
+        self._bump_generation()
+        self._local.delete(self.make_key(key, version=version))
+        return value
+
+    def invalidate_tags(self, *tags):
+        """
+        Invalidates the tags in the remote cache. This process drops its local
+        tier; other processes may keep serving their local copies of the
+        tagged values for up to LOCAL_TIMEOUT seconds, unless GENERATION_KEY
+        is set.
+        """
+        self.remote.invalidate_tags(*tags)
+        self._bump_generation()
+        self._local.clear()
+
+    def clear(self):
+        self.remote.clear()
+        local = self._local
+        local.lock.acquire()
+        try:
+            local._clear()
+            local.generation = None
+        finally:
+            local.lock.release()
+
+    def close(self, **kwargs):
+        """
+        Ends a request: the generation is checked again on the next access.
+        """
+        self._local.checked.value = False
+        if hasattr(self.remote, 'close'):
+            self.remote.close(**kwargs)
+
+    def get_stats(self):
+        """
+        Returns the hit, miss and eviction counts of the local tier, and the
+        number of entries it holds.
+        """
+        local = self._local
+        return {
+            'hits': local.hits,
+            'misses': local.misses,
+            'evictions': local.evictions,
+            'entries': len(local),
+        }
@@ -0,0 +1,79 @@
+"""
+Rate limiting built on the cache API.
+
+A RateLimiter counts the hits of each key (e.g. a client's IP address) in
+fixed windows of time, and estimates the number of hits during the last
+window's length -- a sliding window -- by weighting the count of the previous
+window by how much of it the sliding window still overlaps::
+
+    from django.core.cache.ratelimit import RateLimiter
+
+    limiter = RateLimiter(100, 60) # 100 hits a minute
+
+    def my_view(request):
+        if not limiter.hit(request.META['REMOTE_ADDR']):
+            return HttpResponse('Too many requests', status=429)
+        ...
+
+Counting relies on the atomic add() and incr() of the cache backend, so the
+limits hold across processes with a shared cache (memcached, database).
+"""
+
+import math
+import time
+
+from django.core.cache import cache as default_cache
+
+class RateLimiter(object):
+    def __init__(self, limit, window, cache=None, key_prefix='ratelimit'):
+        """
+        Allows limit hits per key during any period of window seconds. The
+        counts are kept in cache, which defaults to the default cache.
+        """
+        self.limit = limit
+        self.window = window
+        if cache is None:
+            cache = default_cache
+        self.cache = cache
+        self.key_prefix = key_prefix
+        # The count of a window is needed during the next one too.
+        self.timeout = int(math.ceil(window * 2))
+
+    def _keys(self, key, now):
+        current = int(now // self.window)
+        return ('%s:%s:%d' % (self.key_prefix, key, current - 1),
+                '%s:%s:%d' % (self.key_prefix, key, current))
+
+    def _estimate(self, now, previous, current):
+        elapsed = (now % self.window) / float(self.window)
+        return previous * (1 - elapsed) + current
+
+    def hit(self, key):
+        """
+        Records a hit for key. Returns True if it's within the limit, False if
+        it should be refused. Refused hits are counted too.
+        """
+        now = time.time()
+        previous_key, current_key = self._keys(key, now)
+        if self.cache.add(current_key, 1, self.timeout):
+            current = 1
+        else:
+            try:
+                current = self.cache.incr(current_key)
+            except ValueError:
+                # The count expired in the meantime.
+                self.cache.set(current_key, 1, self.timeout)
+                current = 1
+        previous = self.cache.get(previous_key, 0)
+        return self._estimate(now, previous, current) <= self.limit
+
+    def get_usage(self, key):
+        "Returns the estimated number of hits for key during the last window."
+        now = time.time()
+        previous_key, current_key = self._keys(key, now)
+        counts = self.cache.get_many([previous_key, current_key])
+        return self._estimate(now, counts.get(previous_key, 0), counts.get(current_key, 0))
+
+    def reset(self, key):
+        "Forgets the hits of key."
+        self.cache.delete_many(self._keys(key, time.time()))
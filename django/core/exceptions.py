@@ -17,6 +17,13 @@ class SuspiciousOperation(Exception):
     "The user did something suspicious"
     pass
 
+class TooManyFieldsSent(SuspiciousOperation):
+    """
+    The number of fields in a GET or POST request exceeded
+    settings.DATA_UPLOAD_MAX_NUMBER_FIELDS.
+    """
+    pass
+
 class PermissionDenied(Exception):
     "The user did not have permission to do that"
     pass
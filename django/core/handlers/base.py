@@ -1,12 +1,110 @@
 import sys
+import time
+import types
 
 from django import http
-from django.core import signals
+from django.core import signals, timing
 from django.utils.encoding import force_unicode
 from django.utils.importlib import import_module
 from django.utils.log import getLogger
 
 logger = getLogger('django.request')
+middleware_logger = getLogger('django.request.middleware')
+
+def first_response(methods):
+    """
+    Returns a function calling each of the middleware methods in turn with
+    its arguments, until one of them returns a response. Returns None if
+    there are no methods, so callers can skip the phase altogether.
+    """
+    if not methods:
+        return None
+    if len(methods) == 1:
+        return methods[0]
+    methods = tuple(methods)
+    def phase(*args):
+        for method in methods:
+            response = method(*args)
+            if response:
+                break
+        return response
+    return phase
+
+def response_chain(methods):
+    """
+    Returns a function passing a request and a response through each of the
+    middleware methods in turn, and returning the final response. Returns
+    None if there are no methods.
+    """
+    if not methods:
+        return None
+    if len(methods) == 1:
+        return methods[0]
+    methods = tuple(methods)
+    def phase(request, response):
+        for method in methods:
+            response = method(request, response)
+        return response
+    return phase
+
+def timed_middleware(method, name):
+    """
+    Wraps a middleware method to log how long each of its calls takes to the
+    django.request.middleware logger, at the DEBUG level.
+    """
+    def timed(request, *args):
+        start = time.time()
+        try:
+            return method(request, *args)
+        finally:
+            duration = time.time() - start
+            middleware_logger.debug('%s took %.2fms' % (name, duration * 1000),
+                extra={
+                    'middleware': name,
+                    'duration': duration,
+                    'request': request,
+                }
+            )
+    return timed
+
+
+class MiddlewareList(list):
+    """
+    A list of middleware methods of a handler, which calls changed() whenever
+    it's modified, so that the handler builds its middleware chain again.
+    """
+    def __init__(self, changed, methods=()):
+        list.__init__(self, methods)
+        self.changed = changed
+
+def _list_mutator(name):
+    mutate = getattr(list, name)
+    def mutator(self, *args):
+        self.changed()
+        return mutate(self, *args)
+    mutator.__name__ = name
+    return mutator
+
+for name in ('append', 'extend', 'insert', 'pop', 'remove', 'reverse', 'sort',
+             '__setitem__', '__delitem__', '__setslice__', '__delslice__',
+             '__iadd__', '__imul__'):
+    setattr(MiddlewareList, name, _list_mutator(name))
+del name
+
+def middleware_list(attname):
+    """
+    A handler attribute holding a MiddlewareList. Assigning a list to it, or
+    modifying that list, makes get_response() build the middleware chain
+    again.
+    """
+    def get(self):
+        return self.__dict__.get(attname)
+    def set(self, methods):
+        self._chain_stale = True
+        if methods is not None:
+            methods = MiddlewareList(self._middleware_changed, methods)
+        self.__dict__[attname] = methods
+    return property(get, set)
 
 
 class BaseHandler(object):
@@ -18,13 +116,29 @@ class BaseHandler(object):
         http.fix_IE_for_vary,
     ]
 
+    _request_middleware = middleware_list('request_middleware')
+    _view_middleware = middleware_list('view_middleware')
+    _template_response_middleware = middleware_list('template_response_middleware')
+    _response_middleware = middleware_list('response_middleware')
+    _exception_middleware = middleware_list('exception_middleware')
+
+    # Whether the middleware lists changed since the chain was built.
+    _chain_stale = True
+
     def __init__(self):
         self._request_middleware = self._view_middleware = self._response_middleware = self._exception_middleware = None
+        self._template_response_middleware = None
+        self._request_phase = self._view_phase = self._exception_phase = None
+        self._template_response_phase = self._response_phase = None
+        self._timing_collectors = None
 
+    def _middleware_changed(self):
+        self._chain_stale = True
 
     def load_middleware(self):
         """
-        Populate middleware lists from settings.MIDDLEWARE_CLASSES.
+        Populate middleware lists from settings.MIDDLEWARE_CLASSES, and build
+        the middleware chain from them.
 
         Must be called after the environment is fixed (see __call__).
         """
@@ -54,134 +168,175 @@ class BaseHandler(object):
             except exceptions.MiddlewareNotUsed:
                 continue
 
+            def method(name):
+                if settings.MIDDLEWARE_TIMING:
+                    return timed_middleware(getattr(mw_instance, name),
+                                            '%s.%s' % (middleware_path, name))
+                return getattr(mw_instance, name)
+
             if hasattr(mw_instance, 'process_request'):
-                request_middleware.append(mw_instance.process_request)
+                request_middleware.append(method('process_request'))
             if hasattr(mw_instance, 'process_view'):
-                self._view_middleware.append(mw_instance.process_view)
+                self._view_middleware.append(method('process_view'))
             if hasattr(mw_instance, 'process_template_response'):
-                self._template_response_middleware.insert(0, mw_instance.process_template_response)
+                self._template_response_middleware.insert(0, method('process_template_response'))
             if hasattr(mw_instance, 'process_response'):
-                self._response_middleware.insert(0, mw_instance.process_response)
+                self._response_middleware.insert(0, method('process_response'))
             if hasattr(mw_instance, 'process_exception'):
-                self._exception_middleware.insert(0, mw_instance.process_exception)
+                self._exception_middleware.insert(0, method('process_exception'))
 
         # We only assign to this when initialization is complete as it is used
         # as a flag for initialization being complete.
         self._request_middleware = request_middleware
+        self.build_middleware_chain()
+        self._timing_collectors = timing.load_collectors(settings.REQUEST_TIMING_COLLECTORS)
+
+    def build_middleware_chain(self):
+        """
+        Builds, from the middleware lists, the functions get_response() calls
+        for each phase of the request. Phases without middleware are None, and
+        skipped. get_response() builds the chain again when the lists have
+        been assigned or modified since.
+        """
+        self._chain_stale = False
+        self._request_phase = first_response(self._request_middleware)
+        self._view_phase = first_response(self._view_middleware)
+        self._exception_phase = first_response(self._exception_middleware)
+        self._template_response_phase = response_chain(self._template_response_middleware)
+        self._response_phase = response_chain(self._response_middleware)
 
     def get_response(self, request):
         "Returns an HttpResponse object for the given HttpRequest"
         from django.core import exceptions, urlresolvers
         from django.conf import settings
 
+        if self._chain_stale:
+            self.build_middleware_chain()
+
+        timer = None
+        if self._timing_collectors:
+            timer = timing.start_request(settings.REQUEST_TIMING_SAMPLE_RATE)
         try:
-            # Setup default url resolver for this thread, this code is outside
-            # the try/except so we don't get a spurious "unbound local
-            # variable" exception in the event an exception is raised before
-            # resolver is set
-            urlconf = settings.ROOT_URLCONF
-            urlresolvers.set_urlconf(urlconf)
-            resolver = urlresolvers.RegexURLResolver(r'^/', urlconf)
             try:
-                response = None
-                # Apply request middleware
-                for middleware_method in self._request_middleware:
-                    response = middleware_method(request)
-                    if response:
-                        break
-
-                if response is None:
-                    if hasattr(request, "urlconf"):
-                        # Reset url resolver with a custom urlconf.
-                        urlconf = request.urlconf
-                        urlresolvers.set_urlconf(urlconf)
-                        resolver = urlresolvers.RegexURLResolver(r'^/', urlconf)
-
-                    callback, callback_args, callback_kwargs = resolver.resolve(
-                            request.path_info)
-
-                    # Apply view middleware
-                    for middleware_method in self._view_middleware:
-                        response = middleware_method(request, callback, callback_args, callback_kwargs)
-                        if response:
-                            break
-
-                if response is None:
-                    try:
-                        response = callback(request, *callback_args, **callback_kwargs)
-                    except Exception, e:
-                        # If the view raised an exception, run it through exception
-                        # middleware, and if the exception middleware returns a
-                        # response, use that. Otherwise, reraise the exception.
-                        for middleware_method in self._exception_middleware:
-                            response = middleware_method(request, e)
-                            if response:
-                                break
-                        if response is None:
-                            raise
-
-                # Complain if the view returned None (a common error).
-                if response is None:
-                    try:
-                        view_name = callback.func_name # If it's a function
-                    except AttributeError:
-                        view_name = callback.__class__.__name__ + '.__call__' # If it's a class
-                    raise ValueError("The view %s.%s didn't return an HttpResponse object." % (callback.__module__, view_name))
-
-                # If the response supports deferred rendering, apply template
-                # response middleware and the render the response
-                if hasattr(response, 'render') and callable(response.render):
-                    for middleware_method in self._template_response_middleware:
-                        response = middleware_method(request, response)
-                    response.render()
-
-            except http.Http404, e:
-                logger.warning('Not Found: %s' % request.path,
-                            extra={
-                                'status_code': 404,
-                                'request': request
-                            })
-                if settings.DEBUG:
-                    from django.views import debug
-                    response = debug.technical_404_response(request, e)
-                else:
-                    try:
-                        callback, param_dict = resolver.resolve404()
-                        response = callback(request, **param_dict)
-                    except:
+                # Setup default url resolver for this thread, this code is outside
+                # the try/except so we don't get a spurious "unbound local
+                # variable" exception in the event an exception is raised before
+                # resolver is set
+                urlconf = settings.ROOT_URLCONF
+                urlresolvers.set_urlconf(urlconf)
+                resolver = urlresolvers.get_resolver(urlconf)
+                try:
+                    response = None
+                    # Apply request middleware
+                    if self._request_phase is not None:
+                        response = timing.call(timer, 'middleware', self._request_phase, request)
+
+                    if response is None:
+                        if hasattr(request, "urlconf"):
+                            # Reset url resolver with a custom urlconf.
+                            urlconf = request.urlconf
+                            urlresolvers.set_urlconf(urlconf)
+                            if isinstance(urlconf, (basestring, types.ModuleType)):
+                                resolver = urlresolvers.get_resolver(urlconf)
+                            else:
+                                # get_resolver() would fall back to ROOT_URLCONF
+                                # for None and can't keep unhashable URLconfs,
+                                # like a list of patterns.
+                                resolver = urlresolvers.RegexURLResolver(r'^/', urlconf)
+
+                        callback, callback_args, callback_kwargs = timing.call(timer, 'resolve',
+                                resolver.resolve, request.path_info)
+
+                        # Apply view middleware
+                        if self._view_phase is not None:
+                            response = timing.call(timer, 'middleware', self._view_phase,
+                                    request, callback, callback_args, callback_kwargs)
+
+                    if response is None:
+                        try:
+                            if timer is None:
+                                response = callback(request, *callback_args, **callback_kwargs)
+                            else:
+                                response = timer.call('view', callback, request, *callback_args, **callback_kwargs)
+                        except Exception, e:
+                            # If the view raised an exception, run it through exception
+                            # middleware, and if the exception middleware returns a
+                            # response, use that. Otherwise, reraise the exception.
+                            if self._exception_phase is not None:
+                                response = timing.call(timer, 'middleware', self._exception_phase, request, e)
+                            if response is None:
+                                raise
+
+                    # Complain if the view returned None (a common error).
+                    if response is None:
+                        try:
+                            view_name = callback.func_name # If it's a function
+                        except AttributeError:
+                            view_name = callback.__class__.__name__ + '.__call__' # If it's a class
+                        raise ValueError("The view %s.%s didn't return an HttpResponse object." % (callback.__module__, view_name))
+
+                    # If the response supports deferred rendering, apply template
+                    # response middleware and the render the response
+                    if hasattr(response, 'render') and callable(response.render):
+                        if self._template_response_phase is not None:
+                            response = timing.call(timer, 'middleware',
+                                    self._template_response_phase, request, response)
+                        response.render()
+
+                except http.Http404, e:
+                    logger.warning('Not Found: %s' % request.path,
+                                extra={
+                                    'status_code': 404,
+                                    'request': request
+                                })
+                    if settings.DEBUG:
+                        from django.views import debug
+                        response = debug.technical_404_response(request, e)
+                    else:
                         try:
-                            response = self.handle_uncaught_exception(request, resolver, sys.exc_info())
-                        finally:
-                            receivers = signals.got_request_exception.send(sender=self.__class__, request=request)
-            except exceptions.PermissionDenied:
-                logger.warning('Forbidden (Permission denied): %s' % request.path,
-                            extra={
-                                'status_code': 403,
-                                'request': request
-                            })
-                response = http.HttpResponseForbidden('<h1>Permission denied</h1>')
-            except SystemExit:
-                # Allow sys.exit() to actually exit. See tickets #1023 and #4701
-                raise
-            except: # Handle everything else, including SuspiciousOperation, etc.
-                # Get the exception info now, in case another exception is thrown later.
+                            callback, param_dict = resolver.resolve404()
+                            response = callback(request, **param_dict)
+                        except:
+                            try:
+                                response = self.handle_uncaught_exception(request, resolver, sys.exc_info())
+                            finally:
+                                receivers = signals.got_request_exception.send(sender=self.__class__, request=request)
+                except exceptions.PermissionDenied:
+                    logger.warning('Forbidden (Permission denied): %s' % request.path,
+                                extra={
+                                    'status_code': 403,
+                                    'request': request
+                                })
+                    response = http.HttpResponseForbidden('<h1>Permission denied</h1>')
+                except SystemExit:
+                    # Allow sys.exit() to actually exit. See tickets #1023 and #4701
+                    raise
+                except: # Handle everything else, including SuspiciousOperation, etc.
+                    # Get the exception info now, in case another exception is thrown later.
+                    receivers = signals.got_request_exception.send(sender=self.__class__, request=request)
+                    response = self.handle_uncaught_exception(request, resolver, sys.exc_info())
+            finally:
+                # Reset URLconf for this thread on the way out for complete
+                # isolation of request.urlconf
+                urlresolvers.set_urlconf(None)
+
+            try:
+                # Apply response middleware, regardless of the response
+                if self._response_phase is not None:
+                    response = timing.call(timer, 'middleware', self._response_phase, request, response)
+                response = self.apply_response_fixes(request, response)
+            except: # Any exception should be gathered and handled
                 receivers = signals.got_request_exception.send(sender=self.__class__, request=request)
                 response = self.handle_uncaught_exception(request, resolver, sys.exc_info())
-        finally:
-            # Reset URLconf for this thread on the way out for complete
-            # isolation of request.urlconf
-            urlresolvers.set_urlconf(None)
-
-        try:
-            # Apply response middleware, regardless of the response
-            for middleware_method in self._response_middleware:
-                response = middleware_method(request, response)
-            response = self.apply_response_fixes(request, response)
-        except: # Any exception should be gathered and handled
-            receivers = signals.got_request_exception.send(sender=self.__class__, request=request)
-            response = self.handle_uncaught_exception(request, resolver, sys.exc_info())
 
-        return response
+            if timer is not None:
+                timing.finish_request(timer, self._timing_collectors, request, response)
+            return response
+        finally:
+            if timer is not None:
+                # Don't leave the timer to the next requests on this thread
+                # if an exception escaped.
+                timing.clear_request()
 
     def handle_uncaught_exception(self, request, resolver, exc_info):
         """
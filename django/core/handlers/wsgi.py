@@ -283,5 +283,9 @@ class WSGIHandler(base.BaseHandler):
         for c in response.cookies.values():
             response_headers.append(('Set-Cookie', str(c.output(header=''))))
         start_response(status, response_headers)
+        if 'wsgi.file_wrapper' in environ and hasattr(response, 'get_file_to_stream'):
+            file_to_stream = response.get_file_to_stream()
+            if file_to_stream is not None:
+                return environ['wsgi.file_wrapper'](file_to_stream, response.block_size)
         return response
 
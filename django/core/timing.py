@@ -0,0 +1,199 @@
+"""
+Per-request timing.
+
+When REQUEST_TIMING_COLLECTORS lists any collectors, the request handler
+times a sample of the requests (REQUEST_TIMING_SAMPLE_RATE of them): how long
+is spent resolving the URL, in middleware, in the view, rendering templates,
+querying the database and accessing the cache. Once the response is ready,
+each collector gets the RequestTimer holding these timings, to add them to
+the response, log them, send them to a metrics service...
+
+Code outside Django can record its own timings for the current request::
+
+    from django.core import timing
+
+    timer = timing.get_timer()
+    if timer is not None:
+        result = timer.call('search', search_backend.query, terms)
+    else:
+        result = search_backend.query(terms)
+"""
+import random
+import time
+try:
+    import threading
+except ImportError:
+    import dummy_threading as threading
+
+from django.core import exceptions
+from django.utils.importlib import import_module
+from django.utils.log import getLogger
+
+logger = getLogger('django.request.timing')
+
+# The methods of cache backends that are timed.
+CACHE_METHODS = ('add', 'get', 'set', 'delete', 'get_many', 'has_key', 'incr',
+                 'decr', 'set_many', 'delete_many', 'clear', 'invalidate_tags')
+
+_local = threading.local()
+
+class RequestTimer(object):
+    """
+    The timings of a request: for each category (e.g. 'db'), the number of
+    timed calls and the total time spent in them, in seconds.
+
+    Calls made while another call of the same category is being timed (e.g.
+    a template included by another one) are part of the outer call, and
+    aren't counted separately. Calls of different categories overlap: the
+    time of the database queries made by a view counts for both 'db' and
+    'view'.
+    """
+    def __init__(self):
+        self.start = time.time()
+        self.duration = None
+        self.timings = {}
+        self._running = set()
+
+    def add(self, category, duration):
+        "Records a call of category that took duration seconds."
+        timing = self.timings.get(category)
+        if timing is None:
+            self.timings[category] = [1, duration]
+        else:
+            timing[0] += 1
+            timing[1] += duration
+
+    def call(self, category, func, *args, **kwargs):
+        "Calls func with the given arguments, timing it as category."
+        if category in self._running:
+            return func(*args, **kwargs)
+        self._running.add(category)
+        start = time.time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.add(category, time.time() - start)
+            self._running.discard(category)
+
+    def stop(self):
+        self.duration = time.time() - self.start
+
+def get_timer():
+    "Returns the RequestTimer of the request being timed, or None."
+    return getattr(_local, 'timer', None)
+
+def start_request(sample_rate=1.0):
+    """
+    Starts timing a new request, if it's part of the sample. Returns its
+    RequestTimer, or None.
+    """
+    if sample_rate < 1 and random.random() >= sample_rate:
+        timer = None
+    else:
+        timer = RequestTimer()
+    # Always replace the timer, in case the previous request raised an
+    # exception before it was finished.
+    _local.timer = timer
+    return timer
+
+def finish_request(timer, collectors, request, response):
+    "Stops timing the request and hands its timings to the collectors."
+    timer.stop()
+    _local.timer = None
+    for collector in collectors:
+        collector.collect(request, response, timer)
+
+def clear_request():
+    "Stops timing the current request of this thread, if any."
+    _local.timer = None
+
+def call(timer, category, func, *args):
+    """
+    Calls func with args, timing it as category if timer isn't None. A
+    shortcut for code that has the timer at hand.
+    """
+    if timer is None:
+        return func(*args)
+    return timer.call(category, func, *args)
+
+def load_collectors(paths):
+    "Returns instances of the collector classes at the given dotted paths."
+    collectors = []
+    for path in paths:
+        try:
+            module, classname = path.rsplit('.', 1)
+        except ValueError:
+            raise exceptions.ImproperlyConfigured('%s isn\'t a timing collector module' % path)
+        try:
+            mod = import_module(module)
+        except ImportError, e:
+            raise exceptions.ImproperlyConfigured('Error importing timing collector %s: "%s"' % (module, e))
+        try:
+            collector_class = getattr(mod, classname)
+        except AttributeError:
+            raise exceptions.ImproperlyConfigured('Timing collector module "%s" does not define a "%s" class' % (module, classname))
+        collectors.append(collector_class())
+    return collectors
+
+def _timed_method(method, category):
+    def timed(*args, **kwargs):
+        timer = getattr(_local, 'timer', None)
+        if timer is None:
+            return method(*args, **kwargs)
+        return timer.call(category, method, *args, **kwargs)
+    return timed
+
+def time_cache(cache):
+    """
+    Makes the calls to the cache's methods count as 'cache' in the timings
+    of the requests, by replacing them on the instance.
+    """
+    for name in CACHE_METHODS:
+        if hasattr(cache, name):
+            setattr(cache, name, _timed_method(getattr(cache, name), 'cache'))
+    return cache
+
+def format_timings(timer):
+    """
+    Returns a list of (category, count, milliseconds) tuples, sorted by
+    category, followed by ('total', 1, milliseconds).
+    """
+    timings = [(category, count, duration * 1000)
+               for category, (count, duration) in timer.timings.items()]
+    timings.sort()
+    timings.append(('total', 1, (timer.duration or 0) * 1000))
+    return timings
+
+class BaseCollector(object):
+    "A collector is handed the timings of each timed request."
+    def collect(self, request, response, timer):
+        raise NotImplementedError
+
+class ServerTimingCollector(BaseCollector):
+    """
+    Adds the timings to the response in a Server-Timing header, which
+    browsers show in their developer tools.
+    """
+    def collect(self, request, response, timer):
+        response['Server-Timing'] = ', '.join([
+            '%s;dur=%.1f;desc="%d call%s"' % (category, duration, count, count != 1 and 's' or '')
+            for category, count, duration in format_timings(timer)
+        ])
+
+class LoggingCollector(BaseCollector):
+    """
+    Logs the timings of each request to the django.request.timing logger, at
+    the INFO level.
+    """
+    def collect(self, request, response, timer):
+        logger.info('%s %s (%s)' % (request.method, request.path, ', '.join([
+                '%s: %.1fms/%d' % (category, duration, count)
+                for category, count, duration in format_timings(timer)
+            ])),
+            extra={
+                'request': request,
+                'status_code': response.status_code,
+                'timings': timer.timings,
+                'duration': timer.duration,
+            }
+        )
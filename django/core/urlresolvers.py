@@ -30,6 +30,10 @@ _prefixes = local()
 # Overridden URLconfs for each thread are stored here.
 _urlconfs = local()
 
+# Maximum number of entries in each of the caches a RegexURLResolver keeps to
+# speed up reverse().
+REVERSE_CACHE_SIZE = 1000
+
 
 class ResolverMatch(object):
     def __init__(self, func, args, kwargs, url_name=None, app_name=None, namespaces=None):
@@ -68,6 +72,36 @@ class ResolverMatch(object):
 class Resolver404(Http404):
     pass
 
+class TriedPatterns(dict):
+    """
+    The argument of the Resolver404 a RegexURLResolver raises when no pattern
+    matches. Its 'tried' item, the list of the patterns tried, is only built
+    when it's looked up (e.g. by the technical 404 page), so resolvers trying
+    their includes in turn don't walk them on every miss.
+    """
+    def __init__(self, resolver, path, new_path):
+        dict.__init__(self, path=new_path)
+        self.resolver = resolver
+        self.resolver_path = path
+
+    def _load_tried(self):
+        if not dict.__contains__(self, 'tried'):
+            self['tried'] = self.resolver._resolve_all(self.resolver_path)
+
+    def __getitem__(self, key):
+        if key == 'tried':
+            self._load_tried()
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        if key == 'tried':
+            self._load_tried()
+        return dict.get(self, key, default)
+
+    def __contains__(self, key):
+        return key == 'tried' or dict.__contains__(self, key)
+    has_key = __contains__
+
 class NoReverseMatch(Exception):
     # Don't make this raise an error when used in a template.
     silent_variable_failure = True
@@ -106,6 +140,66 @@ def get_resolver(urlconf):
     return RegexURLResolver(r'^/', urlconf)
 get_resolver = memoize(get_resolver, _resolver_cache, 1)
 
+# Characters that have a special meaning in a regular expression.
+_REGEX_SPECIAL_CHARS = '.^$*+?{}[]\\|()'
+
+def get_literal_prefix(regex):
+    """
+    Returns the literal string that anything matched by the given compiled
+    regex must start with, or '' if no such string can be found (e.g. because
+    the regex isn't anchored with '^'). Used to avoid running regexes that
+    can't possibly match when resolving URLs.
+    """
+    pattern = regex.pattern
+    if not pattern.startswith('^') or regex.flags & (re.IGNORECASE | re.MULTILINE | re.VERBOSE):
+        return ''
+    # An alternation outside of any group means the regex isn't anchored as a
+    # whole, and inline flags may make it case-insensitive.
+    depth, i, in_class = 0, 1, False
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\':
+            i += 1
+        elif in_class:
+            in_class = char != ']'
+        elif char == '[':
+            in_class = True
+        elif char == '(':
+            if pattern[i+1:i+2] == '?' and pattern[i+2:i+3] in 'iLmsux':
+                return ''
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == '|' and depth == 0:
+            return ''
+        i += 1
+    prefix = []
+    i = 1
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\':
+            char = pattern[i+1:i+2]
+            if not char or char.isalnum():
+                # A character class or a group reference such as \d or \1.
+                break
+            i += 1
+        elif char in _REGEX_SPECIAL_CHARS:
+            if char in '*?{':
+                # The preceding character is optional or repeated.
+                prefix = prefix[:-1]
+            break
+        prefix.append(char)
+        i += 1
+    prefix = ''.join(prefix)
+    try:
+        # Only rely on ASCII prefixes, as the path may be a unicode string.
+        if isinstance(prefix, unicode):
+            return prefix.encode('ascii')
+        prefix.decode('ascii')
+        return prefix
+    except UnicodeError:
+        return ''
+
 def get_mod_func(callback):
     # Converts 'django.views.news.stories.story_detail' to
     # ['django.views.news.stories', 'story_detail']
@@ -186,6 +280,12 @@ class RegexURLResolver(object):
         self._reverse_dict = None
         self._namespace_dict = None
         self._app_dict = None
+        self._resolve_index = None
+        # Used by reverse(): maps (lookup_view, argument shape) to the pattern
+        # templates that accept those arguments, and (viewname, current_app)
+        # to the namespaced resolver and path prefix the view is found under.
+        self._reverse_cache = {}
+        self._namespace_cache = {}
 
     def __repr__(self):
         return '<%s %s (%s:%s) %s>' % (self.__class__.__name__, self.urlconf_name, self.app_name, self.namespace, self.regex.pattern)
@@ -242,31 +342,81 @@ class RegexURLResolver(object):
         return self._app_dict
     app_dict = property(_get_app_dict)
 
+    def _get_resolve_index(self):
+        """
+        Maps the first character of a path to the (literal prefix, pattern)
+        pairs that may match a path starting with that character, in URLconf
+        order. Paths starting with any other character can only be matched by
+        the patterns found under None, which have no literal prefix.
+
+        The index is built again if the URLconf's patterns were replaced or
+        added to since.
+        """
+        patterns = self.url_patterns
+        if (self._resolve_index is None or patterns is not self._resolve_index_patterns
+                or len(patterns) != self._resolve_index_length):
+            entries = []
+            for pattern in patterns:
+                regex = getattr(pattern, 'regex', None)
+                if regex is None:
+                    entries.append(('', pattern))
+                else:
+                    entries.append((get_literal_prefix(regex), pattern))
+            index = {None: [entry for entry in entries if not entry[0]]}
+            for prefix, pattern in entries:
+                if prefix and prefix[0] not in index:
+                    index[prefix[0]] = [entry for entry in entries
+                                        if not entry[0] or entry[0][0] == prefix[0]]
+            self._resolve_index = index
+            self._resolve_index_patterns = patterns
+            self._resolve_index_length = len(patterns)
+        return self._resolve_index
+    resolve_index = property(_get_resolve_index)
+
+    def _sub_match(self, match, sub_match):
+        sub_match_dict = dict([(smart_str(k), v) for k, v in match.groupdict().items()])
+        sub_match_dict.update(self.default_kwargs)
+        for k, v in sub_match.kwargs.iteritems():
+            sub_match_dict[smart_str(k)] = v
+        return ResolverMatch(sub_match.func, sub_match.args, sub_match_dict, sub_match.url_name, self.app_name or sub_match.app_name, [self.namespace] + sub_match.namespaces)
+
     def resolve(self, path):
-        tried = []
         match = self.regex.search(path)
         if match:
             new_path = path[match.end():]
-            for pattern in self.url_patterns:
+            index = self.resolve_index
+            # Only try the patterns whose literal prefix matches the path.
+            for prefix, pattern in index.get(new_path[:1], index[None]):
+                if not new_path.startswith(prefix):
+                    continue
                 try:
                     sub_match = pattern.resolve(new_path)
-                except Resolver404, e:
-                    sub_tried = e.args[0].get('tried')
-                    if sub_tried is not None:
-                        tried.extend([[pattern] + t for t in sub_tried])
-                    else:
-                        tried.append([pattern])
-                else:
-                    if sub_match:
-                        sub_match_dict = dict([(smart_str(k), v) for k, v in match.groupdict().items()])
-                        sub_match_dict.update(self.default_kwargs)
-                        for k, v in sub_match.kwargs.iteritems():
-                            sub_match_dict[smart_str(k)] = v
-                        return ResolverMatch(sub_match.func, sub_match.args, sub_match_dict, sub_match.url_name, self.app_name or sub_match.app_name, [self.namespace] + sub_match.namespaces)
-                    tried.append([pattern])
-            raise Resolver404({'tried': tried, 'path': new_path})
+                except Resolver404:
+                    continue
+                if sub_match:
+                    return self._sub_match(match, sub_match)
+            raise Resolver404(TriedPatterns(self, path, new_path))
         raise Resolver404({'path' : path})
 
+    def _resolve_all(self, path):
+        """
+        Returns the list of the patterns tried to resolve a path that matches
+        this resolver's regex but none of its patterns, each as the list of
+        the nested patterns leading to it.
+        """
+        tried = []
+        new_path = path[self.regex.search(path).end():]
+        for pattern in self.url_patterns:
+            try:
+                pattern.resolve(new_path)
+            except Resolver404, e:
+                sub_tried = e.args[0].get('tried')
+                if sub_tried is not None:
+                    tried.extend([[pattern] + t for t in sub_tried])
+                    continue
+            tried.append([pattern])
+        return tried
+
     def _get_urlconf_module(self):
         try:
             return self._urlconf_module
@@ -309,21 +459,38 @@ class RegexURLResolver(object):
             lookup_view = get_callable(lookup_view, True)
         except (ImportError, AttributeError), e:
             raise NoReverseMatch("Error importing '%s': %s." % (lookup_view, e))
-        possibilities = self.reverse_dict.getlist(lookup_view)
-        for possibility, pattern in possibilities:
-            for result, params in possibility:
-                if args:
-                    if len(args) != len(params):
-                        continue
-                    unicode_args = [force_unicode(val) for val in args]
-                    candidate =  result % dict(zip(params, unicode_args))
-                else:
-                    if set(kwargs.keys()) != set(params):
+        if args:
+            shape = len(args)
+        else:
+            shape = frozenset(kwargs)
+        try:
+            candidates = self._reverse_cache[lookup_view, shape]
+        except KeyError:
+            # Only keep the pattern templates that take these arguments, along
+            # with the compiled regex the result has to match.
+            candidates = []
+            for possibility, pattern in self.reverse_dict.getlist(lookup_view):
+                for result, params in possibility:
+                    if args:
+                        if len(args) != len(params):
+                            continue
+                    elif set(kwargs.keys()) != set(params):
                         continue
-                    unicode_kwargs = dict([(k, force_unicode(v)) for (k, v) in kwargs.items()])
-                    candidate = result % unicode_kwargs
-                if re.search(u'^%s' % pattern, candidate, re.UNICODE):
-                    return candidate
+                    candidates.append((result, params, re.compile(u'^%s' % pattern, re.UNICODE)))
+            if len(self._reverse_cache) >= REVERSE_CACHE_SIZE:
+                self._reverse_cache.clear()
+            self._reverse_cache[lookup_view, shape] = candidates
+        if args:
+            unicode_args = [force_unicode(val) for val in args]
+        else:
+            unicode_kwargs = dict([(k, force_unicode(v)) for (k, v) in kwargs.items()])
+        for result, params, regex in candidates:
+            if args:
+                candidate = result % dict(zip(params, unicode_args))
+            else:
+                candidate = result % unicode_kwargs
+            if regex.search(candidate):
+                return candidate
         # lookup_view can be URL label, or dotted path, or callable, Any of
         # these can be passed in at the top, but callables are not friendly in
         # error messages.
@@ -354,41 +521,58 @@ def reverse(viewname, urlconf=None, args=None, kwargs=None, prefix=None, current
     if not isinstance(viewname, basestring):
         view = viewname
     else:
-        parts = viewname.split(':')
-        parts.reverse()
-        view = parts[0]
-        path = parts[1:]
+        try:
+            view, resolver, extra = resolver._namespace_cache[viewname, current_app]
+        except KeyError:
+            view, ns_resolver, extra = _resolve_namespaces(resolver, viewname, current_app)
+            if len(resolver._namespace_cache) >= REVERSE_CACHE_SIZE:
+                resolver._namespace_cache.clear()
+            resolver._namespace_cache[viewname, current_app] = (view, ns_resolver, extra)
+            resolver = ns_resolver
+        prefix = prefix + extra
 
-        resolved_path = []
-        while path:
-            ns = path.pop()
+    return iri_to_uri(u'%s%s' % (prefix, resolver.reverse(view,
+            *args, **kwargs)))
 
-            # Lookup the name to see if it could be an app identifier
-            try:
-                app_list = resolver.app_dict[ns]
-                # Yes! Path part matches an app in the current Resolver
-                if current_app and current_app in app_list:
-                    # If we are reversing for a particular app, use that namespace
-                    ns = current_app
-                elif ns not in app_list:
-                    # The name isn't shared by one of the instances (i.e., the default)
-                    # so just pick the first instance as the default.
-                    ns = app_list[0]
-            except KeyError:
-                pass
+def _resolve_namespaces(resolver, viewname, current_app):
+    """
+    Splits a possibly namespaced view name into the view name proper, the
+    resolver for its namespace and the path prefix leading to that resolver.
+    """
+    parts = viewname.split(':')
+    parts.reverse()
+    view = parts[0]
+    path = parts[1:]
 
-            try:
-                extra, resolver = resolver.namespace_dict[ns]
-                resolved_path.append(ns)
-                prefix = prefix + extra
-            except KeyError, key:
-                if resolved_path:
-                    raise NoReverseMatch("%s is not a registered namespace inside '%s'" % (key, ':'.join(resolved_path)))
-                else:
-                    raise NoReverseMatch("%s is not a registered namespace" % key)
+    resolved_path = []
+    extra = u''
+    while path:
+        ns = path.pop()
 
-    return iri_to_uri(u'%s%s' % (prefix, resolver.reverse(view,
-            *args, **kwargs)))
+        # Lookup the name to see if it could be an app identifier
+        try:
+            app_list = resolver.app_dict[ns]
+            # Yes! Path part matches an app in the current Resolver
+            if current_app and current_app in app_list:
+                # If we are reversing for a particular app, use that namespace
+                ns = current_app
+            elif ns not in app_list:
+                # The name isn't shared by one of the instances (i.e., the default)
+                # so just pick the first instance as the default.
+                ns = app_list[0]
+        except KeyError:
+            pass
+
+        try:
+            ns_extra, resolver = resolver.namespace_dict[ns]
+            resolved_path.append(ns)
+            extra = extra + ns_extra
+        except KeyError, key:
+            if resolved_path:
+                raise NoReverseMatch("%s is not a registered namespace inside '%s'" % (key, ':'.join(resolved_path)))
+            else:
+                raise NoReverseMatch("%s is not a registered namespace" % key)
+    return view, resolver, extra
 
 def clear_url_caches():
     global _resolver_cache
@@ -85,11 +85,13 @@ def close_connection(**kwargs):
         conn.close()
 signals.request_finished.connect(close_connection)
 
-# Register an event that resets connection.queries
+# Register an event that resets connection.queries and connection.query_stats
 # when a Django request is started.
 def reset_queries(**kwargs):
     for conn in connections.all():
         conn.queries = []
+        if conn.query_stats is not None:
+            conn.query_stats.reset()
 signals.request_started.connect(reset_queries)
 
 # Register an event that rolls back the connections
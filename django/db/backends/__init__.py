@@ -6,6 +6,7 @@ except ImportError:
 from threading import local
 
 from django.conf import settings
+from django.core import timing
 from django.db import DEFAULT_DB_ALIAS
 from django.db.backends import util
 from django.db.transaction import TransactionManagementError
@@ -29,6 +30,11 @@ class BaseDatabaseWrapper(local):
         self.settings_dict = settings_dict
         self.alias = alias
         self.use_debug_cursor = None
+        if settings.QUERY_STATS:
+            self.query_stats = util.QueryStats(settings.QUERY_STATS_SLOWEST,
+                                               settings.QUERY_STATS_HISTORY)
+        else:
+            self.query_stats = None
 
         # Transaction related attributes
         self.transaction_state = []
@@ -250,6 +256,10 @@ class BaseDatabaseWrapper(local):
             cursor = self.make_debug_cursor(self._cursor())
         else:
             cursor = util.CursorWrapper(self._cursor(), self)
+        if self.query_stats is not None:
+            cursor = util.CursorStatsWrapper(cursor, self)
+        if timing.get_timer() is not None:
+            cursor = util.CursorTimingWrapper(cursor, self)
         return cursor
 
     def make_debug_cursor(self, cursor):
@@ -1,7 +1,9 @@
 import datetime
 import decimal
+import heapq
 from time import time
 
+from django.core import timing
 from django.utils.hashcompat import md5_constructor
 from django.utils.log import getLogger
 
@@ -60,6 +62,155 @@ class CursorDebugWrapper(CursorWrapper):
             )
 
 
+class QueryStats(object):
+    """
+    Statistics on the queries run on a connection since the last reset()
+    (i.e. during the current request), cheap enough to be always collected:
+
+        count, time
+            The number of queries and the total time they took, in seconds.
+
+        statements
+            { sql : [count, time] }
+            The number of times each statement was run, with any parameters,
+            and the total time it took. Statements run many times usually
+            come from a loop doing one query per object (the N+1 queries
+            problem). Only the first max_statements distinct statements are
+            kept.
+
+        slowest()
+            The slowest queries.
+
+        duplicates()
+            The queries run more than once with the same parameters, among
+            the most recent ones.
+
+    The slowest queries are kept in a heap, and the most recent ones in a
+    ring buffer, so the memory used is bounded however many queries are run.
+    """
+    def __init__(self, slowest=10, history=100, max_statements=1000):
+        self.max_slowest = slowest
+        self.history = history
+        self.max_statements = max_statements
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.time = 0.0
+        self.statements = {}
+        self._slowest = []
+        self._recent = [None] * self.history
+        self._recent_index = 0
+
+    def record(self, sql, params, duration):
+        if params is None:
+            # cursor.execute(sql) runs a query without parameters.
+            params = ()
+        self.count += 1
+        self.time += duration
+        statement = self.statements.get(sql)
+        if statement is not None:
+            statement[0] += 1
+            statement[1] += duration
+        elif len(self.statements) < self.max_statements:
+            self.statements[sql] = [1, duration]
+        if len(self._slowest) < self.max_slowest:
+            heapq.heappush(self._slowest, (duration, sql, params))
+        elif self._slowest and duration > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, (duration, sql, params))
+        if self.history:
+            self._recent[self._recent_index] = (sql, params, duration)
+            self._recent_index = (self._recent_index + 1) % self.history
+
+    def slowest(self):
+        "Returns (duration, sql, params) tuples for the slowest queries, slowest first."
+        slowest = list(self._slowest)
+        slowest.sort(reverse=True)
+        return slowest
+
+    def recent(self):
+        "Returns (sql, params, duration) tuples for the most recent queries, oldest first."
+        index = self._recent_index
+        return [query for query in self._recent[index:] + self._recent[:index] if query is not None]
+
+    def repeated(self, threshold=2):
+        """
+        Returns (count, time, sql) tuples for the statements run at least
+        threshold times, most frequent first.
+        """
+        repeated = [(count, duration, sql) for sql, (count, duration) in self.statements.items()
+                    if count >= threshold]
+        repeated.sort(reverse=True)
+        return repeated
+
+    def duplicates(self):
+        """
+        Returns (count, sql, params) tuples for the recent queries that were
+        run more than once with the same parameters, most frequent first.
+        """
+        counts = {}
+        queries = {}
+        for sql, params, duration in self.recent():
+            try:
+                if isinstance(params, dict):
+                    # The pyformat parameter style.
+                    key = (sql, tuple(sorted(params.items())))
+                else:
+                    key = (sql, tuple(params))
+                counts[key] = counts.get(key, 0) + 1
+            except TypeError:
+                # Unhashable parameter values.
+                continue
+            queries[key] = (sql, params)
+        duplicates = [(count,) + queries[key] for key, count in counts.items() if count > 1]
+        duplicates.sort(reverse=True)
+        return duplicates
+
+
+class CursorStatsWrapper(CursorWrapper):
+    "Records each query in the connection's QueryStats."
+    def execute(self, sql, params=None):
+        start = time()
+        try:
+            if params is None:
+                # Leave the SQL as it is, e.g. its % signs, like the driver
+                # does for queries without parameters.
+                return self.cursor.execute(sql)
+            return self.cursor.execute(sql, params)
+        finally:
+            self.db.query_stats.record(sql, params, time() - start)
+
+    def executemany(self, sql, param_list):
+        start = time()
+        try:
+            return self.cursor.executemany(sql, param_list)
+        finally:
+            self.db.query_stats.record(sql, (), time() - start)
+
+
+class CursorTimingWrapper(CursorWrapper):
+    """
+    Times the queries as 'db' for the request being timed; see
+    django.core.timing.
+    """
+    def execute(self, sql, params=None):
+        if params is None:
+            return timing.call(timing.get_timer(), 'db', self.cursor.execute, sql)
+        return timing.call(timing.get_timer(), 'db', self.cursor.execute, sql, params)
+
+    def executemany(self, sql, param_list):
+        return timing.call(timing.get_timer(), 'db', self.cursor.executemany, sql, param_list)
+
+    def fetchone(self):
+        return timing.call(timing.get_timer(), 'db', self.cursor.fetchone)
+
+    def fetchmany(self, *args):
+        return timing.call(timing.get_timer(), 'db', self.cursor.fetchmany, *args)
+
+    def fetchall(self):
+        return timing.call(timing.get_timer(), 'db', self.cursor.fetchall)
+
+
 ###############################################
 # Converters from database (string) to Python #
 ###############################################
@@ -274,7 +274,10 @@ class Model(object):
 
     def __init__(self, *args, **kwargs):
         self._entity_exists = kwargs.pop('__entity_exists', False)
-        signals.pre_init.send(sender=self.__class__, args=args, kwargs=kwargs)
+        # Instances are created for every row fetched: don't even build the
+        # signals' arguments when nobody listens.
+        if signals.pre_init.has_listeners(self.__class__):
+            signals.pre_init.send(sender=self.__class__, args=args, kwargs=kwargs)
 
         # Set up the storage for instance state
         self._state = ModelState()
@@ -365,7 +368,8 @@ class Model(object):
                 raise TypeError("'%s' is an invalid keyword argument for this function" % kwargs.keys()[0])
         self._original_pk = self.pk if self._meta.pk is not None else None
         super(Model, self).__init__()
-        signals.post_init.send(sender=self.__class__, instance=self)
+        if signals.post_init.has_listeners(self.__class__):
+            signals.post_init.send(sender=self.__class__, instance=self)
 
     def __repr__(self):
         try:
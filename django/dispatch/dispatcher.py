@@ -10,6 +10,11 @@ def _make_id(target):
         return (id(target.im_self), id(target.im_func))
     return id(target)
 
+# The number of senders whose receivers a Signal remembers. Past that, the
+# cache is emptied, so signals sent by many short-lived objects don't make it
+# grow forever.
+MAX_CACHED_SENDERS = 1000
+
 class Signal(object):
     """
     Base class for all signals
@@ -17,7 +22,13 @@ class Signal(object):
     Internal attributes:
     
         receivers
-            { receriverkey (id) : weakref(receiver) }
+            [ ((receiverkey (id), senderkey (id)), weakref(receiver)), ... ]
+
+        sender_receivers_cache
+            { senderkey (id) : [ weakref(receiver), ... ] }
+            The receivers connected to each sender (or to any sender) that
+            sent the signal since the receivers last changed, so send() doesn't
+            scan every receiver each time.
     """
     
     def __init__(self, providing_args=None):
@@ -28,10 +39,14 @@ class Signal(object):
             A list of the arguments this signal can pass along in a send() call.
         """
         self.receivers = []
+        self.sender_receivers_cache = {}
         if providing_args is None:
             providing_args = []
         self.providing_args = set(providing_args)
         self.lock = threading.Lock()
+        # Set when a weakly referenced receiver was garbage collected but
+        # couldn't be removed right away.
+        self._dead_receivers = False
 
     def connect(self, receiver, sender=None, weak=True, dispatch_uid=None):
         """
@@ -101,11 +116,14 @@ class Signal(object):
 
         self.lock.acquire()
         try:
+            if self._dead_receivers:
+                self._clear_dead_receivers()
             for r_key, _ in self.receivers:
                 if r_key == lookup_key:
                     break
             else:
                 self.receivers.append((lookup_key, receiver))
+                self.sender_receivers_cache.clear()
         finally:
             self.lock.release()
 
@@ -138,14 +156,28 @@ class Signal(object):
         
         self.lock.acquire()
         try:
+            if self._dead_receivers:
+                self._clear_dead_receivers()
             for index in xrange(len(self.receivers)):
                 (r_key, _) = self.receivers[index]
                 if r_key == lookup_key:
                     del self.receivers[index]
+                    self.sender_receivers_cache.clear()
                     break
         finally:
             self.lock.release()
 
+    def has_listeners(self, sender=None):
+        """
+        Returns whether any live receiver would get the signal sent by sender.
+
+        This is cheap enough for code sending signals in hot paths to skip
+        building the signal's arguments when nobody listens.
+        """
+        if not self.receivers:
+            return False
+        return bool(self._live_receivers(_make_id(sender)))
+
     def send(self, sender, **named):
         """
         Send signal from sender to all connected receivers.
@@ -218,38 +250,76 @@ class Signal(object):
         This checks for weak references and resolves them, then returning only
         live receivers.
         """
+        if self._dead_receivers:
+            self.lock.acquire()
+            try:
+                self._clear_dead_receivers()
+            finally:
+                self.lock.release()
+        receivers = self.sender_receivers_cache.get(senderkey)
+        if receivers is None:
+            receivers = self._match_receivers(senderkey)
+        live_receivers = []
+        for receiver in receivers:
+            if isinstance(receiver, WEAKREF_TYPES):
+                # Dereference the weak reference.
+                receiver = receiver()
+                if receiver is not None:
+                    live_receivers.append(receiver)
+            else:
+                live_receivers.append(receiver)
+        return live_receivers
+
+    def _match_receivers(self, senderkey):
+        """
+        Returns the (possibly weak references to) receivers connected to the
+        sender with senderkey or to any sender, and caches them.
+
+        The cache only holds the references, not the receivers themselves, so
+        it doesn't keep weakly referenced receivers alive; it is emptied
+        whenever a receiver is connected, disconnected or garbage collected.
+        """
         none_senderkey = _make_id(None)
-        receivers = []
-
-        for (receiverkey, r_senderkey), receiver in self.receivers:
-            if r_senderkey == none_senderkey or r_senderkey == senderkey:
-                if isinstance(receiver, WEAKREF_TYPES):
-                    # Dereference the weak reference.
-                    receiver = receiver()
-                    if receiver is not None:
-                        receivers.append(receiver)
-                else:
+        self.lock.acquire()
+        try:
+            receivers = []
+            for (receiverkey, r_senderkey), receiver in self.receivers:
+                if r_senderkey == none_senderkey or r_senderkey == senderkey:
                     receivers.append(receiver)
+            if len(self.sender_receivers_cache) >= MAX_CACHED_SENDERS:
+                self.sender_receivers_cache.clear()
+            self.sender_receivers_cache[senderkey] = receivers
+        finally:
+            self.lock.release()
         return receivers
 
-    def _remove_receiver(self, receiver):
+    def _clear_dead_receivers(self):
         """
-        Remove dead receivers from connections.
+        Remove dead receivers from connections. The lock must be held.
         """
+        self._dead_receivers = False
+        self.receivers = [(key, receiver) for key, receiver in self.receivers
+                          if not (isinstance(receiver, WEAKREF_TYPES) and receiver() is None)]
+        self.sender_receivers_cache.clear()
 
-        self.lock.acquire()
+    def _remove_receiver(self, receiver):
+        """
+        Remove a dead receiver from connections, or leave that to the next
+        connect(), disconnect() or send() if the lock is taken.
+
+        This is called when a receiver is garbage collected, which can happen
+        while this very thread holds the lock: it must never wait for it.
+        """
+        if not self.lock.acquire(False):
+            self._dead_receivers = True
+            return
         try:
-            to_remove = []
-            for key, connected_receiver in self.receivers:
-                if connected_receiver == receiver:
-                    to_remove.append(key)
-            for key in to_remove:
-                last_idx = len(self.receivers) - 1
-                # enumerate in reverse order so that indexes are valid even
-                # after we delete some items
-                for idx, (r_key, _) in enumerate(reversed(self.receivers)):
-                    if r_key == key:
-                        del self.receivers[last_idx-idx]
+            # This may run at interpreter shutdown, when module globals are
+            # gone: only remove the receiver we were told about.
+            self.receivers = [(key, connected_receiver)
+                              for key, connected_receiver in self.receivers
+                              if connected_receiver != receiver]
+            self.sender_receivers_cache.clear()
         finally:
             self.lock.release()
 
@@ -3,23 +3,12 @@ import os
 import re
 import time
 from pprint import pformat
-from urllib import urlencode, quote
+from urllib import urlencode, quote, unquote
 from urlparse import urljoin
 try:
     from cStringIO import StringIO
 except ImportError:
     from StringIO import StringIO
-try:
-    # The mod_python version is more efficient, so try importing it first.
-    from mod_python.util import parse_qsl
-except ImportError:
-    try:
-        # Python 2.6 and greater
-        from urlparse import parse_qsl
-    except ImportError:
-        # Python 2.5, 2.4.  Works on Python 2.6 but raises
-        # PendingDeprecationWarning
-        from cgi import parse_qsl
 
 import Cookie
 # httponly support exists in Python 2.6's Cookie library,
@@ -117,6 +106,7 @@ class CompatCookie(SimpleCookie):
         warnings.warn("CompatCookie is deprecated, use django.http.SimpleCookie instead.",
                       PendingDeprecationWarning)
 
+from django.core.exceptions import ImproperlyConfigured, TooManyFieldsSent
 from django.utils.datastructures import MultiValueDict, ImmutableList
 from django.utils.encoding import smart_str, iri_to_uri, force_unicode
 from django.utils.http import cookie_date
@@ -310,6 +300,59 @@ class HttpRequest(object):
     def readlines(self):
         return list(iter(self))
 
+def parse_query_string(query_string, encoding, max_num_fields=None):
+    """
+    Parses a query string (or an application/x-www-form-urlencoded request
+    body) into a dictionary of lists of values, the way parse_qsl does with
+    keep_blank_values=True. Keys and values are decoded from the given
+    encoding to unicode.
+
+    Raises TooManyFieldsSent if there are more than max_num_fields fields.
+    """
+    if not query_string:
+        return {}
+    if max_num_fields is not None:
+        # Count the fields before splitting anything, so that an oversized
+        # query string costs next to nothing.
+        num_fields = query_string.count('&') + query_string.count(';') + 1
+        if num_fields > max_num_fields:
+            raise TooManyFieldsSent(
+                'The number of GET/POST parameters exceeded '
+                'settings.DATA_UPLOAD_MAX_NUMBER_FIELDS.')
+    if ';' in query_string:
+        pairs = query_string.replace(';', '&').split('&')
+    else:
+        pairs = query_string.split('&')
+    is_str = isinstance(query_string, str)
+    lists = {}
+    for pair in pairs:
+        if not pair:
+            continue
+        nv = pair.split('=', 1)
+        key = nv[0]
+        if len(nv) == 2:
+            value = nv[1]
+        else:
+            value = ''
+        # Most keys and many values don't need unquoting at all.
+        if '+' in key:
+            key = key.replace('+', ' ')
+        if '%' in key:
+            key = unquote(key)
+        if '+' in value:
+            value = value.replace('+', ' ')
+        if '%' in value:
+            value = unquote(value)
+        if is_str:
+            key = key.decode(encoding, 'replace')
+            value = value.decode(encoding, 'replace')
+        values = lists.get(key)
+        if values is None:
+            lists[key] = [value]
+        else:
+            values.append(value)
+    return lists
+
 class QueryDict(MultiValueDict):
     """
     A specialized MultiValueDict that takes a query string when initialized.
@@ -317,6 +360,9 @@ class QueryDict(MultiValueDict):
 
     Values retrieved from this class are converted from the given encoding
     (DEFAULT_CHARSET by default) to unicode.
+
+    At most DATA_UPLOAD_MAX_NUMBER_FIELDS fields are accepted in the query
+    string; TooManyFieldsSent is raised if there are more.
     """
     # These are both reset in __init__, but is specified here at the class
     # level so that unpickling will have valid values
@@ -325,15 +371,15 @@ class QueryDict(MultiValueDict):
 
     def __init__(self, query_string, mutable=False, encoding=None):
         MultiValueDict.__init__(self)
+        # *Important*: do not import settings any earlier because of note
+        # in core.handlers.modpython.
+        from django.conf import settings
         if not encoding:
-            # *Important*: do not import settings any earlier because of note
-            # in core.handlers.modpython.
-            from django.conf import settings
             encoding = settings.DEFAULT_CHARSET
         self.encoding = encoding
-        for key, value in parse_qsl((query_string or ''), True): # keep_blank_values=True
-            self.appendlist(force_unicode(key, encoding, errors='replace'),
-                            force_unicode(value, encoding, errors='replace'))
+        if query_string:
+            dict.update(self, parse_query_string(query_string, encoding,
+                                                 settings.DATA_UPLOAD_MAX_NUMBER_FIELDS))
         self._mutable = mutable
 
     def _get_encoding(self):
@@ -596,8 +642,12 @@ class HttpResponse(object):
         return smart_str(''.join(self._container), self._charset)
 
     def _set_content(self, value):
-        self._container = [value]
-        self._is_string = True
+        if not isinstance(value, basestring) and hasattr(value, '__iter__'):
+            self._container = value
+            self._is_string = False
+        else:
+            self._container = [value]
+            self._is_string = True
 
     content = property(_get_content, _set_content)
 
@@ -630,6 +680,131 @@ class HttpResponse(object):
             raise Exception("This %s instance cannot tell its position" % self.__class__)
         return sum([len(chunk) for chunk in self._container])
 
+class FileChunks(object):
+    """
+    The content of a FileResponse: length bytes of a file from position
+    start, read block_size bytes at a time. It can be iterated over again,
+    as long as the file is seekable.
+    """
+    def __init__(self, file, start, length, block_size):
+        self.file = file
+        self.start = start
+        self.length = length
+        self.block_size = block_size
+
+    def __iter__(self):
+        if hasattr(self.file, 'seek'):
+            self.file.seek(self.start)
+        remaining = self.length
+        while remaining is None or remaining > 0:
+            if remaining is None:
+                data = self.file.read(self.block_size)
+            else:
+                data = self.file.read(min(self.block_size, remaining))
+                remaining -= len(data)
+            if not data:
+                break
+            yield data
+
+    def close(self):
+        self.file.close()
+
+class FileResponse(HttpResponse):
+    """
+    An HTTP response streaming the content of a file, which is closed once
+    the response has been sent.
+
+    The file is never read into memory at once: it's handed to the WSGI
+    server's wsgi.file_wrapper when possible, read in blocks otherwise, or,
+    with the SENDFILE_HEADER setting, left to the web server to send.
+    """
+    block_size = 8192
+
+    def __init__(self, file, mimetype=None, status=None, content_type=None):
+        super(FileResponse, self).__init__(mimetype=mimetype, status=status,
+                                           content_type=content_type)
+        self.file = file
+        try:
+            self.size = os.fstat(file.fileno()).st_size
+        except (AttributeError, OSError, ValueError):
+            self.size = getattr(file, 'size', None)
+        self.sendfile_location = self._get_sendfile_location()
+        if self.sendfile_location is not None:
+            # The web server sends the file, and handles Range requests.
+            self[settings.SENDFILE_HEADER] = self.sendfile_location
+            self.size = None
+            file.close()
+            self._chunks = []
+        else:
+            self._chunks = FileChunks(file, 0, self.size, self.block_size)
+            if self.size is not None:
+                self['Content-Length'] = str(self.size)
+                self['Accept-Ranges'] = 'bytes'
+        self.content = self._chunks
+
+    def __getstate__(self):
+        """
+        Pickles the content of the file rather than the file, so that the
+        response can be cached, e.g. by the cache middleware.
+        """
+        content = self.content
+        if not hasattr(self.file, 'seek'):
+            # The file can't be read again to send the response.
+            self.content = content
+        state = self.__dict__.copy()
+        state.pop('_iterator', None)
+        state['_container'] = [content]
+        state['_is_string'] = True
+        state['file'] = None
+        state['_chunks'] = []
+        return state
+
+    def _get_sendfile_location(self):
+        """
+        Returns the value of the SENDFILE_HEADER header for the file, or None
+        if it isn't sent by the web server.
+        """
+        if not settings.SENDFILE_HEADER or not hasattr(self.file, 'name'):
+            return None
+        if settings.SENDFILE_URL is not None and not settings.SENDFILE_ROOT:
+            raise ImproperlyConfigured("The SENDFILE_URL setting requires SENDFILE_ROOT to be set.")
+        path = os.path.abspath(self.file.name)
+        if settings.SENDFILE_ROOT:
+            root = os.path.join(os.path.abspath(settings.SENDFILE_ROOT), '')
+            if not path.startswith(root):
+                return None
+            if settings.SENDFILE_URL is not None:
+                # e.g. X-Accel-Redirect, which takes an internal URL.
+                path = path[len(root):].replace(os.sep, '/')
+                return settings.SENDFILE_URL + quote(smart_str(path))
+        return smart_str(path)
+
+    def set_range(self, first, last):
+        """
+        Makes the response a 206 Partial Content response holding the bytes
+        from position first to position last of the file, inclusive.
+        """
+        self.status_code = 206
+        self['Content-Range'] = 'bytes %d-%d/%d' % (first, last, self.size)
+        self['Content-Length'] = str(last - first + 1)
+        self._chunks.start = first
+        self._chunks.length = last - first + 1
+
+    def get_file_to_stream(self):
+        """
+        Returns the file, positioned where the content starts, if the content
+        is the rest of the file, unchanged by middleware, so that a
+        wsgi.file_wrapper can send it. Returns None otherwise.
+        """
+        if (self.sendfile_location is not None or self._container is not self._chunks
+                or not hasattr(self.file, 'fileno')):
+            return None
+        chunks = self._chunks
+        if chunks.length is not None and chunks.start + chunks.length != self.size:
+            return None
+        self.file.seek(chunks.start)
+        return self.file
+
 class HttpResponseRedirect(HttpResponse):
     status_code = 302
 
@@ -7,7 +7,7 @@ file upload handlers for processing.
 
 import cgi
 from django.conf import settings
-from django.core.exceptions import SuspiciousOperation
+from django.core.exceptions import SuspiciousOperation, TooManyFieldsSent
 from django.utils.datastructures import MultiValueDict
 from django.utils.encoding import force_unicode
 from django.utils.text import unescape_entities
@@ -86,6 +86,9 @@ class MultiPartParser(object):
         # the chunk size should be < 2^31, but still divisible by 4.
         possible_sizes = [x.chunk_size for x in upload_handlers if x.chunk_size]
         self._chunk_size = min([2**31-4] + possible_sizes)
+        # The input is read in blocks of at least FILE_UPLOAD_READ_SIZE bytes,
+        # which are split into chunk_size chunks for the handlers.
+        self._read_size = max(self._chunk_size, settings.FILE_UPLOAD_READ_SIZE)
 
         self._meta = META
         self._encoding = encoding or settings.DEFAULT_CHARSET
@@ -123,14 +126,16 @@ class MultiPartParser(object):
         self._files = MultiValueDict()
 
         # Instantiate the parser and stream:
-        stream = LazyStream(ChunkIter(limited_input_data, self._chunk_size))
+        stream = LazyStream(ChunkIter(limited_input_data, self._read_size))
 
         # Whether or not to signal a file-completion at the beginning of the loop.
         old_field_name = None
         counters = [0] * len(handlers)
+        max_num_fields = settings.DATA_UPLOAD_MAX_NUMBER_FIELDS
+        num_fields = 0
 
         try:
-            for item_type, meta_data, field_stream in Parser(stream, self._boundary):
+            for item_type, meta_data, field_stream in Parser(stream, self._boundary, self._chunk_size):
                 if old_field_name:
                     # We run this at the beginning of the next loop
                     # since we cannot be sure a file is complete until
@@ -148,6 +153,13 @@ class MultiPartParser(object):
                 field_name = force_unicode(field_name, encoding, errors='replace')
 
                 if item_type == FIELD:
+                    # Avoid reading more than DATA_UPLOAD_MAX_NUMBER_FIELDS.
+                    num_fields += 1
+                    if max_num_fields is not None and num_fields > max_num_fields:
+                        raise TooManyFieldsSent(
+                            'The number of GET/POST parameters exceeded '
+                            'settings.DATA_UPLOAD_MAX_NUMBER_FIELDS.')
+
                     # This is a post field, we can just set it in the post
                     if transfer_encoding == 'base64':
                         raw_data = field_stream.read()
@@ -259,6 +271,11 @@ class LazyStream(object):
     Given a producer object (an iterator that yields bytestrings), the
     LazyStream object will support iteration, reading, and keeping a "look-back"
     variable in case you need to "unget" some bytes.
+
+    The bytes taken from the producer are kept in a buffer along with the
+    offset of the first unread one, so that reading a few bytes at a time, or
+    looking for a boundary with fill() and consume(), doesn't copy the rest of
+    the buffer each time.
     """
     def __init__(self, producer, length=None):
         """
@@ -268,8 +285,8 @@ class LazyStream(object):
         is called.
         """
         self._producer = producer
-        self._empty = False
-        self._leftover = ''
+        self._buffer = ''
+        self._offset = 0
         self.length = length
         self.position = 0
         self._remaining = length
@@ -278,28 +295,44 @@ class LazyStream(object):
     def tell(self):
         return self.position
 
+    def fill(self, size):
+        """
+        Buffers at least size unread bytes, or as many as are left in the
+        stream, without consuming them. Returns the buffer and the offset of
+        the first unread byte in it.
+        """
+        available = len(self._buffer) - self._offset
+        if available < size:
+            chunks = []
+            if available:
+                chunks.append(self._buffer[self._offset:])
+            for chunk in self._producer:
+                chunks.append(chunk)
+                available += len(chunk)
+                if available >= size:
+                    break
+            if len(chunks) == 1:
+                self._buffer = chunks[0]
+            else:
+                self._buffer = ''.join(chunks)
+            self._offset = 0
+            self._unget_history = []
+        return self._buffer, self._offset
+
+    def consume(self, size):
+        "Marks the next size buffered bytes as read."
+        self._offset += size
+        self.position += size
+
     def read(self, size=None):
-        def parts():
-            remaining = (size is not None and [size] or [self._remaining])[0]
-            # do the whole thing in one shot if no limit was provided.
-            if remaining is None:
-                yield ''.join(self)
-                return
-
-            # otherwise do some bookkeeping to return exactly enough
-            # of the stream and stashing any extra content we get from
-            # the producer
-            while remaining != 0:
-                assert remaining > 0, 'remaining bytes to read should never go negative'
-
-                chunk = self.next()
-
-                emitting = chunk[:remaining]
-                self.unget(chunk[remaining:])
-                remaining -= len(emitting)
-                yield emitting
-
-        out = ''.join(parts())
+        if size is None:
+            size = self._remaining
+        # do the whole thing in one shot if no limit was provided.
+        if size is None:
+            return ''.join(self)
+        buffer, offset = self.fill(size)
+        out = buffer[offset:offset + size]
+        self.consume(len(out))
         return out
 
     def next(self):
@@ -310,9 +343,13 @@ class LazyStream(object):
         from the iterator instead. Useful to avoid unnecessary bookkeeping if
         performance is an issue.
         """
-        if self._leftover:
-            output = self._leftover
-            self._leftover = ''
+        if self._offset < len(self._buffer):
+            if self._offset:
+                output = self._buffer[self._offset:]
+            else:
+                output = self._buffer
+            self._buffer = ''
+            self._offset = 0
         else:
             output = self._producer.next()
             self._unget_history = []
@@ -342,7 +379,8 @@ class LazyStream(object):
             return
         self._update_unget_history(len(bytes))
         self.position -= len(bytes)
-        self._leftover = ''.join([bytes, self._leftover])
+        self._buffer = ''.join([bytes, self._buffer[self._offset:]])
+        self._offset = 0
 
     def _update_unget_history(self, num_bytes):
         """
@@ -411,16 +449,17 @@ class InterBoundaryIter(object):
     """
     A Producer that will iterate over boundaries.
     """
-    def __init__(self, stream, boundary):
+    def __init__(self, stream, boundary, chunk_size=None):
         self._stream = stream
         self._boundary = boundary
+        self._chunk_size = chunk_size
 
     def __iter__(self):
         return self
 
     def next(self):
         try:
-            return LazyStream(BoundaryIter(self._stream, self._boundary))
+            return LazyStream(BoundaryIter(self._stream, self._boundary, self._chunk_size))
         except InputStreamExhausted:
             raise StopIteration()
 
@@ -429,32 +468,33 @@ class BoundaryIter(object):
     A Producer that is sensitive to boundaries.
 
     Will happily yield bytes until a boundary is found. Will yield the bytes
-    before the boundary, throw away the boundary bytes themselves, and push the
-    post-boundary bytes back on the stream.
+    before the boundary, throw away the boundary bytes themselves, and leave
+    the post-boundary bytes on the stream.
+
+    The boundary is searched for in the stream's buffer, as large as a read
+    from the input, and the bytes before it are yielded in chunks of at most
+    chunk_size bytes.
 
     The future calls to .next() after locating the boundary will raise a
     StopIteration exception.
     """
 
-    def __init__(self, stream, boundary):
+    def __init__(self, stream, boundary, chunk_size=None):
         self._stream = stream
         self._boundary = boundary
+        self._chunk_size = chunk_size
         self._done = False
         # rollback an additional six bytes because the format is like
         # this: CRLF<boundary>[--CRLF]
         self._rollback = len(boundary) + 6
+        # The buffer last searched for the boundary, and what was found, so
+        # that a buffer split into several chunks is only searched once.
+        self._searched = None
+        self._match = None
 
-        # Try to use mx fast string search if available. Otherwise
-        # use Python find. Wrap the latter for consistency.
-        unused_char = self._stream.read(1)
-        if not unused_char:
+        buffer, offset = stream.fill(1)
+        if offset == len(buffer):
             raise InputStreamExhausted()
-        self._stream.unget(unused_char)
-        try:
-            from mx.TextTools import FS
-            self._fs = FS(boundary).find
-        except ImportError:
-            self._fs = lambda data: data.find(boundary)
 
     def __iter__(self):
         return self
@@ -466,43 +506,39 @@ class BoundaryIter(object):
         stream = self._stream
         rollback = self._rollback
 
-        bytes_read = 0
-        chunks = []
-        for bytes in stream:
-            bytes_read += len(bytes)
-            chunks.append(bytes)
-            if bytes_read > rollback:
-                break
-            if not bytes:
-                break
-        else:
-            self._done = True
-
-        if not chunks:
+        buffer, start = stream.fill(rollback + 1)
+        size = len(buffer)
+        if start == size:
             raise StopIteration()
 
-        chunk = ''.join(chunks)
-        boundary = self._find_boundary(chunk, len(chunk) < self._rollback)
-
+        if buffer is not self._searched:
+            self._searched = buffer
+            self._match = self._find_boundary(buffer, start)
+        boundary = self._match
         if boundary:
             end, next = boundary
-            stream.unget(chunk[next:])
+            if self._chunk_size is None or end - start <= self._chunk_size:
+                stream.consume(next - start)
+                self._done = True
+                return buffer[start:end]
+            stop = start + self._chunk_size
+        elif size - start <= rollback:
+            # There's nothing left, we should just return and mark as done.
+            stream.consume(size - start)
             self._done = True
-            return chunk[:end]
+            return buffer[start:]
         else:
             # make sure we dont treat a partial boundary (and
             # its separators) as data
-            if not chunk[:-rollback]:# and len(chunk) >= (len(self._boundary) + 6):
-                # There's nothing left, we should just return and mark as done.
-                self._done = True
-                return chunk
-            else:
-                stream.unget(chunk[-rollback:])
-                return chunk[:-rollback]
+            stop = size - rollback
+            if self._chunk_size is not None:
+                stop = min(stop, start + self._chunk_size)
+        stream.consume(stop - start)
+        return buffer[start:stop]
 
-    def _find_boundary(self, data, eof = False):
+    def _find_boundary(self, data, start=0):
         """
-        Finds a multipart boundary in data.
+        Finds a multipart boundary in data, from position start.
 
         Should no boundry exist in the data None is returned instead. Otherwise
         a tuple containing the indices of the following are returned:
@@ -510,16 +546,16 @@ class BoundaryIter(object):
          * the end of current encapsulation
          * the start of the next encapsulation
         """
-        index = self._fs(data)
+        index = data.find(self._boundary, start)
         if index < 0:
             return None
         else:
             end = index
             next = index + len(self._boundary)
             # backup over CRLF
-            if data[max(0,end-1)] == '\n':
+            if end > start and data[end-1] == '\n':
                 end -= 1
-            if data[max(0,end-1)] == '\r':
+            if end > start and data[end-1] == '\r':
                 end -= 1
             return end, next
 
@@ -548,7 +584,8 @@ def parse_boundary_stream(stream, max_header_size):
     # Stream at beginning of header, look for end of header
     # and parse it if found. The header must fit within one
     # chunk.
-    chunk = stream.read(max_header_size)
+    buffer, offset = stream.fill(max_header_size)
+    chunk = buffer[offset:offset + max_header_size]
 
     # 'find' returns the top of these four bytes, so we'll
     # need to munch them later to prevent them from polluting
@@ -566,14 +603,13 @@ def parse_boundary_stream(stream, max_header_size):
     if header_end == -1:
         # we find no header, so we just mark this fact and pass on
         # the stream verbatim
-        stream.unget(chunk)
         return (RAW, {}, stream)
 
     header = chunk[:header_end]
 
-    # here we place any excess chunk back onto the stream, as
-    # well as throwing away the CRLFCRLF bytes from above.
-    stream.unget(chunk[header_end + 4:])
+    # here we leave any excess chunk on the stream, as well as
+    # throwing away the CRLFCRLF bytes from above.
+    stream.consume(header_end + 4)
 
     TYPE = RAW
     outdict = {}
@@ -595,17 +631,19 @@ def parse_boundary_stream(stream, max_header_size):
         outdict[name] = value, params
 
     if TYPE == RAW:
-        stream.unget(chunk)
+        stream.unget(chunk[:header_end + 4])
 
     return (TYPE, outdict, stream)
 
 class Parser(object):
-    def __init__(self, stream, boundary):
+    def __init__(self, stream, boundary, chunk_size=None):
         self._stream = stream
         self._separator = '--' + boundary
+        self._chunk_size = chunk_size
 
     def __iter__(self):
-        boundarystream = InterBoundaryIter(self._stream, self._separator)
+        boundarystream = InterBoundaryIter(self._stream, self._separator,
+                                           self._chunk_size)
         for sub_stream in boundarystream:
             # Iterate over each part
             yield parse_boundary_stream(sub_stream, 1024)
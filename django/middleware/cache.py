@@ -46,11 +46,19 @@ More details about how the caching works:
 * This middleware also sets ETag, Last-Modified, Expires and Cache-Control
   headers on the response object.
 
+* If CACHE_MIDDLEWARE_GRACE_SECONDS is set, pages are kept in the cache for
+  that many seconds after they expire. The first request to find a page
+  expired takes a lock and regenerates it, while the other requests keep
+  getting the stale page until the fresh one is stored.
+
 """
 
+import time
+
 from django.conf import settings
 from django.core.cache import get_cache, DEFAULT_CACHE_ALIAS
-from django.utils.cache import get_cache_key, learn_cache_key, patch_response_headers, get_max_age
+from django.utils.cache import (get_cached_response, get_cache_lock_key,
+    learn_cache_key, patch_response_headers, get_max_age)
 
 
 class UpdateCacheMiddleware(object):
@@ -68,6 +76,7 @@ class UpdateCacheMiddleware(object):
         self.cache_anonymous_only = getattr(settings, 'CACHE_MIDDLEWARE_ANONYMOUS_ONLY', False)
         self.cache_alias = settings.CACHE_MIDDLEWARE_ALIAS
         self.cache = get_cache(self.cache_alias)
+        self.cache_grace = settings.CACHE_MIDDLEWARE_GRACE_SECONDS
 
     def _session_accessed(self, request):
         try:
@@ -88,12 +97,33 @@ class UpdateCacheMiddleware(object):
                 return False
         return True
 
+    def _release_lock(self, request):
+        """
+        Releases the lock taken by FetchFromCacheMiddleware if this request is
+        regenerating a stale page.
+        """
+        lock_key = getattr(request, '_cache_lock_key', None)
+        if lock_key is not None:
+            self.cache.delete(lock_key)
+            del request._cache_lock_key
+
+    def _store(self, request, cache_key, response, timeout):
+        if self.cache_grace > 0:
+            # Keep the page around during the grace period, along with the
+            # time at which it becomes stale.
+            self.cache.set(cache_key, (time.time() + timeout, response), timeout + self.cache_grace)
+        else:
+            self.cache.set(cache_key, response, timeout)
+        self._release_lock(request)
+
     def process_response(self, request, response):
         """Sets the cache, if needed."""
         if not self._should_update_cache(request, response):
             # We don't need to update the cache, just return.
+            self._release_lock(request)
             return response
         if not response.status_code == 200:
+            self._release_lock(request)
             return response
         # Try to get the timeout from the "max-age" section of the "Cache-
         # Control" header before reverting to using the default cache_timeout
@@ -103,16 +133,19 @@ class UpdateCacheMiddleware(object):
             timeout = self.cache_timeout
         elif timeout == 0:
             # max-age was set to 0, don't bother caching.
+            self._release_lock(request)
             return response
         patch_response_headers(response, timeout)
         if timeout:
-            cache_key = learn_cache_key(request, response, timeout, self.key_prefix, cache=self.cache)
+            cache_key = learn_cache_key(request, response, timeout + max(self.cache_grace, 0), self.key_prefix, cache=self.cache)
             if hasattr(response, 'render') and callable(response.render):
                 response.add_post_render_callback(
-                    lambda r: self.cache.set(cache_key, r, timeout)
+                    lambda r: self._store(request, cache_key, r, timeout)
                 )
             else:
-                self.cache.set(cache_key, response, timeout)
+                self._store(request, cache_key, response, timeout)
+        else:
+            self._release_lock(request)
         return response
 
 class FetchFromCacheMiddleware(object):
@@ -129,6 +162,8 @@ class FetchFromCacheMiddleware(object):
         self.cache_anonymous_only = getattr(settings, 'CACHE_MIDDLEWARE_ANONYMOUS_ONLY', False)
         self.cache_alias = settings.CACHE_MIDDLEWARE_ALIAS
         self.cache = get_cache(self.cache_alias)
+        self.cache_grace = settings.CACHE_MIDDLEWARE_GRACE_SECONDS
+        self.headerlists = {}
 
     def process_request(self, request):
         """
@@ -139,21 +174,25 @@ class FetchFromCacheMiddleware(object):
             request._cache_update_cache = False
             return None # Don't bother checking the cache.
 
-        # try and get the cached GET response
-        cache_key = get_cache_key(request, self.key_prefix, 'GET', cache=self.cache)
-        if cache_key is None:
-            request._cache_update_cache = True
-            return None # No cache information available, need to rebuild.
-        response = self.cache.get(cache_key, None)
-        # if it wasn't found and we are looking for a HEAD, try looking just for that
-        if response is None and request.method == 'HEAD':
-            cache_key = get_cache_key(request, self.key_prefix, 'HEAD', cache=self.cache)
-            response = self.cache.get(cache_key, None)
-
+        # try and get the cached GET (or HEAD) response, along with the list
+        # of headers it varies on, in a single round trip.
+        response = get_cached_response(request, self.key_prefix, self.cache, self.headerlists)
         if response is None:
             request._cache_update_cache = True
             return None # No cache information available, need to rebuild.
 
+        if isinstance(response, tuple):
+            # A page stored with a grace period: (soft expiry, response).
+            soft_expiry, response = response
+            if soft_expiry <= time.time():
+                # The page is stale. The request that manages to take the
+                # lock rebuilds it; the others get the stale page meanwhile.
+                lock_key = get_cache_lock_key(request, self.key_prefix)
+                if self.cache.add(lock_key, True, self.cache_grace or self.cache_timeout):
+                    request._cache_update_cache = True
+                    request._cache_lock_key = lock_key
+                    return None
+
         # hit, return cached response
         request._cache_update_cache = False
         return response
@@ -201,5 +240,12 @@ class CacheMiddleware(UpdateCacheMiddleware, FetchFromCacheMiddleware):
         else:
             self.cache_anonymous_only = cache_anonymous_only
 
+        grace = kwargs.get('grace')
+        if grace is None:
+            self.cache_grace = settings.CACHE_MIDDLEWARE_GRACE_SECONDS
+        else:
+            self.cache_grace = grace
+
         self.cache = get_cache(self.cache_alias, **cache_kwargs)
         self.cache_timeout = self.cache.default_timeout
+        self.headerlists = {}
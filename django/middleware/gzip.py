@@ -1,19 +1,53 @@
 import re
 
-from django.utils.text import compress_string
+from django.conf import settings
+from django.utils.encoding import smart_str
+from django.utils.text import compress_sequence, compress_string
 from django.utils.cache import patch_vary_headers
 
 re_accepts_gzip = re.compile(r'\bgzip\b')
 
+class GZippedContent(object):
+    """
+    The gzipped content of a streaming response, compressed as the response
+    is iterated over. Closing it closes the original content.
+    """
+    def __init__(self, content, charset, compresslevel):
+        self.content = content
+        self.charset = charset
+        self.compressed = compress_sequence(self._chunks(), compresslevel)
+
+    def _chunks(self):
+        for chunk in self.content:
+            yield smart_str(chunk, self.charset)
+
+    def __iter__(self):
+        return self.compressed
+
+    def close(self):
+        if hasattr(self.content, 'close'):
+            self.content.close()
+
 class GZipMiddleware(object):
     """
     This middleware compresses content if the browser allows gzip compression.
     It sets the Vary header accordingly, so that caches will base their storage
     on the Accept-Encoding header.
+
+    Responses whose content is an iterator are compressed as they're sent,
+    chunk by chunk, rather than read into memory at once.
     """
     def process_response(self, request, response):
-        # It's not worth compressing non-OK or really short responses.
-        if response.status_code != 200 or len(response.content) < 200:
+        # It's not worth compressing non-OK or really short responses. The
+        # length of streaming responses isn't known in advance.
+        if response.status_code != 200:
+            return response
+        # The web server sends the file named by the SENDFILE_HEADER header,
+        # as it is.
+        if settings.SENDFILE_HEADER and response.has_header(settings.SENDFILE_HEADER):
+            return response
+        streaming = not response._is_string
+        if not streaming and len(response.content) < 200:
             return response
 
         patch_vary_headers(response, ('Accept-Encoding',))
@@ -32,7 +66,18 @@ class GZipMiddleware(object):
         if not re_accepts_gzip.search(ae):
             return response
 
-        response.content = compress_string(response.content)
+        if streaming:
+            response.content = GZippedContent(response._container, response._charset,
+                                              settings.GZIP_COMPRESSION_LEVEL)
+            # The length of the compressed content isn't known until it has
+            # all been sent.
+            del response['Content-Length']
+        else:
+            response.content = compress_string(response.content,
+                                               settings.GZIP_COMPRESSION_LEVEL)
+            response['Content-Length'] = str(len(response.content))
         response['Content-Encoding'] = 'gzip'
-        response['Content-Length'] = str(len(response.content))
+        # Byte ranges of the uncompressed content don't match the compressed
+        # one.
+        del response['Accept-Ranges']
         return response
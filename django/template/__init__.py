@@ -63,10 +63,10 @@ from django.template.base import (ContextPopException, InvalidTemplateLibrary,
     VariableDoesNotExist)
 
 # Template parts
-from django.template.base import (Context, FilterExpression, Lexer, Node,
-    NodeList, Parser, RequestContext, Origin, StringOrigin, Template,
-    TextNode, Token, TokenParser, Variable, VariableNode, constant_string,
-    filter_raw_string)
+from django.template.base import (Context, FilterExpression, FlatContext,
+    FlatRequestContext, Lexer, Node, NodeList, Parser, RequestContext, Origin,
+    StringOrigin, Template, TextNode, Token, TokenParser, Variable,
+    VariableNode, constant_string, filter_raw_string)
 
 # Compiling templates
 from django.template.base import (compile_string, resolve_variable,
@@ -3,7 +3,9 @@ import re
 from inspect import getargspec
 
 from django.conf import settings
-from django.template.context import Context, RequestContext, ContextPopException
+from django.core import timing
+from django.template.context import (Context, RequestContext, FlatContext,
+    FlatRequestContext, ContextPopException)
 from django.utils.importlib import import_module
 from django.utils.itercompat import is_iterable
 from django.utils.functional import curry, Promise
@@ -120,7 +122,10 @@ class Template(object):
         "Display stage -- can be called many times"
         context.render_context.push()
         try:
-            return self._render(context)
+            timer = timing.get_timer()
+            if timer is None:
+                return self._render(context)
+            return timer.call('template', self._render, context)
         finally:
             context.render_context.pop()
 
@@ -19,6 +19,36 @@ class EmptyClass(object):
     # __copy__
     pass
 
+class LazyValue(object):
+    """
+    A context variable whose value is only computed the first time it is
+    looked up in a Context.
+
+    Context processors can return these for values that are costly to build,
+    so that templates which never use them don't pay for them::
+
+        def processor(request):
+            return {'expensive': LazyValue(lambda: compute(request))}
+    """
+    def __init__(self, func):
+        self.func = func
+
+    def resolve(self):
+        try:
+            return self.value
+        except AttributeError:
+            self.value = self.func()
+            return self.value
+
+    def __repr__(self):
+        return '<LazyValue: %r>' % self.func
+
+def _resolve_value(value):
+    "Returns the value of a LazyValue, or value itself if it isn't one."
+    if isinstance(value, LazyValue):
+        return value.resolve()
+    return value
+
 class BaseContext(object):
     def __init__(self, dict_=None):
         dict_ = dict_ or {}
@@ -56,7 +86,7 @@ class BaseContext(object):
         "Get a variable's value, starting at the current context and going upward"
         for d in reversed(self.dicts):
             if key in d:
-                return d[key]
+                return _resolve_value(d[key])
         raise KeyError(key)
 
     def __delitem__(self, key):
@@ -75,7 +105,7 @@ class BaseContext(object):
     def get(self, key, otherwise=None):
         for d in reversed(self.dicts):
             if key in d:
-                return d[key]
+                return _resolve_value(d[key])
         return otherwise
 
 class Context(BaseContext):
@@ -107,6 +137,94 @@ class Context(BaseContext):
         return self.__class__(dict_=values, autoescape=self.autoescape,
                               current_app=self.current_app, use_l10n=self.use_l10n)
 
+# Marks a key that wasn't visible before a layer of a FlatContextMixin set it.
+_missing = object()
+
+class FlatContextMixin(object):
+    """
+    Keeps a flattened view of the context stack alongside the stack itself,
+    so that looking up a variable costs a single dictionary lookup however
+    many dicts have been pushed.
+
+    Each layer remembers the values it shadows, which makes push() free and
+    pop() proportional to the size of the popped layer only. The flattened
+    view is only kept up to date for changes made through the context, so
+    dicts must not be modified directly once they have been pushed.
+    """
+    def _get_dicts(self):
+        return self._dicts
+
+    def _set_dicts(self, dicts):
+        self._dicts = []
+        self._shadowed = []
+        self._flat = {}
+        for d in dicts:
+            self._push_layer(d)
+    dicts = property(_get_dicts, _set_dicts)
+
+    def _push_layer(self, d):
+        flat = self._flat
+        shadowed = {}
+        for key in d:
+            shadowed[key] = flat.get(key, _missing)
+            flat[key] = d[key]
+        self._dicts.append(d)
+        self._shadowed.append(shadowed)
+
+    def push(self):
+        d = {}
+        self._push_layer(d)
+        return d
+
+    def pop(self):
+        if len(self._dicts) == 1:
+            raise ContextPopException
+        flat = self._flat
+        for key, value in self._shadowed.pop().iteritems():
+            if value is _missing:
+                del flat[key]
+            else:
+                flat[key] = value
+        return self._dicts.pop()
+
+    def __setitem__(self, key, value):
+        "Set a variable in the current context"
+        shadowed = self._shadowed[-1]
+        if key not in shadowed:
+            shadowed[key] = self._flat.get(key, _missing)
+        self._dicts[-1][key] = value
+        self._flat[key] = value
+
+    def __getitem__(self, key):
+        "Get a variable's value from the flattened view of the stack"
+        return _resolve_value(self._flat[key])
+
+    def __delitem__(self, key):
+        "Delete a variable from the current context"
+        del self._dicts[-1][key]
+        value = self._shadowed[-1].pop(key)
+        if value is _missing:
+            del self._flat[key]
+        else:
+            self._flat[key] = value
+
+    def has_key(self, key):
+        return key in self._flat
+
+    def get(self, key, otherwise=None):
+        return _resolve_value(self._flat.get(key, otherwise))
+
+    def update(self, other_dict):
+        "Pushes other_dict to the stack of dictionaries in the Context"
+        if not hasattr(other_dict, '__getitem__'):
+            raise TypeError('other_dict must be a mapping (dictionary-like) object.')
+        self._push_layer(other_dict)
+        return other_dict
+
+class FlatContext(FlatContextMixin, Context):
+    "A Context with constant-time variable lookups"
+    pass
+
 class RenderContext(BaseContext):
     """
     A stack container for storing Template state.
@@ -165,7 +283,8 @@ class RequestContext(Context):
     This subclass of template.Context automatically populates itself using
     the processors defined in TEMPLATE_CONTEXT_PROCESSORS.
     Additional processors can be specified as a list of callables
-    using the "processors" keyword argument.
+    using the "processors" keyword argument. Processors may return LazyValue
+    instances, which are only evaluated if the template uses them.
     """
     def __init__(self, request, dict=None, processors=None, current_app=None, use_l10n=None):
         Context.__init__(self, dict, current_app=current_app, use_l10n=use_l10n)
@@ -175,3 +294,7 @@ class RequestContext(Context):
             processors = tuple(processors)
         for processor in get_standard_processors() + processors:
             self.update(processor(request))
+
+class FlatRequestContext(FlatContextMixin, RequestContext):
+    "A RequestContext with constant-time variable lookups"
+    pass
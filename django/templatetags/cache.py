@@ -1,3 +1,6 @@
+import time
+
+from django.conf import settings
 from django.template import Library, Node, TemplateSyntaxError, Variable, VariableDoesNotExist
 from django.template import resolve_variable
 from django.core.cache import cache
@@ -7,12 +10,64 @@ from django.utils.hashcompat import md5_constructor
 
 register = Library()
 
+class FragmentGroup(object):
+    """
+    The {% cache %} nodes found by a single parser, i.e. in a single template.
+
+    The first of them to be rendered fetches the keys of all the others with
+    one get_many() call, so a page with many cached fragments costs a single
+    cache round trip instead of one per fragment.
+    """
+    def __init__(self):
+        self.nodes = []
+
+    def prefetch(self, context):
+        """
+        Fetches every fragment whose key can be computed from the current
+        context. Returns a dict mapping each fetched key to its cached value,
+        or to None if the key was missing from the cache.
+        """
+        keys = []
+        for node in self.nodes:
+            try:
+                keys.append(node.cache_key(context))
+            except VariableDoesNotExist:
+                # The vary-on variables only exist further down the template
+                # (e.g. inside a {% for %}); that node will fetch on its own.
+                pass
+        fetched = dict.fromkeys(keys)
+        fetched.update(cache.get_many(keys))
+        return fetched
+
 class CacheNode(Node):
-    def __init__(self, nodelist, expire_time_var, fragment_name, vary_on):
+    def __init__(self, nodelist, expire_time_var, fragment_name, vary_on, group=None):
         self.nodelist = nodelist
         self.expire_time_var = Variable(expire_time_var)
         self.fragment_name = fragment_name
         self.vary_on = vary_on
+        self.group = group
+
+    def cache_key(self, context):
+        "Build a unicode key for this fragment and all vary-on's."
+        args = md5_constructor(u':'.join([urlquote(resolve_variable(var, context)) for var in self.vary_on]))
+        return 'template.cache.%s.%s' % (self.fragment_name, args.hexdigest())
+
+    def get_cached(self, cache_key, context):
+        """
+        Returns the cached value for cache_key, taking it from the values
+        prefetched for this node's group where possible.
+        """
+        if self.group is None:
+            return cache.get(cache_key)
+        render_context = context.render_context
+        if self.group not in render_context:
+            render_context[self.group] = self.group.prefetch(context)
+        fetched = render_context[self.group]
+        if cache_key in fetched:
+            # Only use a prefetched value once; a fragment rendered again
+            # (e.g. in a loop) may have been regenerated in the meantime.
+            return fetched.pop(cache_key)
+        return cache.get(cache_key)
 
     def render(self, context):
         try:
@@ -23,15 +78,37 @@ class CacheNode(Node):
             expire_time = int(expire_time)
         except (ValueError, TypeError):
             raise TemplateSyntaxError('"cache" tag got a non-integer timeout value: %r' % expire_time)
-        # Build a unicode key for this fragment and all vary-on's.
-        args = md5_constructor(u':'.join([urlquote(resolve_variable(var, context)) for var in self.vary_on]))
-        cache_key = 'template.cache.%s.%s' % (self.fragment_name, args.hexdigest())
-        value = cache.get(cache_key)
+        cache_key = self.cache_key(context)
+        grace = settings.CACHE_FRAGMENT_GRACE_SECONDS
+        value = self.get_cached(cache_key, context)
+        if isinstance(value, tuple):
+            # A fragment stored with a grace period: (soft expiry, content).
+            soft_expiry, value = value
+            if soft_expiry > time.time():
+                return value
+            # The fragment is stale. Only the worker that manages to take the
+            # lock regenerates it; everybody else keeps serving the stale
+            # content until the fresh one is stored.
+            lock_key = '%s.lock' % cache_key
+            if not cache.add(lock_key, True, grace or expire_time):
+                return value
+            try:
+                value = self.nodelist.render(context)
+                self.store(cache_key, value, expire_time, grace)
+            finally:
+                cache.delete(lock_key)
+            return value
         if value is None:
             value = self.nodelist.render(context)
-            cache.set(cache_key, value, expire_time)
+            self.store(cache_key, value, expire_time, grace)
         return value
 
+    def store(self, cache_key, value, expire_time, grace):
+        if grace > 0:
+            cache.set(cache_key, (time.time() + expire_time, value), expire_time + grace)
+        else:
+            cache.set(cache_key, value, expire_time)
+
 def do_cache(parser, token):
     """
     This will cache the contents of a template fragment for a given amount
@@ -52,12 +129,25 @@ def do_cache(parser, token):
         {% endcache %}
 
     Each unique set of arguments will result in a unique cache entry.
+
+    All the fragments of a template are fetched from the cache together the
+    first time one of them is rendered. If CACHE_FRAGMENT_GRACE_SECONDS is
+    set, expired fragments keep being served for that long while a single
+    request regenerates them.
     """
     nodelist = parser.parse(('endcache',))
     parser.delete_first_token()
     tokens = token.contents.split()
     if len(tokens) < 3:
         raise TemplateSyntaxError(u"'%r' tag requires at least 2 arguments." % tokens[0])
-    return CacheNode(nodelist, tokens[1], tokens[2], tokens[3:])
+    # Keep track of the CacheNodes found in this template, so they can all be
+    # fetched at once.
+    try:
+        group = parser.__fragment_group
+    except AttributeError: # parser.__fragment_group isn't set yet
+        group = parser.__fragment_group = FragmentGroup()
+    node = CacheNode(nodelist, tokens[1], tokens[2], tokens[3:], group)
+    group.nodes.append(node)
+    return node
 
 register.tag('cache', do_cache)
@@ -172,6 +172,18 @@ def _generate_cache_header_key(key_prefix, request):
         key_prefix, path.hexdigest())
     return _i18n_cache_key_suffix(request, cache_key)
 
+def get_cache_lock_key(request, key_prefix=None):
+    """
+    Returns the key of the lock taken, with cache.add(), by the request that
+    regenerates a stale page for the request's path.
+    """
+    if key_prefix is None:
+        key_prefix = settings.CACHE_MIDDLEWARE_KEY_PREFIX
+    path = md5_constructor(iri_to_uri(request.get_full_path()))
+    cache_key = 'views.decorators.cache.cache_lock.%s.%s' % (
+        key_prefix, path.hexdigest())
+    return _i18n_cache_key_suffix(request, cache_key)
+
 def get_cache_key(request, key_prefix=None, method='GET', cache=None):
     """
     Returns a cache key based on the request path and query. It can be used
@@ -193,6 +205,62 @@ def get_cache_key(request, key_prefix=None, method='GET', cache=None):
     else:
         return None
 
+def get_cached_response(request, key_prefix=None, cache=None, headerlists=None):
+    """
+    Returns the cached response for the request, or None if there isn't one.
+
+    The header list stored by learn_cache_key and the page itself are fetched
+    together with a single get_many() call. As the page's cache key depends on
+    the header list, it has to be guessed: headerlists is a dict mapping header
+    cache keys to the header lists previously seen for them, and is updated
+    here. Without a previous header list, the response is assumed to have no
+    "Vary" header. If the guess turns out to be wrong, the page is fetched
+    with a second call.
+
+    GET and HEAD requests are looked up as by get_cache_key() with the 'GET'
+    and 'HEAD' methods, in that order.
+    """
+    if key_prefix is None:
+        key_prefix = settings.CACHE_MIDDLEWARE_KEY_PREFIX
+    if cache is None:
+        cache = get_cache(settings.CACHE_MIDDLEWARE_ALIAS)
+    if headerlists is None:
+        headerlists = {}
+    if request.method == 'HEAD':
+        methods = ('GET', 'HEAD')
+    else:
+        methods = ('GET',)
+    header_key = _generate_cache_header_key(key_prefix, request)
+
+    def page_keys(headerlist):
+        keys = []
+        for method in methods:
+            key = _generate_cache_key(request, method, headerlist, key_prefix)
+            if key not in keys:
+                keys.append(key)
+        return keys
+
+    guess = headerlists.get(header_key, [])
+    keys = page_keys(guess)
+    values = cache.get_many([header_key] + keys)
+    headerlist = values.get(header_key)
+    if headerlist is None:
+        return None
+    if headerlist != guess:
+        if len(headerlists) >= 1000:
+            headerlists.clear()
+        headerlists[header_key] = headerlist
+        keys = page_keys(headerlist)
+        values = {}
+        for key in keys:
+            values[key] = cache.get(key)
+            if values[key] is not None:
+                break
+    for key in keys:
+        if values.get(key) is not None:
+            return values[key]
+    return None
+
 def learn_cache_key(request, response, cache_timeout=None, key_prefix=None, cache=None):
     """
     Learns what headers to take into account for some request path from the
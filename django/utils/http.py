@@ -11,6 +11,7 @@ from email.Utils import formatdate
 from django.utils.encoding import smart_str, force_unicode
 from django.utils.functional import allow_lazy
 
+RANGE_MATCH = re.compile(r'^\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*$', re.I)
 ETAG_MATCH = re.compile(r'(?:W/)?"((?:\\.|[^"])*)"')
 
 MONTHS = 'jan feb mar apr may jun jul aug sep oct nov dec'.split()
@@ -131,6 +132,36 @@ def parse_http_date_safe(date):
     except Exception:
         pass
 
+def parse_range_header(header, size):
+    """
+    Parses the Range header of a request for a resource of size bytes, as
+    described in RFC 2616 section 14.35. Returns the (first, last) positions,
+    inclusive, of the requested bytes, or None if the header should be
+    ignored: it's malformed, or asks for several ranges. Raises ValueError if
+    the range can't be satisfied.
+    """
+    match = RANGE_MATCH.match(header)
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        # A suffix range: the last bytes of the resource.
+        suffix = int(last)
+        if not suffix:
+            raise ValueError("The range can't be satisfied.")
+        return max(size - suffix, 0), size - 1
+    first = int(first)
+    if first >= size:
+        raise ValueError("The range can't be satisfied.")
+    if not last:
+        return first, size - 1
+    last = int(last)
+    if last < first:
+        return None
+    return first, min(last, size - 1)
+
 # Base 36 functions: useful for generating compact URLs
 
 def base36_to_int(s):
@@ -179,14 +179,54 @@ phone2numeric = allow_lazy(phone2numeric)
 
 # From http://www.xhaus.com/alan/python/httpcomp.html#gzip
 # Used with permission.
-def compress_string(s):
+def compress_string(s, compresslevel=6):
     import cStringIO, gzip
     zbuf = cStringIO.StringIO()
-    zfile = gzip.GzipFile(mode='wb', compresslevel=6, fileobj=zbuf)
+    zfile = gzip.GzipFile(mode='wb', compresslevel=compresslevel, fileobj=zbuf)
     zfile.write(s)
     zfile.close()
     return zbuf.getvalue()
 
+class StreamingBuffer(object):
+    "A file-like object that hands out what was written to it since last read."
+    def __init__(self):
+        self.vals = []
+
+    def write(self, val):
+        self.vals.append(val)
+
+    def read(self):
+        ret = ''.join(self.vals)
+        self.vals = []
+        return ret
+
+    def flush(self):
+        return
+
+    def close(self):
+        return
+
+def compress_sequence(sequence, compresslevel=6):
+    """
+    Gzips the strings of sequence one by one, and yields the compressed data
+    as soon as it's available, so the whole sequence never has to be in
+    memory. The compressor is flushed after each string, so every string
+    can be decompressed as soon as it's received.
+    """
+    import gzip
+    buf = StreamingBuffer()
+    zfile = gzip.GzipFile(mode='wb', compresslevel=compresslevel, fileobj=buf)
+    # The gzip header.
+    yield buf.read()
+    for item in sequence:
+        zfile.write(item)
+        zfile.flush()
+        data = buf.read()
+        if data:
+            yield data
+    zfile.close()
+    yield buf.read()
+
 ustring_re = re.compile(u"([\u0080-\uffff])")
 
 def javascript_quote(s, quote_double_quotes=False):
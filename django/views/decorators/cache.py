@@ -21,6 +21,10 @@ def cache_page(*args, **kwargs):
 
     Additionally, all headers from the response's Vary header will be taken
     into account on caching -- just like the middleware does.
+
+    The optional "grace" argument is the number of seconds an expired page
+    keeps being served while a single request regenerates it. It defaults to
+    the CACHE_MIDDLEWARE_GRACE_SECONDS setting.
     """
     # We need backwards compatibility with code which spells it this way:
     #   def my_view(): pass
@@ -42,22 +46,23 @@ def cache_page(*args, **kwargs):
     # using other ways to call cache_page that no longer work.
     cache_alias = kwargs.pop('cache', None)
     key_prefix = kwargs.pop('key_prefix', None)
-    assert not kwargs, "The only keyword arguments are cache and key_prefix"
+    grace = kwargs.pop('grace', None)
+    assert not kwargs, "The only keyword arguments are cache, key_prefix and grace"
     if len(args) > 1:
         assert len(args) == 2, "cache_page accepts at most 2 arguments"
         if callable(args[0]):
-            return decorator_from_middleware_with_args(CacheMiddleware)(cache_timeout=args[1], cache_alias=cache_alias, key_prefix=key_prefix)(args[0])
+            return decorator_from_middleware_with_args(CacheMiddleware)(cache_timeout=args[1], cache_alias=cache_alias, key_prefix=key_prefix, grace=grace)(args[0])
         elif callable(args[1]):
-            return decorator_from_middleware_with_args(CacheMiddleware)(cache_timeout=args[0], cache_alias=cache_alias, key_prefix=key_prefix)(args[1])
+            return decorator_from_middleware_with_args(CacheMiddleware)(cache_timeout=args[0], cache_alias=cache_alias, key_prefix=key_prefix, grace=grace)(args[1])
         else:
             assert False, "cache_page must be passed a view function if called with two arguments"
     elif len(args) == 1:
         if callable(args[0]):
-            return decorator_from_middleware_with_args(CacheMiddleware)(cache_alias=cache_alias, key_prefix=key_prefix)(args[0])
+            return decorator_from_middleware_with_args(CacheMiddleware)(cache_alias=cache_alias, key_prefix=key_prefix, grace=grace)(args[0])
         else:
-            return decorator_from_middleware_with_args(CacheMiddleware)(cache_timeout=args[0], cache_alias=cache_alias, key_prefix=key_prefix)
+            return decorator_from_middleware_with_args(CacheMiddleware)(cache_timeout=args[0], cache_alias=cache_alias, key_prefix=key_prefix, grace=grace)
     else:
-        return decorator_from_middleware_with_args(CacheMiddleware)(cache_alias=cache_alias, key_prefix=key_prefix)
+        return decorator_from_middleware_with_args(CacheMiddleware)(cache_alias=cache_alias, key_prefix=key_prefix, grace=grace)
 
 
 def cache_control(**kwargs):
@@ -9,9 +9,9 @@ import posixpath
 import re
 import urllib
 
-from django.http import Http404, HttpResponse, HttpResponseRedirect, HttpResponseNotModified
+from django.http import Http404, HttpResponse, HttpResponseRedirect, HttpResponseNotModified, FileResponse
 from django.template import loader, Template, Context, TemplateDoesNotExist
-from django.utils.http import http_date, parse_http_date
+from django.utils.http import http_date, parse_http_date, parse_range_header
 
 def serve(request, path, document_root=None, show_indexes=False):
     """
@@ -56,11 +56,25 @@ def serve(request, path, document_root=None, show_indexes=False):
     if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'),
                               statobj.st_mtime, statobj.st_size):
         return HttpResponseNotModified(mimetype=mimetype)
-    response = HttpResponse(open(fullpath, 'rb').read(), mimetype=mimetype)
-    response["Last-Modified"] = http_date(statobj.st_mtime)
-    response["Content-Length"] = statobj.st_size
+    last_modified = http_date(statobj.st_mtime)
+    response = FileResponse(open(fullpath, 'rb'), mimetype=mimetype)
+    response["Last-Modified"] = last_modified
     if encoding:
         response["Content-Encoding"] = encoding
+    elif response.size is not None and 'HTTP_RANGE' in request.META:
+        # Only honor the range if the file hasn't changed since the client
+        # got the beginning of it.
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if if_range is None or if_range == last_modified:
+            try:
+                byte_range = parse_range_header(request.META['HTTP_RANGE'], response.size)
+            except ValueError:
+                response.close()
+                response = HttpResponse(status=416)
+                response["Content-Range"] = 'bytes */%d' % statobj.st_size
+                return response
+            if byte_range is not None:
+                response.set_range(*byte_range)
     return response
 
 
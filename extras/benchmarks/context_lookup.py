@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+"""
+Compares variable lookups in a deeply nested template Context with the same
+lookups in a FlatContext.
+
+Usage::
+
+    python context_lookup.py [depth] [lookups]
+
+"depth" is the number of dicts pushed on top of the one holding the looked up
+variable, as RequestContext processors and nested {% for %} and {% with %}
+tags do.
+"""
+import sys
+import timeit
+
+from django.conf import settings
+
+if not settings.configured:
+    settings.configure()
+
+from django.template import Context, FlatContext
+
+def build(context_class, depth):
+    context = context_class({'request': object(), 'user': object()})
+    for i in range(depth):
+        context.update({'var%d' % i: i})
+    context.push()
+    context['forloop'] = {}
+    return context
+
+def lookups(context, names):
+    for name in names:
+        context[name]
+        context.get('missing')
+
+def push_pop(context):
+    context.push()
+    context['item'] = 1
+    context.pop()
+
+def main():
+    depth = len(sys.argv) > 1 and int(sys.argv[1]) or 10
+    number = len(sys.argv) > 2 and int(sys.argv[2]) or 100000
+    names = ['request', 'user', 'var0', 'forloop']
+    print "%d pushed dicts, %d iterations" % (depth, number)
+    for context_class in (Context, FlatContext):
+        context = build(context_class, depth)
+        lookup_time = timeit.Timer(lambda: lookups(context, names)).timeit(number)
+        push_pop_time = timeit.Timer(lambda: push_pop(context)).timeit(number)
+        print "%-12s lookups: %.3fs  push/pop: %.3fs" % (
+            context_class.__name__, lookup_time, push_pop_time)
+
+if __name__ == '__main__':
+    main()
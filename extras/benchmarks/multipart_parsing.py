@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""
+Measures the throughput of MultiPartParser, in MB/s, on a request uploading
+one large file and a few form fields, and the time it takes to parse a form
+with many fields. The file's data is handed to an upload handler that throws
+it away, so only the parsing is measured.
+
+Usage::
+
+    python multipart_parsing.py [megabytes] [iterations] [chunk_size]
+
+"chunk_size" is the chunk size of the upload handler (64 KB by default).
+"""
+import sys
+import time
+from cStringIO import StringIO
+
+from django.conf import settings
+
+if not settings.configured:
+    settings.configure()
+
+from django.core.files.uploadhandler import FileUploadHandler
+from django.http.multipartparser import MultiPartParser
+
+BOUNDARY = 'BoUnDaRyStRiNg'
+
+class DiscardingHandler(FileUploadHandler):
+    def __init__(self, chunk_size=None):
+        super(DiscardingHandler, self).__init__()
+        if chunk_size:
+            self.chunk_size = chunk_size
+
+    def receive_data_chunk(self, raw_data, start):
+        return None
+
+    def file_complete(self, file_size):
+        return file_size
+
+def build_payload(size):
+    # Data that looks a lot like the boundary, to exercise partial matches.
+    block = ('--BoUnDaR\r\n' + 'x' * 1013) * 64
+    data = (block * (size // len(block) + 1))[:size]
+    parts = []
+    for i in range(5):
+        parts.append('--%s\r\nContent-Disposition: form-data; name="field%d"\r\n'
+                     '\r\nvalue %d\r\n' % (BOUNDARY, i, i))
+    parts.append('--%s\r\nContent-Disposition: form-data; name="file"; '
+                 'filename="upload.bin"\r\nContent-Type: application/octet-stream'
+                 '\r\n\r\n%s\r\n' % (BOUNDARY, data))
+    parts.append('--%s--\r\n' % BOUNDARY)
+    return ''.join(parts)
+
+def build_form(count):
+    parts = []
+    for i in range(count):
+        parts.append('--%s\r\nContent-Disposition: form-data; name="field%d"\r\n'
+                     '\r\nvalue %d\r\n' % (BOUNDARY, i, i))
+    parts.append('--%s--\r\n' % BOUNDARY)
+    return ''.join(parts)
+
+def parse(payload, chunk_size=None):
+    meta = {
+        'CONTENT_TYPE': 'multipart/form-data; boundary=%s' % BOUNDARY,
+        'CONTENT_LENGTH': len(payload),
+    }
+    parser = MultiPartParser(meta, StringIO(payload), [DiscardingHandler(chunk_size)])
+    return parser.parse()
+
+def best_time(number, func, *args):
+    best = None
+    for i in range(number):
+        start = time.time()
+        func(*args)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def main():
+    megabytes = len(sys.argv) > 1 and int(sys.argv[1]) or 50
+    number = len(sys.argv) > 2 and int(sys.argv[2]) or 5
+    chunk_size = len(sys.argv) > 3 and int(sys.argv[3]) or None
+    size = megabytes * 1024 * 1024
+    payload = build_payload(size)
+    post, files = parse(payload, chunk_size)
+    assert len(post) == 5 and files['file'] == size
+    best = best_time(number, parse, payload, chunk_size)
+    print "%d MB upload, best of %d: %.3fs, %.1f MB/s" % (
+        megabytes, number, best, len(payload) / best / (1024 * 1024))
+
+    settings.DATA_UPLOAD_MAX_NUMBER_FIELDS = None
+    form = build_form(10000)
+    assert len(parse(form)[0]) == 10000
+    best = best_time(number, parse, form)
+    print "10000 fields, best of %d: %.3fs" % (number, best)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+"""
+Compares resolving URLs with a new root RegexURLResolver for each request, as
+BaseHandler.get_response used to do, with resolving them with the resolver
+get_resolver() keeps for the URLconf. Reversing is compared too: a new
+resolver has to build its reverse dictionary all over again.
+
+Usage::
+
+    python url_resolving.py [patterns] [iterations]
+
+"patterns" is the number of URL patterns in the URLconf; the resolved URLs
+match the first and the last of them.
+"""
+import sys
+import timeit
+
+from django.conf import settings
+
+if not settings.configured:
+    settings.configure(ROOT_URLCONF='__main__')
+
+from django.conf.urls.defaults import patterns, url
+from django.core.urlresolvers import RegexURLResolver, get_resolver
+
+def view(request, *args, **kwargs):
+    pass
+
+urlpatterns = patterns('')
+
+def build_urlconf(count):
+    for i in range(count):
+        urlpatterns.append(url(r'^section%d/(?P<slug>[\w-]+)/(\d+)/$' % i, view,
+                               name='section%d' % i))
+
+def resolve_fresh(paths):
+    for path in paths:
+        RegexURLResolver(r'^/', settings.ROOT_URLCONF).resolve(path)
+
+def resolve_shared(paths):
+    for path in paths:
+        get_resolver(settings.ROOT_URLCONF).resolve(path)
+
+def reverse_fresh(names):
+    for name in names:
+        RegexURLResolver(r'^/', settings.ROOT_URLCONF).reverse(name, 'slug', 1)
+
+def reverse_shared(names):
+    for name in names:
+        get_resolver(settings.ROOT_URLCONF).reverse(name, 'slug', 1)
+
+def main():
+    count = len(sys.argv) > 1 and int(sys.argv[1]) or 100
+    number = len(sys.argv) > 2 and int(sys.argv[2]) or 1000
+    build_urlconf(count)
+    paths = ['/section0/a-slug/1/', '/section%d/a-slug/1/' % (count - 1)]
+    names = ['section0', 'section%d' % (count - 1)]
+    print "%d patterns, %d iterations" % (count, number)
+    for label, resolve, reverse_ in (('fresh', resolve_fresh, reverse_fresh),
+                                     ('shared', resolve_shared, reverse_shared)):
+        resolve_time = timeit.Timer(lambda: resolve(paths)).timeit(number)
+        reverse_time = timeit.Timer(lambda: reverse_(names)).timeit(number)
+        print "%-8s resolve: %.3fs  reverse: %.3fs" % (
+            label, resolve_time, reverse_time)
+
+if __name__ == '__main__':
+    main()
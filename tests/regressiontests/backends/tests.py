@@ -5,6 +5,7 @@ import datetime
 from django.core.management.color import no_style
 from django.db import backend, connection, connections, DEFAULT_DB_ALIAS, IntegrityError
 from django.db.backends.signals import connection_created
+from django.db.backends.util import CursorStatsWrapper, QueryStats
 from django.db.backends.postgresql import version as pg_version
 from django.test import TestCase, skipUnlessDBFeature, TransactionTestCase
 from django.utils import unittest
@@ -233,6 +234,82 @@ class BackendTestCase(TestCase):
         self.assertEqual(list(cursor.fetchall()), [(u'Mary', u'Agnelline'), (u'Peter', u'Parker')])
 
 
+class QueryStatsTests(unittest.TestCase):
+    def test_record(self):
+        stats = QueryStats(slowest=2, history=3)
+        stats.record('SELECT 1', (), 0.5)
+        stats.record('SELECT %s', (1,), 0.25)
+        stats.record('SELECT %s', (2,), 0.75)
+        stats.record('SELECT %s', (2,), 0.125)
+        self.assertEqual(stats.count, 4)
+        self.assertEqual(stats.time, 1.625)
+        self.assertEqual(stats.slowest(), [(0.75, 'SELECT %s', (2,)), (0.5, 'SELECT 1', ())])
+        self.assertEqual(stats.recent(), [('SELECT %s', (1,), 0.25),
+                                          ('SELECT %s', (2,), 0.75),
+                                          ('SELECT %s', (2,), 0.125)])
+        self.assertEqual(stats.repeated(), [(3, 1.125, 'SELECT %s')])
+        self.assertEqual(stats.duplicates(), [(2, 'SELECT %s', (2,))])
+
+        stats.reset()
+        self.assertEqual(stats.count, 0)
+        self.assertEqual(stats.slowest(), [])
+        self.assertEqual(stats.recent(), [])
+        self.assertEqual(stats.repeated(), [])
+
+    def test_max_statements(self):
+        stats = QueryStats(max_statements=2)
+        for i in range(5):
+            stats.record('SELECT %d' % i, [], 0.1)
+        self.assertEqual(stats.count, 5)
+        self.assertEqual(len(stats.statements), 2)
+        self.assertEqual(len(stats.slowest()), 5)
+
+    def test_params(self):
+        stats = QueryStats()
+        stats.record('SELECT %(id)s', {'id': 1}, 0.1)
+        stats.record('SELECT %(id)s', {'id': 1}, 0.1)
+        stats.record('SELECT %(id)s', {'id': 2}, 0.1)
+        stats.record('SELECT %s', [[1]], 0.1)
+        stats.record('SELECT %s', [[1]], 0.1)
+        self.assertEqual(stats.duplicates(), [(2, 'SELECT %(id)s', {'id': 1})])
+
+    def test_no_params(self):
+        "Queries run with cursor.execute(sql) have no parameters"
+        stats = QueryStats()
+        stats.record('SELECT 1', None, 0.1)
+        stats.record('SELECT 1', None, 0.1)
+        self.assertEqual(stats.slowest()[0], (0.1, 'SELECT 1', ()))
+        self.assertEqual(stats.duplicates(), [(2, 'SELECT 1', ())])
+
+class QueryStatsCursorTests(TestCase):
+    def setUp(self):
+        self.old_query_stats = connection.query_stats
+        connection.query_stats = QueryStats()
+
+    def tearDown(self):
+        connection.query_stats = self.old_query_stats
+
+    def test_queries_recorded(self):
+        models.Person.objects.create(first_name='John', last_name='Doe')
+        for i in range(3):
+            list(models.Person.objects.filter(first_name='John'))
+        stats = connection.query_stats
+        self.assertEqual(stats.count, 4)
+        self.assertEqual(stats.repeated()[0][0], 3)
+        self.assertEqual(stats.duplicates()[0][0], 3)
+
+    def test_no_params(self):
+        "Queries without parameters reach the driver without any"
+        calls = []
+        class Cursor(object):
+            def execute(self, *args):
+                calls.append(args)
+        cursor = CursorStatsWrapper(Cursor(), connection)
+        cursor.execute("SELECT '%'")
+        cursor.execute("SELECT %s", [1])
+        self.assertEqual(calls, [("SELECT '%'",), ("SELECT %s", [1])])
+        self.assertEqual(connection.query_stats.recent()[0][:2], ("SELECT '%'", ()))
+
 # We don't make these tests conditional because that means we would need to
 # check and differentiate between:
 # * MySQL+InnoDB, MySQL+MYISAM (something we currently can't do).
@@ -4,21 +4,30 @@
 # Uses whatever cache backend is set in the test settings file.
 
 import os
+import shutil
+import socket
+import sys
 import tempfile
+import threading
 import time
+import types
 import warnings
 
 from django.conf import settings
 from django.core import management
 from django.core.cache import get_cache, DEFAULT_CACHE_ALIAS
-from django.core.cache.backends.base import CacheKeyWarning
+from django.core.cache.backends.base import CacheKeyWarning, CompressedValue
+from django.core.cache.ratelimit import RateLimiter
+from django.core.cache.backends.memcached import BaseMemcachedCache, ConsistentHashingClient, HashRing, PyLibMCCache
 from django.http import HttpResponse, HttpRequest, QueryDict
 from django.middleware.cache import FetchFromCacheMiddleware, UpdateCacheMiddleware, CacheMiddleware
+from django.template import Template, Context
+from django.templatetags import cache as cache_tag
 from django.test import RequestFactory
 from django.test.utils import get_warnings_state, restore_warnings_state
 from django.utils import translation
 from django.utils import unittest
-from django.utils.cache import patch_vary_headers, get_cache_key, learn_cache_key
+from django.utils.cache import patch_vary_headers, get_cache_key, get_cache_lock_key, learn_cache_key
 from django.utils.hashcompat import md5_constructor
 from django.views.decorators.cache import cache_page
 
@@ -406,6 +415,35 @@ class BaseCacheTests(object):
         self.assertEqual(self.cache.get('key3'), 'sausage')
         self.assertEqual(self.cache.get('key4'), 'lobster bisque')
 
+    def test_tags(self):
+        self.cache.set('tagged1', 1, tags=['x'])
+        self.cache.set('tagged2', 2, tags=['x', 'y'])
+        self.cache.set_many({'tagged3': 3, 'tagged4': 4}, tags=['y'])
+        self.cache.set('untagged', 5)
+        keys = ['tagged1', 'tagged2', 'tagged3', 'tagged4', 'untagged']
+        self.assertEqual(self.cache.get_many(keys),
+                         {'tagged1': 1, 'tagged2': 2, 'tagged3': 3, 'tagged4': 4, 'untagged': 5})
+
+        self.cache.invalidate_tags('y')
+        self.assertEqual(self.cache.get('tagged2'), None)
+        self.assertEqual(self.cache.get('tagged3', 'default'), 'default')
+        self.assertEqual(self.cache.get_many(keys), {'tagged1': 1, 'untagged': 5})
+
+        # Values stored after the invalidation are fresh.
+        self.cache.set('tagged2', 2, tags=['y'])
+        self.assertEqual(self.cache.get('tagged2'), 2)
+        self.cache.invalidate_tags('x', 'z')
+        self.assertEqual(self.cache.get_many(keys), {'tagged2': 2, 'untagged': 5})
+
+    def test_incr_tags(self):
+        self.cache.set('tagged', 1, tags=['t'])
+        self.assertEqual(self.cache.incr('tagged'), 2)
+        self.assertEqual(self.cache.decr('tagged', 3), -1)
+        self.assertEqual(self.cache.get('tagged'), -1)
+        self.cache.set('stale', 1, tags=['u'])
+        self.cache.invalidate_tags('u')
+        self.assertRaises(ValueError, self.cache.incr, 'stale')
+
     def perform_cull_test(self, initial_count, final_count):
         """This is implemented as a utility method, because only some of the backends
         implement culling. The culling algorithm also varies slightly, so the final
@@ -731,7 +769,7 @@ class DBCacheTests(unittest.TestCase, BaseCacheTests):
         # Spaces are used in the table name to ensure quoting/escaping is working
         self._table_name = 'test cache table'
         management.call_command('createcachetable', self._table_name, verbosity=0, interactive=False)
-        self.cache = get_cache('django.core.cache.backends.db.DatabaseCache', LOCATION=self._table_name, OPTIONS={'MAX_ENTRIES': 30})
+        self.cache = get_cache('django.core.cache.backends.db.DatabaseCache', LOCATION=self._table_name, OPTIONS={'MAX_ENTRIES': 30, 'CULL_PROBABILITY': 1})
         self.prefix_cache = get_cache('django.core.cache.backends.db.DatabaseCache', LOCATION=self._table_name, KEY_PREFIX='cacheprefix')
         self.v2_cache = get_cache('django.core.cache.backends.db.DatabaseCache', LOCATION=self._table_name, VERSION=2)
         self.custom_key_cache = get_cache('django.core.cache.backends.db.DatabaseCache', LOCATION=self._table_name, KEY_FUNCTION=custom_key_func)
@@ -742,17 +780,62 @@ class DBCacheTests(unittest.TestCase, BaseCacheTests):
         cursor = connection.cursor()
         cursor.execute('DROP TABLE %s' % connection.ops.quote_name(self._table_name))
 
+    def test_incr_keeps_tags(self):
+        self.cache.set('tagged', 1, tags=['t'])
+        self.assertEqual(self.cache.incr('tagged'), 2)
+        self.cache.invalidate_tags('t')
+        self.assertEqual(self.cache.get('tagged'), None)
+        self.assertRaises(ValueError, self.cache.incr, 'tagged')
+
     def test_cull(self):
         self.perform_cull_test(50, 29)
 
     def test_zero_cull(self):
-        self.cache = get_cache('django.core.cache.backends.db.DatabaseCache', LOCATION=self._table_name, OPTIONS={'MAX_ENTRIES': 30, 'CULL_FREQUENCY': 0})
+        self.cache = get_cache('django.core.cache.backends.db.DatabaseCache', LOCATION=self._table_name, OPTIONS={'MAX_ENTRIES': 30, 'CULL_FREQUENCY': 0, 'CULL_PROBABILITY': 1})
         self.perform_cull_test(50, 18)
 
     def test_old_initialization(self):
-        self.cache = get_cache('db://%s?max_entries=30&cull_frequency=0' % self._table_name)
+        self.cache = get_cache('db://%s?max_entries=30&cull_frequency=0&cull_probability=1' % self._table_name)
         self.perform_cull_test(50, 18)
 
+    def test_no_cull(self):
+        "The table is only counted on a CULL_PROBABILITY fraction of writes"
+        self.cache = get_cache('django.core.cache.backends.db.DatabaseCache', LOCATION=self._table_name, OPTIONS={'MAX_ENTRIES': 30, 'CULL_PROBABILITY': 0})
+        self.perform_cull_test(50, 49)
+
+    def test_many_queries(self):
+        "get_many(), set_many() and delete_many() don't need a query per key"
+        from django.db import connection
+        data = dict([('key%d' % i, i) for i in range(10)])
+        old_debug = settings.DEBUG
+        settings.DEBUG = True
+        try:
+            connection.queries = []
+            self.cache.set_many(data)
+            self.assertTrue(len(connection.queries) <= 4)
+            connection.queries = []
+            self.assertEqual(self.cache.get_many(data.keys() + ['missing']), data)
+            self.assertEqual(len(connection.queries), 1)
+            connection.queries = []
+            self.cache.delete_many(data.keys())
+            self.assertEqual(len(connection.queries), 1)
+        finally:
+            settings.DEBUG = old_debug
+        self.assertEqual(self.cache.get_many(data.keys()), {})
+
+    def test_incr_keeps_expiry(self):
+        self.cache.set('counter', 1, 1)
+        self.assertEqual(self.cache.incr('counter', 10), 11)
+        self.assertEqual(self.cache.decr('counter', 2), 9)
+        time.sleep(2)
+        self.assertRaises(ValueError, self.cache.incr, 'counter')
+
+    def test_get_many_expired(self):
+        self.cache.set_many({'a': 1, 'b': 2}, 1)
+        self.cache.set('c', 3)
+        time.sleep(2)
+        self.assertEqual(self.cache.get_many(['a', 'b', 'c']), {'c': 3})
+
 class LocMemCacheTests(unittest.TestCase, BaseCacheTests):
     def setUp(self):
         self.cache = get_cache('django.core.cache.backends.locmem.LocMemCache', OPTIONS={'MAX_ENTRIES': 30})
@@ -761,23 +844,16 @@ class LocMemCacheTests(unittest.TestCase, BaseCacheTests):
         self.custom_key_cache = get_cache('django.core.cache.backends.locmem.LocMemCache', OPTIONS={'MAX_ENTRIES': 30}, KEY_FUNCTION=custom_key_func)
         self.custom_key_cache2 = get_cache('django.core.cache.backends.locmem.LocMemCache', OPTIONS={'MAX_ENTRIES': 30}, KEY_FUNCTION='regressiontests.cache.tests.custom_key_func')
 
-        # LocMem requires a hack to make the other caches
-        # share a data store with the 'normal' cache.
-        self.prefix_cache._cache = self.cache._cache
-        self.prefix_cache._expire_info = self.cache._expire_info
-
-        self.v2_cache._cache = self.cache._cache
-        self.v2_cache._expire_info = self.cache._expire_info
-
-        self.custom_key_cache._cache = self.cache._cache
-        self.custom_key_cache._expire_info = self.cache._expire_info
-
-        self.custom_key_cache2._cache = self.cache._cache
-        self.custom_key_cache2._expire_info = self.cache._expire_info
-
     def tearDown(self):
         self.cache.clear()
 
+    def test_incr_keeps_tags(self):
+        self.cache.set('tagged', 1, tags=['t'])
+        self.assertEqual(self.cache.incr('tagged'), 2)
+        self.cache.invalidate_tags('t')
+        self.assertEqual(self.cache.get('tagged'), None)
+        self.assertRaises(ValueError, self.cache.incr, 'tagged')
+
     def test_cull(self):
         self.perform_cull_test(50, 29)
 
@@ -798,6 +874,53 @@ class LocMemCacheTests(unittest.TestCase, BaseCacheTests):
         self.assertEqual(mirror_cache.get('value1'), 42)
         self.assertEqual(other_cache.get('value1'), None)
 
+    def test_lru_cull(self):
+        "Culling evicts the least recently used keys"
+        for i in range(30):
+            self.cache.set('cull%d' % i, 'value', 1000)
+        # Use the oldest keys again, so they become the most recently used.
+        for i in range(10):
+            self.assertEqual(self.cache.get('cull%d' % i), 'value')
+        self.cache.set('overflow', 'value', 1000)
+        for i in range(10):
+            self.assertTrue(self.cache.has_key('cull%d' % i))
+        for i in range(10, 20):
+            self.assertFalse(self.cache.has_key('cull%d' % i))
+        self.assertTrue(self.cache.has_key('overflow'))
+
+    def test_atomic_incr(self):
+        self.cache.set('counter', 0)
+        def work():
+            for i in range(100):
+                self.cache.incr('counter')
+        threads = [threading.Thread(target=work) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.cache.get('counter'), 500)
+
+    def test_incr_keeps_expiry(self):
+        self.cache.set('counter', 1, 1)
+        self.cache.incr('counter')
+        time.sleep(1.5)
+        self.assertEqual(self.cache.get('counter'), None)
+        self.assertRaises(ValueError, self.cache.incr, 'counter')
+
+    def test_unpickled(self):
+        cache = get_cache('django.core.cache.backends.locmem.LocMemCache', LOCATION='unpickled', OPTIONS={'PICKLE': False})
+        value = (1, 'a')
+        cache.set('key', value)
+        self.assertTrue(cache.get('key') is value)
+        self.assertTrue(cache.add('other', 42))
+        self.assertFalse(cache.add('other', 43))
+        self.assertEqual(cache.get('other'), 42)
+        # Pickling is still the default.
+        self.cache.set('key', value)
+        self.assertEqual(self.cache.get('key'), value)
+        self.assertFalse(self.cache.get('key') is value)
+        cache.clear()
+
 # memcached backend isn't guaranteed to be available.
 # To check the memcached backend, the test settings file will
 # need to contain a cache backend setting that points at
@@ -831,13 +954,130 @@ class MemcachedCacheTests(unittest.TestCase, BaseCacheTests):
 
 MemcachedCacheTests = unittest.skipUnless(settings.CACHES[DEFAULT_CACHE_ALIAS]['BACKEND'].startswith('django.core.cache.backends.memcached.'), "memcached not available")(MemcachedCacheTests)
 
+class FakeMemcacheClient(object):
+    "A stand-in for a memcached library client talking to a single server."
+    def __init__(self, servers):
+        self.data = {}
+        self.down = False
+
+    def _check(self):
+        if self.down:
+            raise socket.error('server down')
+
+    def get(self, key):
+        self._check()
+        return self.data.get(key)
+
+    def get_multi(self, keys):
+        self._check()
+        return dict([(k, self.data[k]) for k in keys if k in self.data])
+
+    def set(self, key, value, timeout=0):
+        self._check()
+        self.data[key] = value
+        return True
+
+    def set_multi(self, mapping, timeout=0):
+        self._check()
+        self.data.update(mapping)
+        return []
+
+    def delete(self, key):
+        self._check()
+        self.data.pop(key, None)
+
+    def delete_multi(self, keys):
+        for key in keys:
+            self.delete(key)
+
+class ConsistentHashingTests(unittest.TestCase):
+    def make_client(self, servers, **kwargs):
+        return ConsistentHashingClient(servers, FakeMemcacheClient, **kwargs)
+
+    def test_ring_stability(self):
+        "Adding a server only moves the keys it takes over"
+        keys = ['key%d' % i for i in range(1000)]
+        ring = HashRing(['a:11211', 'b:11211', 'c:11211'])
+        bigger = HashRing(['a:11211', 'b:11211', 'c:11211', 'd:11211'])
+        moved = [k for k in keys if ring.get_nodes(k) != bigger.get_nodes(k)]
+        for key in moved:
+            self.assertEqual(bigger.get_nodes(key), ['d:11211'])
+        # Roughly a quarter of the keys move to the new server.
+        self.assertTrue(100 < len(moved) < 400)
+
+    def test_distribution(self):
+        client = self.make_client(['a', 'b', 'c'])
+        for i in range(300):
+            client.set('key%d' % i, i)
+        for server in client._clients.values():
+            self.assertTrue(50 < len(server.data) < 150)
+        self.assertEqual(client.get_multi(['key1', 'key2', 'missing']), {'key1': 1, 'key2': 2})
+        client.delete_multi(['key1', 'key2'])
+        self.assertEqual(client.get('key1'), None)
+
+    def test_replicas(self):
+        client = self.make_client(['a', 'b', 'c'], replicas=2)
+        client.set('hot', 'value')
+        self.assertEqual(len([c for c in client._clients.values() if 'hot' in c.data]), 2)
+        for i in range(10):
+            self.assertEqual(client.get('hot'), 'value')
+        client.delete('hot')
+        self.assertEqual(len([c for c in client._clients.values() if 'hot' in c.data]), 0)
+
+    def test_dead_server(self):
+        client = self.make_client(['a', 'b', 'c'], dead_retry=1)
+        server = client._ring.get_nodes('key')[0]
+        client._clients[server].down = True
+        # The failing server is taken out of the ring, so its keys go to the
+        # other servers.
+        self.assertEqual(client.get('key'), None)
+        client.set('key', 'value')
+        self.assertEqual(client.get('key'), 'value')
+        self.assertNotEqual(client._ring.get_nodes('key'), [server])
+        # It's retried once dead_retry has elapsed.
+        client._clients[server].down = False
+        time.sleep(1.5)
+        self.assertEqual(client.get('key'), None)
+        self.assertEqual(client._ring.get_nodes('key'), [server])
+
+    def test_options(self):
+        class FakeLibrary(object):
+            Client = FakeMemcacheClient
+        cache = BaseMemcachedCache('a;b', {'OPTIONS': {'CONSISTENT_HASHING': True, 'REPLICAS': 2, 'tcp_nodelay': True}},
+                                   library=FakeLibrary, value_not_found_exception=ValueError)
+        self.assertTrue(isinstance(cache._cache, ConsistentHashingClient))
+        self.assertEqual(cache._cache._replicas, 2)
+        self.assertEqual(cache._options, {'tcp_nodelay': True})
+        cache.set('key', 'value')
+        self.assertEqual(cache.get('key'), 'value')
+
+    def test_pylibmc_server_errors(self):
+        "Only the pylibmc errors of unreachable servers take them out of the ring"
+        pylibmc = types.ModuleType('pylibmc')
+        class Error(Exception):
+            pass
+        for name in ('NotFound', 'ConnectionError', 'ServerDown', 'ServerDead', 'TooBig'):
+            setattr(pylibmc, name, type(name, (Error,), {}))
+        pylibmc.Error = Error
+        old_pylibmc = sys.modules.get('pylibmc')
+        sys.modules['pylibmc'] = pylibmc
+        try:
+            cache = PyLibMCCache('a;b', {})
+        finally:
+            if old_pylibmc is None:
+                del sys.modules['pylibmc']
+            else:
+                sys.modules['pylibmc'] = old_pylibmc
+        self.assertEqual(cache.LibraryServerError,
+                         (pylibmc.ConnectionError, pylibmc.ServerDown, pylibmc.ServerDead))
+
 class FileBasedCacheTests(unittest.TestCase, BaseCacheTests):
     """
     Specific test cases for the file-based cache.
     """
     def setUp(self):
         self.dirname = tempfile.mkdtemp()
-        self.cache = get_cache('django.core.cache.backends.filebased.FileBasedCache', LOCATION=self.dirname, OPTIONS={'MAX_ENTRIES': 30})
+        self.cache = get_cache('django.core.cache.backends.filebased.FileBasedCache', LOCATION=self.dirname, OPTIONS={'MAX_ENTRIES': 30, 'CULL_PROBABILITY': 1})
         self.prefix_cache = get_cache('django.core.cache.backends.filebased.FileBasedCache', LOCATION=self.dirname, KEY_PREFIX='cacheprefix')
         self.v2_cache = get_cache('django.core.cache.backends.filebased.FileBasedCache', LOCATION=self.dirname, VERSION=2)
         self.custom_key_cache = get_cache('django.core.cache.backends.filebased.FileBasedCache', LOCATION=self.dirname, KEY_FUNCTION=custom_key_func)
@@ -873,9 +1113,237 @@ class FileBasedCacheTests(unittest.TestCase, BaseCacheTests):
         self.perform_cull_test(50, 29)
 
     def test_old_initialization(self):
-        self.cache = get_cache('file://%s?max_entries=30' % self.dirname)
+        self.cache = get_cache('file://%s?max_entries=30&cull_probability=1' % self.dirname)
         self.perform_cull_test(50, 29)
 
+    def _path(self, key):
+        keyhash = md5_constructor(self.cache.make_key(key)).hexdigest()
+        return os.path.join(self.dirname, keyhash[:2], keyhash[2:4], keyhash[4:])
+
+    def test_lru_cull(self):
+        "Culling removes the least recently accessed entries"
+        for i in range(30):
+            self.cache.set('cull%d' % i, 'value', 1000)
+        # Mark the first ten entries as the most recently read ones.
+        later = time.time() + 100
+        for i in range(10):
+            path = self._path('cull%d' % i)
+            os.utime(path, (later, os.stat(path).st_mtime))
+        self.cache.set('overflow', 'value', 1000)
+        for i in range(10):
+            self.assertTrue(self.cache.has_key('cull%d' % i))
+        self.assertEqual(len([i for i in range(10, 30) if self.cache.has_key('cull%d' % i)]), 10)
+        self.assertEqual(self.cache._num_entries, 21)
+
+    def test_entry_count(self):
+        "The entries are counted without listing the cache directory"
+        self.cache.set('key1', 'spam')
+        self.cache.set('key2', 'eggs')
+        self.cache.set('key1', 'ham')
+        self.assertEqual(self.cache._num_entries, 2)
+        self.cache.delete('key1')
+        self.cache.delete('key1')
+        self.assertEqual(self.cache._num_entries, 1)
+        # Other instances for the same directory share the count.
+        other = get_cache('django.core.cache.backends.filebased.FileBasedCache', LOCATION=self.dirname)
+        self.assertEqual(other._num_entries, 1)
+
+    def test_entry_recount(self):
+        "The files are counted again to see other processes' entries"
+        from django.core.cache.backends import filebased
+        self.cache.set('key1', 'spam')
+        self.assertEqual(self.cache._num_entries, 1)
+        # Another process writes an entry.
+        os.makedirs(os.path.join(self.dirname, 'ab', 'cd'))
+        open(os.path.join(self.dirname, 'ab', 'cd', 'ef'), 'wb').close()
+        self.assertEqual(self.cache._num_entries, 1)
+        num_entries, counted = filebased._entry_counts[self.dirname]
+        filebased._entry_counts[self.dirname] = (num_entries, counted - filebased.RECOUNT_INTERVAL - 1)
+        self.assertEqual(self.cache._num_entries, 2)
+
+    def test_stale_temp_files(self):
+        "Temporary files left by crashed writers are removed when culling"
+        os.makedirs(os.path.join(self.dirname, 'ab', 'cd'))
+        stale = os.path.join(self.dirname, 'ab', 'cd', 'ef.1234.tmp')
+        fresh = os.path.join(self.dirname, 'ab', 'cd', 'ef.5678.tmp')
+        open(stale, 'wb').close()
+        open(fresh, 'wb').close()
+        old = time.time() - 3600
+        os.utime(stale, (old, old))
+        for i in range(31):
+            self.cache.set('cull%d' % i, 'value', 1000)
+        self.assertFalse(os.path.exists(stale))
+        self.assertTrue(os.path.exists(fresh))
+
+    def test_atomic_write(self):
+        "Values are written to a temporary file, then renamed into place"
+        self.cache.set('key', 'value')
+        dirname = os.path.dirname(self._path('key'))
+        self.assertEqual(os.listdir(dirname), [os.path.basename(self._path('key'))])
+        self.cache.set('key', 'other value')
+        self.assertEqual(os.listdir(dirname), [os.path.basename(self._path('key'))])
+        self.assertEqual(self.cache.get('key'), 'other value')
+
+class TwoTierCacheTests(unittest.TestCase, BaseCacheTests):
+    backend_name = 'django.core.cache.backends.twotier.TwoTierCache'
+
+    def setUp(self):
+        self.cache = get_cache(self.backend_name, LOCATION='locmem://twotier')
+        self.prefix_cache = get_cache(self.backend_name, LOCATION='locmem://twotier', KEY_PREFIX='cacheprefix')
+        self.v2_cache = get_cache(self.backend_name, LOCATION='locmem://twotier', VERSION=2)
+        self.custom_key_cache = get_cache(self.backend_name, LOCATION='locmem://twotier', KEY_FUNCTION=custom_key_func)
+        self.custom_key_cache2 = get_cache(self.backend_name, LOCATION='locmem://twotier', KEY_FUNCTION='regressiontests.cache.tests.custom_key_func')
+
+    def tearDown(self):
+        self.cache.clear()
+
+    def test_local_hits(self):
+        self.cache.set('answer', 42)
+        stats = self.cache.get_stats()
+        self.assertEqual(self.cache.get('answer'), 42)
+        self.assertEqual(self.cache.get_stats()['hits'], stats['hits'] + 1)
+        # Values changed behind the local tier's back are only seen once the
+        # local copy expires.
+        self.cache.remote.set('answer', 43)
+        self.assertEqual(self.cache.get('answer'), 42)
+
+    def test_local_timeout(self):
+        cache = get_cache(self.backend_name, LOCATION='locmem://twotier', OPTIONS={'LOCAL_TIMEOUT': 1})
+        cache.set('answer', 42)
+        cache.remote.set('answer', 43)
+        time.sleep(1.5)
+        self.assertEqual(cache.get('answer'), 43)
+
+    def test_lru_eviction(self):
+        cache = get_cache(self.backend_name, LOCATION='locmem://twotier-lru', OPTIONS={'MAX_ENTRIES': 3})
+        try:
+            cache.set('a', 1)
+            cache.set('b', 2)
+            cache.set('c', 3)
+            stats = cache.get_stats()
+            self.assertEqual(cache.get('a'), 1)
+            cache.set('d', 4)
+            self.assertEqual(cache.get_stats()['evictions'], stats['evictions'] + 1)
+            self.assertEqual(cache.get_stats()['entries'], 3)
+            # 'b' was the least recently used key: it now comes from the
+            # remote cache.
+            stats = cache.get_stats()
+            self.assertEqual(cache.get_many(['a', 'b']), {'a': 1, 'b': 2})
+            self.assertEqual(cache.get_stats()['hits'], stats['hits'] + 1)
+            self.assertEqual(cache.get_stats()['misses'], stats['misses'] + 1)
+        finally:
+            cache.clear()
+
+    def test_generation_invalidation(self):
+        from django.core.cache.backends.twotier import LocalStore
+        options = {'GENERATION_KEY': 'generation'}
+        cache = get_cache(self.backend_name, LOCATION='locmem://twotier', OPTIONS=options)
+        # Another process, with a local tier of its own.
+        other = get_cache(self.backend_name, LOCATION='locmem://twotier', OPTIONS=options)
+        other._local = LocalStore()
+
+        cache.set('answer', 42)
+        self.assertEqual(other.get('answer'), 42)
+        other.close()
+        cache.set('answer', 43)
+        # The generation is only checked once per request.
+        self.assertEqual(other.get('answer'), 43)
+        cache.set('answer', 44)
+        self.assertEqual(other.get('answer'), 43)
+        other.close()
+        self.assertEqual(other.get('answer'), 44)
+
+    def test_same_keys_as_remote(self):
+        "Values set through the backend are those of the remote cache"
+        settings.CACHES['twotier-remote'] = {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'twotier-remote',
+            'KEY_PREFIX': 'remoteprefix',
+            'VERSION': 3,
+        }
+        try:
+            cache = get_cache(self.backend_name, LOCATION='twotier-remote')
+            remote = get_cache('twotier-remote')
+            cache.set('answer', 42)
+            self.assertEqual(remote.get('answer'), 42)
+            self.assertEqual(remote.get('answer', version=3), 42)
+            remote.set('question', 'why')
+            cache.set_many({'a': 1, 'b': 2}, version=4)
+            self.assertEqual(cache.get('question'), 'why')
+            self.assertEqual(remote.get_many(['a', 'b'], version=4), {'a': 1, 'b': 2})
+            self.assertEqual(cache.make_key('answer'), remote.make_key('answer'))
+            cache.clear()
+        finally:
+            del settings.CACHES['twotier-remote']
+
+    def test_close_on_request_finished(self):
+        "Every instance checks the generation again after a request"
+        from django.core import signals
+        from django.core.cache.backends.twotier import LocalStore
+        options = {'GENERATION_KEY': 'generation'}
+        cache = get_cache(self.backend_name, LOCATION='locmem://twotier', OPTIONS=options)
+        other = get_cache(self.backend_name, LOCATION='locmem://twotier', OPTIONS=options)
+        other._local = LocalStore()
+
+        cache.set('answer', 42)
+        self.assertEqual(other.get('answer'), 42)
+        cache.set('answer', 43)
+        self.assertEqual(other.get('answer'), 42)
+        signals.request_finished.send(sender=self.__class__)
+        self.assertEqual(other.get('answer'), 43)
+
+class CompressionTests(unittest.TestCase):
+    big_value = 'spam ' * 1000
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+
+    def tearDown(self):
+        get_cache('django.core.cache.backends.locmem.LocMemCache', LOCATION='compressed').clear()
+        shutil.rmtree(self.dirname)
+
+    def get_caches(self, backend, location):
+        return (get_cache(backend, LOCATION=location, OPTIONS={'COMPRESS_MIN_LENGTH': 100}),
+                get_cache(backend, LOCATION=location))
+
+    def check_compression(self, backend, location):
+        compressed, plain = self.get_caches(backend, location)
+        compressed.set('big', self.big_value)
+        compressed.set('small', 'spam')
+        compressed.set_many({'big2': [self.big_value], 'small2': 42})
+        self.assertEqual(compressed.get('big'), self.big_value)
+        self.assertEqual(compressed.get_many(['big', 'small', 'big2', 'small2']),
+                         {'big': self.big_value, 'small': 'spam', 'big2': [self.big_value], 'small2': 42})
+        # Compressed and uncompressed values can be read whatever the options.
+        plain.set('plain', self.big_value)
+        self.assertEqual(compressed.get('plain'), self.big_value)
+        self.assertEqual(plain.get('big'), self.big_value)
+
+    def test_encode_value(self):
+        cache = get_cache('django.core.cache.backends.locmem.LocMemCache', LOCATION='compressed', OPTIONS={'COMPRESS_MIN_LENGTH': 100})
+        encoded = cache.encode_value(self.big_value)
+        self.assertTrue(isinstance(encoded, CompressedValue))
+        self.assertTrue(len(encoded.data) < 100)
+        self.assertEqual(cache.decode_value(encoded), self.big_value)
+        self.assertEqual(cache.encode_value('spam'), 'spam')
+        # Compression is off by default.
+        cache = get_cache('django.core.cache.backends.locmem.LocMemCache', LOCATION='compressed')
+        self.assertEqual(cache.encode_value(self.big_value), self.big_value)
+
+    def test_locmem(self):
+        self.check_compression('django.core.cache.backends.locmem.LocMemCache', 'compressed')
+
+    def test_filebased(self):
+        self.check_compression('django.core.cache.backends.filebased.FileBasedCache', self.dirname)
+
+    def test_db(self):
+        management.call_command('createcachetable', 'compressed_cache', verbosity=0, interactive=False)
+        try:
+            self.check_compression('django.core.cache.backends.db.DatabaseCache', 'compressed_cache')
+        finally:
+            from django.db import connection
+            connection.cursor().execute('DROP TABLE %s' % connection.ops.quote_name('compressed_cache'))
+
 class CustomCacheKeyValidationTests(unittest.TestCase):
     """
     Tests for the ability to mixin a custom ``validate_key`` method to
@@ -1432,5 +1900,211 @@ class CacheMiddlewareTest(unittest.TestCase):
         response = other_with_timeout_view(request, '18')
         self.assertEqual(response.content, 'Hello World 18')
 
+class CountingCache(object):
+    "Wraps a cache, counting the get() and get_many() calls made to it."
+    def __init__(self, cache):
+        self.cache = cache
+        self.gets = self.get_manys = 0
+
+    def get(self, *args, **kwargs):
+        self.gets += 1
+        return self.cache.get(*args, **kwargs)
+
+    def get_many(self, *args, **kwargs):
+        self.get_manys += 1
+        return self.cache.get_many(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.cache, name)
+
+class TemplateFragmentCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.orig_cache = cache_tag.cache
+        self.orig_grace = settings.CACHE_FRAGMENT_GRACE_SECONDS
+        self.cache = CountingCache(get_cache('django.core.cache.backends.locmem.LocMemCache', LOCATION='fragments'))
+        cache_tag.cache = self.cache
+
+    def tearDown(self):
+        self.cache.clear()
+        cache_tag.cache = self.orig_cache
+        settings.CACHE_FRAGMENT_GRACE_SECONDS = self.orig_grace
+
+    def test_fragments_fetched_together(self):
+        t = Template('{% load cache %}'
+                     '{% cache 60 a %}a{{ x }}{% endcache %}'
+                     '{% cache 60 b x %}b{{ x }}{% endcache %}'
+                     '{% for i in items %}{% cache 60 c i %}c{{ x }}{% endcache %}{% endfor %}')
+        self.assertEqual(t.render(Context({'x': 1, 'items': [1, 2]})), 'a1b1c1c1')
+        # One get_many() for the whole template, plus one get() for each
+        # fragment whose key depends on the loop variable.
+        self.assertEqual(self.cache.get_manys, 1)
+        self.assertEqual(self.cache.gets, 2)
+
+        self.assertEqual(t.render(Context({'x': 2, 'items': [1, 2]})), 'a1b2c1c1')
+        self.assertEqual(self.cache.get_manys, 2)
+        self.assertEqual(self.cache.gets, 4)
+
+    def test_stale_fragment_served_while_regenerating(self):
+        settings.CACHE_FRAGMENT_GRACE_SECONDS = 60
+        t = Template('{% load cache %}{% cache 1 stale %}{{ x }}{% endcache %}')
+        self.assertEqual(t.render(Context({'x': 1})), '1')
+        self.assertEqual(t.render(Context({'x': 2})), '1')
+        time.sleep(1.1)
+
+        # Another worker holds the regeneration lock: serve the stale copy.
+        key = cache_tag.CacheNode(None, '1', 'stale', []).cache_key(Context())
+        self.cache.add('%s.lock' % key, True)
+        self.assertEqual(t.render(Context({'x': 3})), '1')
+
+        # Once the lock is released the next request regenerates it.
+        self.cache.delete('%s.lock' % key)
+        self.assertEqual(t.render(Context({'x': 4})), '4')
+        self.assertEqual(t.render(Context({'x': 5})), '4')
+        self.assertEqual(self.cache.get('%s.lock' % key), None)
+
+class CacheRoundTripTests(unittest.TestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.cache = CountingCache(get_cache('django.core.cache.backends.locmem.LocMemCache', LOCATION='roundtrip'))
+        self.update_middleware = UpdateCacheMiddleware()
+        self.update_middleware.cache = self.cache
+        self.fetch_middleware = FetchFromCacheMiddleware()
+        self.fetch_middleware.cache = self.cache
+
+    def tearDown(self):
+        self.cache.clear()
+
+    def _store(self, request, vary=None):
+        request._cache_update_cache = True
+        response = HttpResponse('content')
+        if vary:
+            patch_vary_headers(response, vary)
+        self.update_middleware.process_response(request, response)
+
+    def test_hit_without_vary(self):
+        request = self.factory.get('/roundtrip/')
+        self._store(request)
+        self.assertEqual(self.fetch_middleware.process_request(request).content, 'content')
+        self.assertEqual((self.cache.get_manys, self.cache.gets), (1, 0))
+
+    def test_hit_with_vary(self):
+        request = self.factory.get('/roundtrip/', HTTP_ACCEPT_LANGUAGE='fr')
+        self._store(request, ['Accept-Language'])
+        # The first lookup has to find out which headers the page varies on.
+        self.assertEqual(self.fetch_middleware.process_request(request).content, 'content')
+        self.assertEqual((self.cache.get_manys, self.cache.gets), (1, 1))
+        # Later lookups get it right the first time.
+        self.assertEqual(self.fetch_middleware.process_request(request).content, 'content')
+        self.assertEqual((self.cache.get_manys, self.cache.gets), (2, 1))
+        # A request with other header values misses.
+        request = self.factory.get('/roundtrip/', HTTP_ACCEPT_LANGUAGE='de')
+        self.assertEqual(self.fetch_middleware.process_request(request), None)
+
+    def test_miss(self):
+        request = self.factory.get('/roundtrip/')
+        self.assertEqual(self.fetch_middleware.process_request(request), None)
+        self.assertEqual((self.cache.get_manys, self.cache.gets), (1, 0))
+        self.assertTrue(request._cache_update_cache)
+
+class CacheGraceTests(unittest.TestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.cache = get_cache('django.core.cache.backends.locmem.LocMemCache', LOCATION='grace')
+        self.update_middleware = UpdateCacheMiddleware()
+        self.update_middleware.cache = self.cache
+        self.update_middleware.cache_grace = 30
+        self.fetch_middleware = FetchFromCacheMiddleware()
+        self.fetch_middleware.cache = self.cache
+        self.fetch_middleware.cache_grace = 30
+
+    def tearDown(self):
+        self.cache.clear()
+
+    def _store(self, request, content):
+        request._cache_update_cache = True
+        self.update_middleware.process_response(request, HttpResponse(content))
+
+    def _expire(self, request):
+        "Moves the soft expiry of the page cached for request into the past."
+        cache_key = get_cache_key(request, cache=self.cache)
+        soft_expiry, response = self.cache.get(cache_key)
+        self.cache.set(cache_key, (time.time() - 1, response), 30)
+
+    def test_fresh_page(self):
+        request = self.factory.get('/grace/')
+        self._store(request, 'fresh')
+        self.assertEqual(self.fetch_middleware.process_request(request).content, 'fresh')
+
+    def test_stale_page(self):
+        request = self.factory.get('/grace/')
+        self._store(request, 'old')
+        self._expire(request)
+
+        # The first request to find the page stale takes the lock and
+        # regenerates the page.
+        regenerating = self.factory.get('/grace/')
+        self.assertEqual(self.fetch_middleware.process_request(regenerating), None)
+        self.assertTrue(regenerating._cache_update_cache)
+
+        # Meanwhile, other requests are served the stale page.
+        request = self.factory.get('/grace/')
+        self.assertEqual(self.fetch_middleware.process_request(request).content, 'old')
+
+        # Storing the new page releases the lock.
+        self._store(regenerating, 'new')
+        request = self.factory.get('/grace/')
+        self.assertEqual(self.fetch_middleware.process_request(request).content, 'new')
+        self.assertEqual(self.cache.get(get_cache_lock_key(request)), None)
+
+    def test_lock_released_without_caching(self):
+        request = self.factory.get('/grace/')
+        self._store(request, 'old')
+        self._expire(request)
+
+        regenerating = self.factory.get('/grace/')
+        self.assertEqual(self.fetch_middleware.process_request(regenerating), None)
+        response = HttpResponse('error', status=500)
+        self.update_middleware.process_response(regenerating, response)
+        self.assertEqual(self.cache.get(get_cache_lock_key(regenerating)), None)
+
+    def test_cache_page_grace(self):
+        def view(request):
+            return HttpResponse('view')
+        self.assertEqual(CacheMiddleware(grace=5).cache_grace, 5)
+        self.assertEqual(CacheMiddleware().cache_grace, settings.CACHE_MIDDLEWARE_GRACE_SECONDS)
+        request = self.factory.get('/grace/view/')
+        self.assertEqual(cache_page(view, 3, grace=5)(request).content, 'view')
+
+class RateLimiterTests(unittest.TestCase):
+    def setUp(self):
+        self.cache = get_cache('django.core.cache.backends.locmem.LocMemCache', LOCATION='ratelimit')
+
+    def tearDown(self):
+        self.cache.clear()
+
+    def test_limit(self):
+        limiter = RateLimiter(3, 3600, cache=self.cache)
+        for i in range(3):
+            self.assertTrue(limiter.hit('client'))
+        self.assertFalse(limiter.hit('client'))
+        # Other keys have limits of their own.
+        self.assertTrue(limiter.hit('other-client'))
+        self.assertEqual(limiter.get_usage('client'), 4)
+        limiter.reset('client')
+        self.assertEqual(limiter.get_usage('client'), 0)
+        self.assertTrue(limiter.hit('client'))
+
+    def test_sliding_window(self):
+        limiter = RateLimiter(10, 60, cache=self.cache)
+        now = 6000.0
+        # At the start of a window, the previous one counts fully...
+        self.assertEqual(limiter._estimate(now, 10, 2), 12)
+        # ...and less and less as time goes by.
+        self.assertEqual(limiter._estimate(now + 30, 10, 2), 7)
+        self.assertTrue(limiter._estimate(now + 59, 10, 2) < 3)
+
 if __name__ == '__main__':
     unittest.main()
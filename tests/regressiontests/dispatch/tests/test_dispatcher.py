@@ -117,6 +117,75 @@ class DispatcherTests(unittest.TestCase):
         a_signal.disconnect(receiver_3)
         self._testIsClean(a_signal)
 
+    def testReceiversCache(self):
+        receiver_1 = Callable()
+        a_signal.connect(receiver_1, sender=self)
+        self.assertEqual(a_signal.send(sender=self, val="test"), [(receiver_1, "test")])
+        self.assertEqual(a_signal.send(sender=object(), val="test"), [])
+
+        # Connecting and disconnecting receivers invalidates the cache.
+        a_signal.connect(receiver_1_arg)
+        self.assertEqual(a_signal.send(sender=self, val="test"),
+                         [(receiver_1, "test"), (receiver_1_arg, "test")])
+        a_signal.disconnect(receiver_1, sender=self)
+        self.assertEqual(a_signal.send(sender=self, val="test"), [(receiver_1_arg, "test")])
+        a_signal.disconnect(receiver_1_arg)
+        self.assertEqual(a_signal.send(sender=self, val="test"), [])
+
+        # So does the garbage collection of a receiver.
+        receiver_2 = Callable()
+        a_signal.connect(receiver_2.a, sender=self)
+        self.assertEqual(len(a_signal.send(sender=self, val="test")), 1)
+        del receiver_2
+        garbage_collect()
+        self.assertEqual(a_signal.sender_receivers_cache, {})
+        self.assertEqual(a_signal.send(sender=self, val="test"), [])
+        self._testIsClean(a_signal)
+
+    def testGarbageCollectedWhileLocked(self):
+        "A receiver collected while the lock is held is removed later"
+        receiver_1 = Callable()
+        a_signal.connect(receiver_1.a, sender=self)
+        a_signal.lock.acquire()
+        try:
+            del receiver_1
+            garbage_collect()
+        finally:
+            a_signal.lock.release()
+        self.assertEqual(len(a_signal.receivers), 1)
+        self.assertEqual(a_signal.send(sender=self, val="test"), [])
+        self._testIsClean(a_signal)
+
+    def testGarbageCollectedDuringSend(self):
+        receiver_2 = Callable()
+        def receiver_1(val, **kwargs):
+            del holder[:]
+            garbage_collect()
+            return val
+        holder = [receiver_2]
+        a_signal.connect(receiver_1, sender=self)
+        a_signal.connect(receiver_2.a, sender=self)
+        del receiver_2
+        self.assertEqual(len(a_signal.send(sender=self, val="test")), 2)
+        self.assertEqual(a_signal.send(sender=self, val="test"), [(receiver_1, "test")])
+        a_signal.disconnect(receiver_1, sender=self)
+        self._testIsClean(a_signal)
+
+    def testHasListeners(self):
+        self.assertFalse(a_signal.has_listeners())
+        self.assertFalse(a_signal.has_listeners(sender=self))
+        a_signal.connect(receiver_1_arg, sender=self)
+        self.assertFalse(a_signal.has_listeners())
+        self.assertTrue(a_signal.has_listeners(sender=self))
+        self.assertFalse(a_signal.has_listeners(sender=object()))
+        a_signal.disconnect(receiver_1_arg, sender=self)
+        self.assertFalse(a_signal.has_listeners(sender=self))
+        a_signal.connect(receiver_1_arg)
+        self.assertTrue(a_signal.has_listeners())
+        self.assertTrue(a_signal.has_listeners(sender=self))
+        a_signal.disconnect(receiver_1_arg)
+        self._testIsClean(a_signal)
+
 def getSuite():
     return unittest.makeSuite(DispatcherTests,'test')
 
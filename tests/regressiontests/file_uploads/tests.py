@@ -4,7 +4,9 @@ import os
 import shutil
 from StringIO import StringIO
 
+from django.conf import settings
 from django.core.files import temp as tempfile
+from django.core.files.uploadhandler import FileUploadHandler
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.http.multipartparser import MultiPartParser
 from django.test import TestCase, client
@@ -313,3 +315,51 @@ class MultiParserTests(unittest.TestCase):
             'CONTENT_TYPE':     'multipart/form-data; boundary=_foo',
             'CONTENT_LENGTH':   '1'
         }, StringIO('x'), [], 'utf-8')
+
+    def test_chunking(self):
+        """
+        The data is split into chunks of the handlers' chunk size, whatever
+        the size of the reads, and boundary-like data inside a file is left
+        alone.
+        """
+        class ChunkRecordingHandler(FileUploadHandler):
+            chunk_size = 100
+
+            def new_file(self, *args, **kwargs):
+                super(ChunkRecordingHandler, self).new_file(*args, **kwargs)
+                self.chunks = []
+
+            def receive_data_chunk(self, raw_data, start):
+                self.chunks.append(raw_data)
+
+            def file_complete(self, file_size):
+                return self.chunks
+
+        data = ('--_fo\r\n' + 'x' * 50 + '\r\n--_fo' + 'y' * 37) * 40
+        payload = ('--_foo\r\n'
+                   'Content-Disposition: form-data; name="field"\r\n'
+                   '\r\n'
+                   'value\r\n'
+                   '--_foo\r\n'
+                   'Content-Disposition: form-data; name="file"; filename="a.txt"\r\n'
+                   'Content-Type: text/plain\r\n'
+                   '\r\n'
+                   '%s\r\n'
+                   '--_foo--\r\n' % data)
+        old_read_size = settings.FILE_UPLOAD_READ_SIZE
+        try:
+            for read_size in (1, 64, 1000, 100000):
+                settings.FILE_UPLOAD_READ_SIZE = read_size
+                handler = ChunkRecordingHandler()
+                parser = MultiPartParser({
+                    'CONTENT_TYPE':     'multipart/form-data; boundary=_foo',
+                    'CONTENT_LENGTH':   len(payload),
+                }, StringIO(payload), [handler], 'utf-8')
+                post, files = parser.parse()
+                self.assertEqual(post['field'], u'value')
+                chunks = files['file']
+                self.assertEqual(''.join(chunks), data)
+                # The first chunk holds what was read along with the headers.
+                self.assertTrue(max([len(chunk) for chunk in chunks[1:]]) <= 100)
+        finally:
+            settings.FILE_UPLOAD_READ_SIZE = old_read_size
@@ -1,6 +1,13 @@
+import logging
+import StringIO
+
 from django.utils import unittest
 from django.conf import settings
+from django.core.handlers.base import BaseHandler
 from django.core.handlers.wsgi import WSGIHandler
+from django.http import HttpRequest, HttpResponse
+
+from regressiontests.handlers import views
 
 class HandlerTests(unittest.TestCase):
 
@@ -23,3 +30,127 @@ class HandlerTests(unittest.TestCase):
         # Reset settings
         settings.MIDDLEWARE_CLASSES = old_middleware_classes
 
+
+    def test_file_wrapper(self):
+        """
+        FileResponses are handed to the server's wsgi.file_wrapper.
+        """
+        old_root_urlconf = settings.ROOT_URLCONF
+        settings.ROOT_URLCONF = 'regressiontests.handlers.urls'
+        wrapped = []
+        class FileWrapper(object):
+            def __init__(self, filelike, block_size):
+                wrapped.append(filelike)
+                self.filelike = filelike
+            def __iter__(self):
+                return iter([self.filelike.read()])
+        environ = {
+            'REQUEST_METHOD': 'GET',
+            'PATH_INFO': '/file/',
+            'SERVER_NAME': 'testserver',
+            'SERVER_PORT': '80',
+            'wsgi.input': StringIO.StringIO(),
+            'wsgi.file_wrapper': FileWrapper,
+        }
+        try:
+            handler = WSGIHandler()
+            result = handler(environ, lambda status, headers: None)
+        finally:
+            settings.ROOT_URLCONF = old_root_urlconf
+        self.assertTrue(isinstance(result, FileWrapper))
+        self.assertEqual(''.join(result), open(views.__file__.rstrip('co')).read())
+        wrapped[0].close()
+
+class RequestMiddleware(object):
+    def process_request(self, request):
+        request.seen = True
+
+class ResponseMiddleware(object):
+    def process_response(self, request, response):
+        response['X-Seen'] = 'yes'
+        return response
+
+class ShortcutMiddleware(object):
+    def process_request(self, request):
+        return HttpResponse('shortcut')
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+class MiddlewareChainTests(unittest.TestCase):
+    def setUp(self):
+        self.old_middleware_classes = settings.MIDDLEWARE_CLASSES
+        self.old_middleware_timing = settings.MIDDLEWARE_TIMING
+
+    def tearDown(self):
+        settings.MIDDLEWARE_CLASSES = self.old_middleware_classes
+        settings.MIDDLEWARE_TIMING = self.old_middleware_timing
+
+    def get_handler(self, *middleware):
+        settings.MIDDLEWARE_CLASSES = ['%s.%s' % (__name__, name) for name in middleware]
+        handler = BaseHandler()
+        handler.load_middleware()
+        return handler
+
+    def test_phases(self):
+        handler = self.get_handler('RequestMiddleware', 'ResponseMiddleware')
+        # Phases without middleware are skipped.
+        self.assertEqual(handler._view_phase, None)
+        self.assertEqual(handler._exception_phase, None)
+        self.assertEqual(handler._template_response_phase, None)
+        request = HttpRequest()
+        self.assertEqual(handler._request_phase(request), None)
+        self.assertTrue(request.seen)
+        response = handler._response_phase(request, HttpResponse())
+        self.assertEqual(response['X-Seen'], 'yes')
+
+    def test_first_response(self):
+        handler = self.get_handler('RequestMiddleware', 'ShortcutMiddleware', 'RequestMiddleware')
+        response = handler._request_phase(HttpRequest())
+        self.assertEqual(response.content, 'shortcut')
+
+    def test_modified_middleware(self):
+        "The chain is built again when the middleware lists are modified"
+        handler = self.get_handler('RequestMiddleware')
+        self.assertFalse(handler._chain_stale)
+        handler._request_middleware.append(ShortcutMiddleware().process_request)
+        self.assertTrue(handler._chain_stale)
+        response = handler.get_response(HttpRequest())
+        self.assertEqual(response.content, 'shortcut')
+        self.assertFalse(handler._chain_stale)
+        del handler._request_middleware[1]
+        self.assertTrue(handler._chain_stale)
+
+        handler = BaseHandler()
+        handler._request_middleware = [ShortcutMiddleware().process_request]
+        handler._response_middleware = [ResponseMiddleware().process_response]
+        response = handler.get_response(HttpRequest())
+        self.assertEqual(response.content, 'shortcut')
+        self.assertEqual(response['X-Seen'], 'yes')
+
+    def test_timing(self):
+        settings.MIDDLEWARE_TIMING = True
+        handler = self.get_handler('RequestMiddleware', 'ResponseMiddleware')
+        logger = logging.getLogger('django.request.middleware')
+        recorder = RecordingHandler()
+        old_level = logger.level
+        logger.setLevel(logging.DEBUG)
+        logger.addHandler(recorder)
+        try:
+            request = HttpRequest()
+            handler._request_phase(request)
+            handler._response_phase(request, HttpResponse())
+        finally:
+            logger.removeHandler(recorder)
+            logger.setLevel(old_level)
+        self.assertEqual([record.middleware for record in recorder.records], [
+            '%s.RequestMiddleware.process_request' % __name__,
+            '%s.ResponseMiddleware.process_response' % __name__,
+        ])
+        self.assertTrue(recorder.records[0].request is request)
+        self.assertTrue(recorder.records[0].duration >= 0)
@@ -0,0 +1,5 @@
+from django.conf.urls.defaults import patterns
+
+urlpatterns = patterns('regressiontests.handlers.views',
+    (r'^file/$', 'file_view'),
+)
@@ -0,0 +1,4 @@
+from django.http import FileResponse
+
+def file_view(request):
+    return FileResponse(open(__file__.rstrip('co'), 'rb'))
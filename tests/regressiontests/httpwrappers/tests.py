@@ -1,8 +1,14 @@
 import copy
+import os
 import pickle
+import shutil
+import StringIO
+import tempfile
 
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, TooManyFieldsSent
 from django.http import (QueryDict, HttpResponse, SimpleCookie, BadHeaderError,
-        parse_cookie)
+        parse_cookie, FileResponse)
 from django.utils import unittest
 
 class QueryDictTests(unittest.TestCase):
@@ -208,6 +214,30 @@ class QueryDictTests(unittest.TestCase):
         self.assertEqual(copy.copy(q).encoding , 'rot_13' )
         self.assertEqual(copy.deepcopy(q).encoding , 'rot_13')
 
+    def test_parsing(self):
+        q = QueryDict('a=1&b=&c&a=2;d=x+y%20z&%C3%A9=%C3%A8&&e=f=g&=h')
+        self.assertEqual(q.getlist('a'), [u'1', u'2'])
+        self.assertEqual(q['b'], u'')
+        self.assertEqual(q['c'], u'')
+        self.assertEqual(q['d'], u'x y z')
+        self.assertEqual(q[u'\xe9'], u'\xe8')
+        self.assertEqual(q['e'], u'f=g')
+        self.assertEqual(q[''], u'h')
+        self.assertEqual(len(q), 7)
+        self.assertTrue(isinstance(q.keys()[0], unicode))
+
+    def test_max_num_fields(self):
+        old_max = settings.DATA_UPLOAD_MAX_NUMBER_FIELDS
+        settings.DATA_UPLOAD_MAX_NUMBER_FIELDS = 2
+        try:
+            self.assertEqual(len(QueryDict('a=1&b=2')), 2)
+            self.assertRaises(TooManyFieldsSent, QueryDict, 'a=1&b=2&c=3')
+            self.assertRaises(TooManyFieldsSent, QueryDict, 'a=1;b=2;c=3')
+            settings.DATA_UPLOAD_MAX_NUMBER_FIELDS = None
+            self.assertEqual(len(QueryDict('a=1&b=2&c=3')), 3)
+        finally:
+            settings.DATA_UPLOAD_MAX_NUMBER_FIELDS = old_max
+
 class HttpResponseTests(unittest.TestCase):
     def test_unicode_headers(self):
         r = HttpResponse()
@@ -243,6 +273,95 @@ class HttpResponseTests(unittest.TestCase):
         self.assertRaises(BadHeaderError, r.__setitem__, 'test\rstr', 'test')
         self.assertRaises(BadHeaderError, r.__setitem__, 'test\nstr', 'test')
 
+class FileResponseTests(unittest.TestCase):
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        self.path = os.path.join(self.dirname, 'file.bin')
+        self.data = ''.join([chr(i % 256) for i in range(20000)])
+        f = open(self.path, 'wb')
+        f.write(self.data)
+        f.close()
+        self.old_sendfile = (settings.SENDFILE_HEADER, settings.SENDFILE_ROOT,
+                             settings.SENDFILE_URL)
+
+    def tearDown(self):
+        (settings.SENDFILE_HEADER, settings.SENDFILE_ROOT,
+         settings.SENDFILE_URL) = self.old_sendfile
+        shutil.rmtree(self.dirname)
+
+    def test_file(self):
+        f = open(self.path, 'rb')
+        response = FileResponse(f, mimetype='application/octet-stream')
+        self.assertEqual(response['Content-Length'], '20000')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        chunks = list(response)
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(''.join(chunks), self.data)
+        # The content can be read again.
+        self.assertEqual(response.content, self.data)
+        response.close()
+        self.assertTrue(f.closed)
+
+    def test_range(self):
+        response = FileResponse(open(self.path, 'rb'))
+        response.set_range(100, 10099)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 100-10099/20000')
+        self.assertEqual(response['Content-Length'], '10000')
+        self.assertEqual(response.content, self.data[100:10100])
+        # Only the rest of a file can be handed to wsgi.file_wrapper.
+        self.assertEqual(response.get_file_to_stream(), None)
+        response.set_range(19000, 19999)
+        f = response.get_file_to_stream()
+        self.assertEqual(f.read(), self.data[19000:])
+        response.close()
+
+    def test_file_like_object(self):
+        response = FileResponse(StringIO.StringIO(self.data))
+        self.assertFalse(response.has_header('Content-Length'))
+        self.assertEqual(response.content, self.data)
+        self.assertEqual(response.get_file_to_stream(), None)
+
+    def test_file_to_stream(self):
+        response = FileResponse(open(self.path, 'rb'))
+        self.assertEqual(response.get_file_to_stream().read(), self.data)
+        # Not once middleware has changed the content.
+        response.content = 'changed'
+        self.assertEqual(response.get_file_to_stream(), None)
+        response.file.close()
+
+    def test_sendfile(self):
+        settings.SENDFILE_HEADER = 'X-Sendfile'
+        f = open(self.path, 'rb')
+        response = FileResponse(f)
+        self.assertEqual(response['X-Sendfile'], os.path.abspath(self.path))
+        self.assertEqual(response.content, '')
+        self.assertFalse(response.has_header('Content-Length'))
+        self.assertEqual(response.get_file_to_stream(), None)
+        self.assertTrue(f.closed)
+
+    def test_sendfile_url(self):
+        settings.SENDFILE_HEADER = 'X-Accel-Redirect'
+        settings.SENDFILE_ROOT = self.dirname
+        settings.SENDFILE_URL = '/protected/'
+        response = FileResponse(open(self.path, 'rb'))
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/file.bin')
+
+        # Files outside SENDFILE_ROOT are sent by Django.
+        settings.SENDFILE_ROOT = os.path.join(self.dirname, 'other')
+        response = FileResponse(open(self.path, 'rb'))
+        self.assertFalse(response.has_header('X-Accel-Redirect'))
+        self.assertEqual(response.content, self.data)
+        response.close()
+
+        # A URL can't be made without SENDFILE_ROOT.
+        settings.SENDFILE_ROOT = ''
+        f = open(self.path, 'rb')
+        try:
+            self.assertRaises(ImproperlyConfigured, FileResponse, f)
+        finally:
+            f.close()
+
 class CookieTests(unittest.TestCase):
     def test_encode(self):
         """
@@ -1,8 +1,15 @@
 # -*- coding: utf-8 -*-
 
+import gzip
+import os
+import StringIO
+import tempfile
+import zlib
+
 from django.conf import settings
-from django.http import HttpRequest
+from django.http import FileResponse, HttpRequest, HttpResponse
 from django.middleware.common import CommonMiddleware
+from django.middleware.gzip import GZipMiddleware
 from django.middleware.http import ConditionalGetMiddleware
 from django.test import TestCase
 
@@ -334,3 +341,100 @@ class ConditionalGetMiddlewareTest(TestCase):
         self.resp['Last-Modified'] = 'Sat, 12 Feb 2011 17:41:44 GMT'
         self.resp = ConditionalGetMiddleware().process_response(self.req, self.resp)
         self.assertEqual(self.resp.status_code, 200)
+
+
+class GZipMiddlewareTest(TestCase):
+    compressible_string = 'a' * 500
+
+    def setUp(self):
+        self.req = HttpRequest()
+        self.req.META = {
+            'SERVER_NAME': 'testserver',
+            'SERVER_PORT': 80,
+            'HTTP_ACCEPT_ENCODING': 'gzip, deflate',
+        }
+        self.old_level = settings.GZIP_COMPRESSION_LEVEL
+
+    def tearDown(self):
+        settings.GZIP_COMPRESSION_LEVEL = self.old_level
+
+    def decompress(self, gzipped):
+        return gzip.GzipFile(fileobj=StringIO.StringIO(gzipped)).read()
+
+    def test_compress_response(self):
+        response = HttpResponse(self.compressible_string)
+        response = GZipMiddleware().process_response(self.req, response)
+        self.assertEqual(self.decompress(response.content), self.compressible_string)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Length'], str(len(response.content)))
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+    def test_short_response(self):
+        response = HttpResponse('short')
+        response = GZipMiddleware().process_response(self.req, response)
+        self.assertEqual(response.content, 'short')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_compress_streaming_response(self):
+        consumed = []
+        def content():
+            for chunk in ('short', self.compressible_string, u'\xe9'):
+                consumed.append(chunk)
+                yield chunk
+        response = HttpResponse(content())
+        response['Content-Length'] = '42'
+        response = GZipMiddleware().process_response(self.req, response)
+        # Nothing has been read yet.
+        self.assertEqual(consumed, [])
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertFalse(response.has_header('Content-Length'))
+
+        chunks = iter(response)
+        gzipped = chunks.next() + chunks.next()
+        # The first chunk can be decompressed before the rest is read.
+        self.assertEqual(consumed, ['short'])
+        self.assertEqual(zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(gzipped), 'short')
+        gzipped += ''.join(chunks)
+        self.assertEqual(self.decompress(gzipped),
+                         'short' + self.compressible_string + '\xc3\xa9')
+
+    def test_close_streaming_response(self):
+        class Content(list):
+            closed = False
+            def close(self):
+                self.closed = True
+        content = Content(['a', 'b'])
+        response = GZipMiddleware().process_response(self.req, HttpResponse(content))
+        response.close()
+        self.assertTrue(content.closed)
+
+    def test_file_response(self):
+        "Byte ranges aren't offered for compressed files"
+        response = FileResponse(StringIO.StringIO(self.compressible_string))
+        response['Accept-Ranges'] = 'bytes'
+        response = GZipMiddleware().process_response(self.req, response)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertFalse(response.has_header('Accept-Ranges'))
+        self.assertEqual(self.decompress(''.join(response)), self.compressible_string)
+
+    def test_sendfile_response(self):
+        "Files sent by the web server aren't compressed"
+        old_sendfile_header = settings.SENDFILE_HEADER
+        settings.SENDFILE_HEADER = 'X-Sendfile'
+        try:
+            f = tempfile.NamedTemporaryFile()
+            response = FileResponse(f)
+            response = GZipMiddleware().process_response(self.req, response)
+        finally:
+            settings.SENDFILE_HEADER = old_sendfile_header
+        self.assertEqual(response['X-Sendfile'], os.path.abspath(f.name))
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, '')
+
+    def test_compression_level(self):
+        settings.GZIP_COMPRESSION_LEVEL = 1
+        fast = GZipMiddleware().process_response(self.req, HttpResponse(self.compressible_string * 20))
+        settings.GZIP_COMPRESSION_LEVEL = 9
+        small = GZipMiddleware().process_response(self.req, HttpResponse(self.compressible_string * 20))
+        self.assertTrue(len(small.content) < len(fast.content))
+        self.assertEqual(self.decompress(fast.content), self.decompress(small.content))
\ No newline at end of file
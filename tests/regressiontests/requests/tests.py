@@ -2,6 +2,8 @@ import time
 from datetime import datetime, timedelta
 from StringIO import StringIO
 
+from django.conf import settings
+from django.core.exceptions import TooManyFieldsSent
 from django.core.handlers.modpython import ModPythonRequest
 from django.core.handlers.wsgi import WSGIRequest, LimitedStream
 from django.http import HttpRequest, HttpResponse, parse_cookie
@@ -182,3 +184,32 @@ class RequestsTests(unittest.TestCase):
     def test_read_by_lines(self):
         request = WSGIRequest({'REQUEST_METHOD': 'POST', 'wsgi.input': StringIO('name=value')})
         self.assertEqual(list(request), ['name=value'])
+
+    def test_too_many_fields(self):
+        old_max = settings.DATA_UPLOAD_MAX_NUMBER_FIELDS
+        settings.DATA_UPLOAD_MAX_NUMBER_FIELDS = 2
+        try:
+            request = WSGIRequest({'REQUEST_METHOD': 'GET',
+                                   'QUERY_STRING': 'a=1&a=2&a=3',
+                                   'wsgi.input': StringIO('')})
+            self.assertRaises(TooManyFieldsSent, getattr, request, 'GET')
+
+            payload = 'a=1&a=2&a=3'
+            request = WSGIRequest({'REQUEST_METHOD': 'POST',
+                                   'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+                                   'CONTENT_LENGTH': len(payload),
+                                   'wsgi.input': StringIO(payload)})
+            self.assertRaises(TooManyFieldsSent, getattr, request, 'POST')
+
+            payload = '\r\n'.join(['--boundary\r\n'
+                                    'Content-Disposition: form-data; name="a"\r\n'
+                                    '\r\n'
+                                    'value'] * 3 + ['--boundary--', ''])
+            request = WSGIRequest({'REQUEST_METHOD': 'POST',
+                                   'CONTENT_TYPE': 'multipart/form-data; boundary=boundary',
+                                   'CONTENT_LENGTH': len(payload),
+                                   'wsgi.input': StringIO(payload)})
+            self.assertRaises(TooManyFieldsSent, getattr, request, 'POST')
+            self.assertEqual(request.POST, {})
+        finally:
+            settings.DATA_UPLOAD_MAX_NUMBER_FIELDS = old_max
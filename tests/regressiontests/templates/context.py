@@ -1,5 +1,10 @@
 # coding: utf-8
-from django.template import Context
+from copy import copy
+
+from django.http import HttpRequest
+from django.template import (Context, FlatContext, RequestContext, Template,
+    ContextPopException)
+from django.template.context import LazyValue
 from django.utils.unittest import TestCase
 
 
@@ -14,3 +19,65 @@ class ContextTests(TestCase):
         self.assertEqual(c.pop(), {"a": 2})
         self.assertEqual(c["a"], 1)
         self.assertEqual(c.get("foo", 42), 42)
+
+
+    def test_lazy_values(self):
+        calls = []
+        def processor(request):
+            def compute():
+                calls.append(1)
+                return 'computed'
+            return {'lazy': LazyValue(compute)}
+        t = Template('{{ other }}')
+        t.render(RequestContext(HttpRequest(), {'other': 1}, processors=[processor]))
+        self.assertEqual(calls, [])
+        t = Template('{{ lazy }}{% if lazy %}{{ lazy|upper }}{% endif %}')
+        c = RequestContext(HttpRequest(), processors=[processor])
+        self.assertEqual(t.render(c), 'computedCOMPUTED')
+        self.assertEqual(c.get('lazy'), 'computed')
+        self.assertEqual(calls, [1])
+        c = FlatContext({'lazy': LazyValue(lambda: 42)})
+        self.assertEqual(c['lazy'], 42)
+
+
+class FlatContextTests(TestCase):
+    def test_flat_context(self):
+        c = FlatContext({"a": 1, "b": "xyzzy"})
+        self.assertEqual(c["a"], 1)
+        self.assertEqual(c.push(), {})
+        c["a"] = 2
+        self.assertEqual(c["a"], 2)
+        self.assertEqual(c.get("a"), 2)
+        self.assertEqual(c.pop(), {"a": 2})
+        self.assertEqual(c["a"], 1)
+        self.assertEqual(c.get("foo", 42), 42)
+        self.assertRaises(ContextPopException, c.pop)
+
+    def test_shadowing(self):
+        c = FlatContext({"a": 1})
+        c.update({"a": 2, "b": 3})
+        c.push()
+        c["b"] = 4
+        c["c"] = 5
+        self.assertEqual((c["a"], c["b"], c["c"]), (2, 4, 5))
+        del c["c"]
+        self.assertFalse("c" in c)
+        c.pop()
+        self.assertEqual((c["a"], c["b"]), (2, 3))
+        c.pop()
+        self.assertEqual(c["a"], 1)
+        self.assertFalse("b" in c)
+        self.assertRaises(KeyError, lambda: c["b"])
+
+    def test_copy(self):
+        c = FlatContext({"a": 1})
+        c.push()
+        c["a"] = 2
+        c2 = copy(c)
+        c2.pop()
+        self.assertEqual(c["a"], 2)
+        self.assertEqual(c2["a"], 1)
+
+    def test_render(self):
+        t = Template('{{ a }}{% for a in items %}{% with b=a %}{{ b }}{% endwith %}{% endfor %}{{ a }}{{ b }}')
+        self.assertEqual(t.render(FlatContext({"a": "x", "items": [1, 2]})), "x12x")
@@ -0,0 +1,4 @@
+from django.db import models
+
+class Article(models.Model):
+    title = models.CharField(max_length=100)
@@ -0,0 +1,150 @@
+import logging
+
+from django.conf import settings
+from django.core import timing
+from django.db import connection
+from django.db.backends.util import CursorTimingWrapper
+from django.test import TestCase
+from django.utils import unittest
+
+class RecordingCollector(timing.BaseCollector):
+    timers = []
+
+    def collect(self, request, response, timer):
+        self.timers.append(timer)
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+class RequestTimerTests(unittest.TestCase):
+    def test_call(self):
+        timer = timing.RequestTimer()
+        self.assertEqual(timer.call('db', lambda x, y=0: x + y, 1, y=2), 3)
+        timer.call('db', lambda: None)
+        self.assertEqual(timer.timings['db'][0], 2)
+        self.assertTrue(timer.timings['db'][1] >= 0)
+
+    def test_nested_calls(self):
+        timer = timing.RequestTimer()
+        def inner():
+            timer.call('template', lambda: None)
+            timer.call('db', lambda: None)
+        timer.call('template', inner)
+        # The inner template is part of the outer one.
+        self.assertEqual(timer.timings['template'][0], 1)
+        self.assertEqual(timer.timings['db'][0], 1)
+
+    def test_exception(self):
+        timer = timing.RequestTimer()
+        def fail():
+            raise ValueError
+        self.assertRaises(ValueError, timer.call, 'view', fail)
+        self.assertEqual(timer.timings['view'][0], 1)
+        # The category can be timed again.
+        timer.call('view', lambda: None)
+        self.assertEqual(timer.timings['view'][0], 2)
+
+    def test_format_timings(self):
+        timer = timing.RequestTimer()
+        timer.add('db', 0.002)
+        timer.add('cache', 0.001)
+        timer.add('db', 0.003)
+        timer.duration = 0.01
+        self.assertEqual([(category, count, round(duration, 1))
+                          for category, count, duration in timing.format_timings(timer)],
+                         [('cache', 1, 1.0), ('db', 2, 5.0), ('total', 1, 10.0)])
+
+    def test_sampling(self):
+        try:
+            self.assertEqual(timing.start_request(0), None)
+            self.assertEqual(timing.get_timer(), None)
+            timer = timing.start_request(1)
+            self.assertTrue(timing.get_timer() is timer)
+        finally:
+            timing.start_request(0)
+
+    def test_cursor_without_params(self):
+        calls = []
+        class Cursor(object):
+            def execute(self, *args):
+                calls.append(args)
+        cursor = CursorTimingWrapper(Cursor(), connection)
+        try:
+            timer = timing.start_request(1)
+            # The SQL of a query without parameters reaches the driver as it is.
+            cursor.execute("SELECT '%'")
+            cursor.execute("SELECT %s", [1])
+        finally:
+            timing.start_request(0)
+        self.assertEqual(calls, [("SELECT '%'",), ("SELECT %s", [1])])
+        self.assertEqual(timer.timings['db'][0], 2)
+
+class RequestTimingTests(TestCase):
+    urls = 'regressiontests.timing.urls'
+
+    def setUp(self):
+        self.old_collectors = settings.REQUEST_TIMING_COLLECTORS
+        self.old_sample_rate = settings.REQUEST_TIMING_SAMPLE_RATE
+        settings.REQUEST_TIMING_COLLECTORS = (
+            'django.core.timing.ServerTimingCollector',
+            'django.core.timing.LoggingCollector',
+            '%s.RecordingCollector' % __name__,
+        )
+        RecordingCollector.timers = []
+
+    def tearDown(self):
+        settings.REQUEST_TIMING_COLLECTORS = self.old_collectors
+        settings.REQUEST_TIMING_SAMPLE_RATE = self.old_sample_rate
+
+    def test_timings(self):
+        logger = logging.getLogger('django.request.timing')
+        recorder = RecordingHandler()
+        old_level = logger.level
+        logger.setLevel(logging.INFO)
+        logger.addHandler(recorder)
+        try:
+            response = self.client.get('/timed/')
+        finally:
+            logger.removeHandler(recorder)
+            logger.setLevel(old_level)
+        self.assertEqual(response.content, 'Timed')
+        self.assertEqual(timing.get_timer(), None)
+
+        timer = RecordingCollector.timers[0]
+        for category in ('cache', 'db', 'resolve', 'template', 'view'):
+            self.assertTrue(category in timer.timings)
+        self.assertEqual(timer.timings['cache'][0], 2)
+        self.assertTrue(timer.duration >= timer.timings['view'][1])
+
+        header = response['Server-Timing']
+        for category in ('cache', 'db', 'resolve', 'template', 'view', 'total'):
+            self.assertTrue('%s;dur=' % category in header)
+        self.assertTrue('cache;dur=' in header and 'desc="2 calls"' in header)
+
+        self.assertEqual(len(recorder.records), 1)
+        record = recorder.records[0]
+        self.assertTrue(record.getMessage().startswith('GET /timed/ ('))
+        self.assertEqual(record.status_code, 200)
+        self.assertEqual(record.timings, timer.timings)
+
+    def test_exception(self):
+        "The timer is cleared when an exception escapes the handler"
+        old_propagate = settings.DEBUG_PROPAGATE_EXCEPTIONS
+        settings.DEBUG_PROPAGATE_EXCEPTIONS = True
+        try:
+            self.assertRaises(ValueError, self.client.get, '/error/')
+        finally:
+            settings.DEBUG_PROPAGATE_EXCEPTIONS = old_propagate
+        self.assertEqual(timing.get_timer(), None)
+
+    def test_sample_rate(self):
+        settings.REQUEST_TIMING_SAMPLE_RATE = 0
+        response = self.client.get('/timed/')
+        self.assertEqual(response.content, 'Timed')
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(RecordingCollector.timers, [])
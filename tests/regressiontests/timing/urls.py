@@ -0,0 +1,6 @@
+from django.conf.urls.defaults import patterns
+
+urlpatterns = patterns('regressiontests.timing.views',
+    (r'^timed/$', 'timed_view'),
+    (r'^error/$', 'error_view'),
+)
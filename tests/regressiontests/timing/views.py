@@ -0,0 +1,15 @@
+from django.core.cache import get_cache
+from django.http import HttpResponse
+from django.template import Context, Template
+
+from models import Article
+
+def timed_view(request):
+    list(Article.objects.all())
+    cache = get_cache('locmem://')
+    cache.set('key', 'value')
+    cache.get('key')
+    return HttpResponse(Template('{{ title }}').render(Context({'title': 'Timed'})))
+
+def error_view(request):
+    raise ValueError('Failed')
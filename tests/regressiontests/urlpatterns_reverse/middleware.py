@@ -1,6 +1,8 @@
+from django.conf.urls.defaults import patterns
 from django.core.urlresolvers import set_urlconf
 
 import urlconf_inner
+import views
 
 class ChangeURLconfMiddleware(object):
     def process_request(self, request):
@@ -9,3 +11,7 @@ class ChangeURLconfMiddleware(object):
 class NullChangeURLconfMiddleware(object):
     def process_request(self, request):
         request.urlconf = None
+
+class ListChangeURLconfMiddleware(object):
+    def process_request(self, request):
+        request.urlconf = patterns('', (r'^list_test/$', views.empty_view))
@@ -5,10 +5,12 @@ from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
 from django.core.urlresolvers import reverse, resolve, NoReverseMatch,\
                                      Resolver404, ResolverMatch,\
-                                     RegexURLResolver, RegexURLPattern
+                                     RegexURLResolver, RegexURLPattern,\
+                                     get_literal_prefix, get_resolver
 from django.http import HttpResponseRedirect, HttpResponsePermanentRedirect
 from django.shortcuts import redirect
 from django.test import TestCase
+from django.test.client import Client
 from django.utils import unittest
 
 import urlconf_outer
@@ -167,6 +169,21 @@ class URLPatternReverse(TestCase):
         # Reversing None should raise an error, not return the last un-named view.
         self.assertRaises(NoReverseMatch, reverse, None)
 
+    def test_reverse_cache(self):
+        """
+        Repeated reverse() calls reuse the pattern templates matching the
+        shape of the arguments, but still validate each set of values.
+        """
+        resolver = get_resolver(None)
+        resolver._reverse_cache.clear()
+        for i in range(2):
+            self.assertEqual(reverse('people4', kwargs={'state': 'il', 'name': '1'}), '/people/il/1/')
+            self.assertRaises(NoReverseMatch, reverse, 'people4', kwargs={'state': 'il', 'name': 'adrian'})
+            self.assertRaises(NoReverseMatch, reverse, 'people4', args=['il'])
+        self.assertEqual(len(resolver._reverse_cache), 2)
+        self.assertEqual(len(resolver._reverse_cache['people4', frozenset(['state', 'name'])]), 1)
+        self.assertEqual(resolver._reverse_cache['people4', 1], [])
+
 class ResolverTests(unittest.TestCase):
     def test_non_regex(self):
         """
@@ -218,6 +235,90 @@ class ResolverTests(unittest.TestCase):
                         else:
                             self.assertEqual(t.name, e['name'], 'Wrong URL name.  Expected "%s", got "%s".' % (e['name'], t.name))
 
+    def test_literal_prefix(self):
+        import re
+        for regex, prefix in (
+                (r'^articles/(\d+)/$', 'articles/'),
+                (r'^articles/$', 'articles/'),
+                (r'articles/$', ''),
+                (r'^$', ''),
+                (r'^a\.b\-c/', 'a.b-c/'),
+                (r'^ab?c/', 'a'),
+                (r'^ab*c/', 'a'),
+                (r'^ab{2}c/', 'a'),
+                (r'^ab+c/', 'ab'),
+                (r'^ab\d/', 'ab'),
+                (r'^ab[cd]/', 'ab'),
+                (r'^ab/(?P<x>c|d)/$', 'ab/'),
+                (r'^ab/$|^cd/$', ''),
+                (r'^(?i)ab/$', ''),
+                (u'^caf\xe9/$', '')):
+            self.assertEqual(get_literal_prefix(re.compile(regex, re.UNICODE)), prefix)
+        self.assertEqual(get_literal_prefix(re.compile('^ab/', re.I)), '')
+
+    def test_resolve_index(self):
+        """
+        Patterns whose literal prefix doesn't match are skipped, but URLconf
+        order is preserved across prefixes.
+        """
+        def view(request, *args, **kwargs):
+            pass
+        resolver = RegexURLResolver(r'^/', [
+            RegexURLPattern(r'^ab?/$', view, name='optional'),
+            RegexURLPattern(r'^x/$|^a/$', view, name='alternation'),
+            RegexURLPattern(r'^a/$', view, name='shadowed'),
+            RegexURLPattern(r'^(?i)B/$', view, name='insensitive'),
+            RegexURLPattern(r'^b/$', view, name='sensitive'),
+            RegexURLPattern(r'c/$', view, name='unanchored'),
+            RegexURLPattern(r'^abc/(?P<x>\d+)/$', view, name='kwargs'),
+        ])
+        self.assertEqual(resolver.resolve('/a/').url_name, 'optional')
+        self.assertEqual(resolver.resolve('/ab/').url_name, 'optional')
+        self.assertEqual(resolver.resolve('/x/').url_name, 'alternation')
+        self.assertEqual(resolver.resolve('/b/').url_name, 'insensitive')
+        self.assertEqual(resolver.resolve('/zc/').url_name, 'unanchored')
+        self.assertEqual(resolver.resolve(u'/abc/1/').kwargs, {'x': u'1'})
+        try:
+            resolver.resolve('/abd/')
+            self.fail('resolve did not raise a 404')
+        except Resolver404, e:
+            self.assertEqual(len(e.args[0]['tried']), 7)
+
+    def test_resolve_index_modified_patterns(self):
+        "Patterns added to a URLconf after it was first used are resolved"
+        def view(request, *args, **kwargs):
+            pass
+        patterns = [RegexURLPattern(r'^a/$', view, name='a')]
+        resolver = RegexURLResolver(r'^/', patterns)
+        self.assertEqual(resolver.resolve('/a/').url_name, 'a')
+        patterns.append(RegexURLPattern(r'^b/$', view, name='b'))
+        self.assertEqual(resolver.resolve('/b/').url_name, 'b')
+
+    def test_404_tried_walk(self):
+        """
+        The patterns tried are only walked once, when they're looked up, and
+        through each pattern's own resolve().
+        """
+        calls = []
+        class CountingResolver(RegexURLResolver):
+            def resolve(self, path):
+                calls.append(self.regex.pattern)
+                return super(CountingResolver, self).resolve(path)
+        def view(request, *args, **kwargs):
+            pass
+        inner = CountingResolver(r'^inner/', [RegexURLPattern(r'^x/$', view)])
+        middle = CountingResolver(r'^middle/', [inner, RegexURLPattern(r'^y/$', view)])
+        resolver = RegexURLResolver(r'^/', [middle])
+        try:
+            resolver.resolve('/middle/inner/z/')
+            self.fail('resolve did not raise a 404')
+        except Resolver404, e:
+            self.assertEqual(calls, ['^middle/', '^inner/'])
+            self.assertEqual(len(e.args[0]['tried']), 2)
+            self.assertEqual(e.args[0]['tried'][0], [middle, inner, inner.url_patterns[0]])
+            # Each resolver's patterns are tried once more for the list.
+            self.assertEqual(calls, ['^middle/', '^inner/', '^middle/', '^inner/', '^inner/'])
+
 class ReverseShortcutTests(TestCase):
     urls = 'regressiontests.urlpatterns_reverse.urls'
 
@@ -373,12 +474,47 @@ class RequestURLconfTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.content, 'outer:,inner:/second_test/')
 
+    def test_resolvers_reused(self):
+        """
+        The handler resolves with the resolvers get_resolver() keeps for the
+        root URLconf and for the URLconfs set by middleware.
+        """
+        resolved = []
+        resolvers = [get_resolver(urlconf_outer.__name__), get_resolver(urlconf_inner.__name__)]
+        for resolver in resolvers:
+            def resolve(path, resolver=resolver):
+                resolved.append(resolver)
+                return RegexURLResolver.resolve(resolver, path)
+            resolver.resolve = resolve
+        try:
+            self.client.get('/test/me/')
+            self.assertEqual(resolved[0], resolvers[0])
+            settings.MIDDLEWARE_CLASSES += (
+                '%s.ChangeURLconfMiddleware' % middleware.__name__,
+            )
+            del resolved[:]
+            # A new client, so that the middleware is loaded again.
+            Client().get('/second_test/')
+            self.assertEqual(resolved[0], resolvers[1])
+        finally:
+            for resolver in resolvers:
+                del resolver.resolve
+
     def test_urlconf_overridden_with_null(self):
         settings.MIDDLEWARE_CLASSES += (
             '%s.NullChangeURLconfMiddleware' % middleware.__name__,
         )
         self.assertRaises(ImproperlyConfigured, self.client.get, '/test/me/')
 
+    def test_urlconf_overridden_with_list(self):
+        settings.MIDDLEWARE_CLASSES += (
+            '%s.ListChangeURLconfMiddleware' % middleware.__name__,
+        )
+        response = self.client.get('/list_test/')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('/test/me/')
+        self.assertEqual(response.status_code, 404)
+
 class ErrorHandlerResolutionTests(TestCase):
     """Tests for handler404 and handler500"""
 
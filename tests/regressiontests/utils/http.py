@@ -21,3 +21,21 @@ class TestUtilsHttp(unittest.TestCase):
         self.assertFalse(http.same_origin('http://foo.com', 'http://foo.com.evil.com'))
         # Different port
         self.assertFalse(http.same_origin('http://foo.com:8000', 'http://foo.com:8001'))
+
+    def test_parse_range_header(self):
+        parse = http.parse_range_header
+        self.assertEqual(parse('bytes=0-99', 1000), (0, 99))
+        self.assertEqual(parse('bytes=100-', 1000), (100, 999))
+        self.assertEqual(parse('bytes=900-2000', 1000), (900, 999))
+        self.assertEqual(parse('bytes=-100', 1000), (900, 999))
+        self.assertEqual(parse('bytes=-2000', 1000), (0, 999))
+        self.assertEqual(parse('BYTES = 0 - 0', 1000), (0, 0))
+        # Malformed or multiple ranges are ignored.
+        self.assertEqual(parse('bytes=99-0', 1000), None)
+        self.assertEqual(parse('bytes=-', 1000), None)
+        self.assertEqual(parse('bytes=a-b', 1000), None)
+        self.assertEqual(parse('items=0-10', 1000), None)
+        self.assertEqual(parse('bytes=0-10,20-30', 1000), None)
+        # Unsatisfiable ranges.
+        self.assertRaises(ValueError, parse, 'bytes=1000-', 1000)
+        self.assertRaises(ValueError, parse, 'bytes=-0', 1000)
@@ -4,7 +4,10 @@ from os import path
 from django.conf import settings
 from django.conf.urls.static import static
 from django.test import TestCase
+from django.test.client import RequestFactory
 from django.http import HttpResponseNotModified
+from django.views.decorators.cache import cache_page
+from django.views.static import serve
 
 from regressiontests.views import urls
 from regressiontests.views.urls import media_dir
@@ -30,6 +33,18 @@ class StaticTests(TestCase):
             self.assertEqual(len(response.content), int(response['Content-Length']))
             self.assertEqual(mimetypes.guess_type(file_path)[1], response.get('Content-Encoding', None))
 
+    def test_cache_page(self):
+        "Served files can be cached by the cache middleware"
+        view = cache_page(serve, 60, key_prefix='static-tests')
+        request = RequestFactory().get('/file.txt')
+        data = open(path.join(media_dir, 'file.txt')).read()
+        response = view(request, 'file.txt', document_root=media_dir)
+        self.assertEqual(response.content, data)
+        response.close()
+        response = view(request, 'file.txt', document_root=media_dir)
+        self.assertEqual(response.content, data)
+        self.assertEqual(response['Content-Length'], str(len(data)))
+
     def test_unknown_mime_type(self):
         response = self.client.get('/views/%s/file.unknown' % self.prefix)
         self.assertEqual('application/octet-stream', response['Content-Type'])
@@ -72,6 +87,26 @@ class StaticTests(TestCase):
         self.assertEqual(len(response.content),
                           int(response['Content-Length']))
 
+    def test_range(self):
+        file_name = 'file.txt'
+        data = open(path.join(media_dir, file_name)).read()
+        url = '/views/%s/%s' % (self.prefix, file_name)
+        response = self.client.get(url, HTTP_RANGE='bytes=1-3')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, data[1:4])
+        self.assertEqual(response['Content-Range'], 'bytes 1-3/%d' % len(data))
+        self.assertEqual(response['Content-Length'], '3')
+
+        response = self.client.get(url, HTTP_RANGE='bytes=%d-' % len(data))
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */%d' % len(data))
+
+        # The range is ignored if the file has changed.
+        response = self.client.get(url, HTTP_RANGE='bytes=1-3',
+                                   HTTP_IF_RANGE='Thu, 01 Jan 1970 00:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, data)
+
     def test_invalid_if_modified_since2(self):
         """Handle even more bogus If-Modified-Since values gracefully
 